@@ -0,0 +1,278 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.config.settings import settings
+from app.domain.waste_service import WasteService
+from app.dto.waste_dto import DashboardMensajeDto, EstadisticaTipoDto, ListarResiduosResponseDto
+from app.infrastructure import metrics
+from app.infrastructure.cambios import Cambio, suscribir
+from app.infrastructure.residuos_repository import ResiduosRepository
+from database import sesion_interna
+
+logger = logging.getLogger(__name__)
+
+Rango = tuple[str, date, date]  # (schema, fecha_inicio, fecha_fin)
+
+
+class DashboardSaturadoError(RuntimeError):
+    """No se admiten más suscriptores en este worker."""
+
+
+@dataclass(eq=False)
+class Suscripcion:
+    rango: Rango
+    cola: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(settings.DASHBOARD_COLA_MAX))
+    desbordada: bool = False
+
+    def enviar(self, texto: str) -> None:
+        try:
+            self.cola.put_nowait(texto)
+        except asyncio.QueueFull:
+            # Cliente lento: se desconecta y al volver recibe un snapshot
+            self.desbordada = True
+
+
+@dataclass
+class _EstadoRango:
+    total_global_kg: float
+    tipos: dict[int, EstadisticaTipoDto]
+
+
+class DashboardEnVivo:
+    """
+    Difusión de cambios a los dashboards conectados por WebSocket.
+
+    Un único hub por worker se alimenta de los eventos de cambio
+    (LISTEN/NOTIFY, ver `app.infrastructure.cambios`). Los eventos de un
+    schema se agrupan durante DASHBOARD_AGRUPAR_MS y se resuelven con
+    dos consultas para todos los rangos suscritos que tocan, sea cual
+    sea el número de clientes; cada mensaje se serializa una vez por
+    rango y se reparte a las colas de sus suscriptores.
+
+    Los totales por tipo se envían en valor absoluto, así que perder un
+    delta (cliente desbordado, reconexión) nunca descuadra al cliente.
+    Los registros nuevos se detectan por id creciente: una fila cuyo
+    commit llega después que el de otra con id mayor se refleja en los
+    totales pero puede no listarse como registro nuevo.
+    """
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._suscripciones: dict[Rango, set[Suscripcion]] = defaultdict(set)
+        self._estado: dict[Rango, _EstadoRango] = {}
+        self._marcas: dict[str, int] = {}
+        self._pendientes: dict[str, list[Cambio]] = defaultdict(list)
+        self._en_curso: set[str] = set()
+        self._suscrito = False
+
+    def iniciar(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        if not self._suscrito:
+            suscribir(self._al_cambiar)
+            self._suscrito = True
+
+    def estado(self) -> dict:
+        return {
+            "suscriptores": sum(len(s) for s in self._suscripciones.values()),
+            "rangos": len(self._suscripciones),
+        }
+
+    # ------------------------------------------------------------
+    # Suscripciones (hilo del event loop)
+    # ------------------------------------------------------------
+    async def suscribir(self, schema: str, fecha_inicio: date, fecha_fin: date) -> Suscripcion:
+        if self.estado()["suscriptores"] >= settings.DASHBOARD_MAX_SUSCRIPTORES:
+            raise DashboardSaturadoError("Demasiados dashboards conectados")
+
+        rango = (schema, fecha_inicio, fecha_fin)
+        if rango not in self._estado:
+            estado, marca = await asyncio.to_thread(self._consultar_inicial, rango)
+            # Otro suscriptor pudo inicializar el rango mientras tanto
+            self._estado.setdefault(rango, estado)
+            self._marcas.setdefault(schema, marca)
+
+        suscripcion = Suscripcion(rango)
+        self._suscripciones[rango].add(suscripcion)
+        suscripcion.enviar(self._mensaje("snapshot", rango, list(self._estado[rango].tipos.values())))
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion) -> None:
+        rango = suscripcion.rango
+        self._suscripciones[rango].discard(suscripcion)
+        if not self._suscripciones[rango]:
+            del self._suscripciones[rango]
+            self._estado.pop(rango, None)
+            if not any(r[0] == rango[0] for r in self._suscripciones):
+                self._marcas.pop(rango[0], None)
+
+    async def atender(self, websocket: WebSocket, suscripcion: Suscripcion) -> None:
+        """
+        Envía los mensajes de la suscripción hasta que el cliente se
+        desconecta o se desborda su cola.
+        """
+
+        async def emitir():
+            while True:
+                texto = await suscripcion.cola.get()
+                if suscripcion.desbordada:
+                    metrics.incrementar("dashboard.desbordes")
+                    await websocket.close(code=1013, reason="Cliente demasiado lento")
+                    return
+                await websocket.send_text(texto)
+
+        async def escuchar():
+            # El cliente no envía nada; solo interesa detectar el cierre
+            while True:
+                await websocket.receive_text()
+
+        tareas = [asyncio.create_task(emitir()), asyncio.create_task(escuchar())]
+        try:
+            hechas, _ = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in hechas:
+                if not isinstance(tarea.exception(), (WebSocketDisconnect, type(None))):
+                    raise tarea.exception()
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+
+    # ------------------------------------------------------------
+    # Eventos de cambio
+    # ------------------------------------------------------------
+    def _al_cambiar(self, cambio: Cambio) -> None:
+        # Se llama desde el hilo de escucha
+        if self._loop is None or cambio.entidad not in (None, "residuos"):
+            return
+        self._loop.call_soon_threadsafe(self._encolar, cambio)
+
+    def _encolar(self, cambio: Cambio) -> None:
+        schemas = {r[0] for r in self._suscripciones}
+        if cambio.schema is not None:
+            schemas &= {cambio.schema}
+
+        for schema in schemas:
+            self._pendientes[schema].append(cambio)
+            if schema not in self._en_curso:
+                self._en_curso.add(schema)
+                self._loop.create_task(self._refrescar(schema))
+
+    async def _refrescar(self, schema: str) -> None:
+        # Una sola tarea por schema: los eventos que llegan mientras
+        # consulta se acumulan para la siguiente vuelta
+        try:
+            while self._pendientes.get(schema):
+                await asyncio.sleep(settings.DASHBOARD_AGRUPAR_MS / 1000)
+                cambios = self._pendientes.pop(schema)
+                rangos = [
+                    r for r in self._suscripciones
+                    if r[0] == schema and any(c.afecta(*r) for c in cambios)
+                ]
+                if rangos:
+                    await self._difundir(schema, rangos)
+        except Exception as e:
+            logger.error(f"Error refrescando dashboards de {schema}: {e}")
+        finally:
+            self._en_curso.discard(schema)
+
+    async def _difundir(self, schema: str, rangos: list[Rango]) -> None:
+        marca = self._marcas.get(schema, 0)
+        nueva_marca, nuevos, filas = await asyncio.to_thread(self._consultar_cambios, schema, rangos, marca)
+        self._marcas[schema] = nueva_marca
+        metrics.incrementar("dashboard.refrescos")
+
+        limite = settings.DASHBOARD_MAX_REGISTROS_DELTA
+        for i, rango in enumerate(rangos):
+            if rango not in self._suscripciones:
+                continue
+            estado = self._construir_estado(rango, [f for f in filas if f["idx"] == i])
+            anterior = self._estado.get(rango)
+            self._estado[rango] = estado
+
+            cambiados = [
+                t for tipo_id, t in estado.tipos.items()
+                if anterior is None or self._distinto(anterior.tipos.get(tipo_id), t)
+            ]
+            if anterior is not None:
+                # Tipos que ya no tienen registros en el rango
+                cambiados += [
+                    t.model_copy(update={
+                        "cantidad_registros": 0, "total_kg": 0.0, "promedio_kg": 0.0,
+                        "minimo_kg": 0.0, "maximo_kg": 0.0, "porcentaje": 0.0,
+                    })
+                    for tipo_id, t in anterior.tipos.items() if tipo_id not in estado.tipos
+                ]
+            registros = [r for r in nuevos if rango[1] <= r["dia"] <= rango[2]]
+            if not cambiados and not registros:
+                continue
+
+            texto = self._mensaje(
+                "delta", rango, cambiados,
+                registros=[ListarResiduosResponseDto(**r) for r in registros[:limite]],
+                truncados=len(registros) > limite or len(nuevos) > limite,
+            )
+            for suscripcion in list(self._suscripciones[rango]):
+                suscripcion.enviar(texto)
+                metrics.incrementar("dashboard.mensajes")
+
+    @staticmethod
+    def _distinto(anterior: EstadisticaTipoDto | None, actual: EstadisticaTipoDto) -> bool:
+        return (
+            anterior is None
+            or anterior.cantidad_registros != actual.cantidad_registros
+            or anterior.total_kg != actual.total_kg
+        )
+
+    # ------------------------------------------------------------
+    # Consultas (en hilos del pool)
+    # ------------------------------------------------------------
+    def _consultar_inicial(self, rango: Rango) -> tuple[_EstadoRango, int]:
+        schema, fecha_inicio, fecha_fin = rango
+        with sesion_interna(schema) as sesion:
+            repo = ResiduosRepository(sesion)
+            marca = repo.ultimo_id()
+            filas = repo.estadisticas_multi_rango([(fecha_inicio, fecha_fin)])
+        return self._construir_estado(rango, filas), marca
+
+    @staticmethod
+    def _consultar_cambios(schema: str, rangos: list[Rango], marca: int):
+        with sesion_interna(schema) as sesion:
+            repo = ResiduosRepository(sesion)
+            nueva_marca = repo.ultimo_id()
+            nuevos = []
+            if nueva_marca > marca:
+                nuevos = repo.listar_nuevos(
+                    marca, nueva_marca,
+                    min(r[1] for r in rangos), max(r[2] for r in rangos),
+                    settings.DASHBOARD_MAX_REGISTROS_DELTA + 1,
+                )
+            filas = repo.estadisticas_multi_rango([(r[1], r[2]) for r in rangos])
+        return nueva_marca, nuevos, filas
+
+    @staticmethod
+    def _construir_estado(rango: Rango, filas: list[dict]) -> _EstadoRango:
+        estadisticas = WasteService._construir_estadisticas(rango[1], rango[2], filas)
+        return _EstadoRango(
+            total_global_kg=estadisticas.total_global_kg,
+            tipos={t.tipo_id: t for t in estadisticas.tipos},
+        )
+
+    def _mensaje(
+        self, tipo: str, rango: Rango, tipos: list[EstadisticaTipoDto],
+        registros: list[ListarResiduosResponseDto] | None = None, truncados: bool = False,
+    ) -> str:
+        return DashboardMensajeDto(
+            tipo=tipo,
+            fecha_inicio=rango[1],
+            fecha_fin=rango[2],
+            total_global_kg=self._estado[rango].total_global_kg,
+            tipos=tipos,
+            registros=registros or [],
+            registros_truncados=truncados,
+        ).model_dump_json()
+
+
+dashboard_en_vivo = DashboardEnVivo()
@@ -0,0 +1,24 @@
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+def _default(obj: Any):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Respuesta JSON para salidas de confianza (filas leídas de la BD).
+
+    Devolver esta respuesta desde un endpoint evita la revalidación del
+    `response_model` y serializa directamente con orjson. Las columnas
+    DECIMAL se emiten como float, igual que en los DTOs.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,116 @@
+import argparse
+import logging
+from datetime import date, timedelta
+
+from app.config.settings import settings
+from app.domain.waste_service import WasteService
+from app.infrastructure.analisis_repository import AnalisisIARepository
+from app.infrastructure.anomalias_repository import AnomaliasRepository
+from app.infrastructure.planificador import Planificador
+from app.infrastructure.residuos_repository import ResiduosRepository
+from app.infrastructure.tipos_residuos_repository import TiposResiduosRepository
+from database import schemas_conocidos, sesion_interna
+
+logger = logging.getLogger(__name__)
+
+
+# Rangos que los dashboards piden cada mañana, relativos al día de ejecución
+RANGOS_ESTANDAR = {
+    "ayer": lambda hoy: (hoy - timedelta(days=1), hoy - timedelta(days=1)),
+    "semana_actual": lambda hoy: (hoy - timedelta(days=hoy.weekday()), hoy),
+    "semana_anterior": lambda hoy: (
+        hoy - timedelta(days=hoy.weekday() + 7),
+        hoy - timedelta(days=hoy.weekday() + 1),
+    ),
+    "ultimos_7_dias": lambda hoy: (hoy - timedelta(days=7), hoy - timedelta(days=1)),
+    "mes_actual": lambda hoy: (hoy.replace(day=1), hoy),
+}
+
+
+def rangos_estandar(nombres: list[str], hoy: date) -> list[tuple[date, date]]:
+    return list(dict.fromkeys(RANGOS_ESTANDAR[n](hoy) for n in nombres))
+
+
+def _servicio(sesion) -> WasteService:
+    return WasteService(
+        TiposResiduosRepository(sesion),
+        ResiduosRepository(sesion),
+        AnalisisIARepository(sesion),
+        AnomaliasRepository(sesion),
+    )
+
+
+def calentar_estadisticas() -> None:
+    """
+    Precalcula las estadísticas de los rangos estándar de cada sede
+    antes de la hora punta.
+    """
+    rangos = rangos_estandar(settings.PLANIFICADOR_RANGOS_ESTADISTICAS, date.today())
+    for schema in schemas_conocidos():
+        with sesion_interna(schema) as sesion:
+            service = _servicio(sesion)
+            nuevas = sum(service.precalcular_estadisticas(fi, ff) for fi, ff in rangos)
+        logger.info(f"Estadísticas precalculadas en {schema}: {nuevas} nuevas de {len(rangos)} rangos")
+
+
+def generar_informes_nocturnos() -> None:
+    """
+    Genera de madrugada los análisis estadísticos de los rangos de
+    PLANIFICADOR_RANGOS_INFORMES. Quedan vinculados a sus estadísticas
+    precalculadas, de modo que por la mañana se sirven sin llamar al
+    modelo mientras los datos del rango no cambien.
+    """
+    rangos = rangos_estandar(settings.PLANIFICADOR_RANGOS_INFORMES, date.today())
+    for schema in schemas_conocidos():
+        with sesion_interna(schema) as sesion:
+            service = _servicio(sesion)
+            for fecha_inicio, fecha_fin in rangos:
+                try:
+                    service.precalcular_estadisticas(fecha_inicio, fecha_fin)
+                    service.generar_analisis_estadistico(fecha_inicio, fecha_fin)
+                    logger.info(f"Informe nocturno {schema} {fecha_inicio} - {fecha_fin} listo")
+                except ValueError as e:
+                    # Rango sin registros
+                    logger.info(f"Informe nocturno {schema} {fecha_inicio} - {fecha_fin} omitido: {e}")
+                except Exception as e:
+                    logger.error(f"Error en informe nocturno {schema} {fecha_inicio} - {fecha_fin}: {e}")
+                    # La transacción pudo quedar abortada: el siguiente rango empieza limpio
+                    sesion.primaria.rollback()
+
+
+def reconstruir_lineas_base() -> None:
+    """
+    Tarea única (no programada): backfill de la línea base de anomalías
+    de cada sede tras desplegar la detección incremental sobre datos ya
+    existentes. Se puede repetir; rehace la línea base desde el histórico.
+    """
+    for schema in schemas_conocidos():
+        with sesion_interna(schema) as sesion:
+            tipos = _servicio(sesion).reconstruir_lineas_base()
+        logger.info(f"Línea base de anomalías en {schema}: {tipos} tipos")
+
+
+def configurar_planificador(planificador: Planificador) -> None:
+    planificador.programar("informes_nocturnos", settings.PLANIFICADOR_HORA_INFORMES, generar_informes_nocturnos)
+    planificador.programar("calentar_estadisticas", settings.PLANIFICADOR_HORA_CALENTAR, calentar_estadisticas)
+
+
+# Ejecución manual: python -m app.application.tareas_programadas <tarea>
+TAREAS = {
+    "informes_nocturnos": generar_informes_nocturnos,
+    "calentar_estadisticas": calentar_estadisticas,
+    "reconstruir_lineas_base": reconstruir_lineas_base,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tarea", choices=sorted(TAREAS))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    TAREAS[args.tarea]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,76 @@
 from datetime import date
 import logging
-from typing import List
+from typing import List, Optional
 from fastapi import UploadFile, File
+from fastapi.responses import StreamingResponse
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
+    WebSocket,
     status,
 )
 
 
 
 from app.infrastructure.tipos_residuos_repository import TiposResiduosRepository
-from app.infrastructure.residuos_repository import ResiduosRepository
+from app.infrastructure.residuos_repository import ResiduosRepository, CLAVE_NATURAL, RegistroDuplicadoError
 from app.infrastructure.analisis_repository import AnalisisIARepository
+from app.infrastructure.anomalias_repository import AnomaliasRepository
 
 from app.domain.waste_service import WasteService
+from app.application.json_response import FastJSONResponse
+from app.config.profiling_config import RutaPerfilable
+from app.application.dashboard_en_vivo import DashboardSaturadoError, dashboard_en_vivo
+from app.infrastructure.cambios import escuchando
+from app.infrastructure.arrow_export import FORMATOS_EXPORT, ExportNoDisponibleError
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.cancelacion import ConsultaCanceladaError
 
 from app.dto.waste_dto import (
     CrearResiduoRequestDto,
     CrearResiduoResponseDto,
     EstadisticasResponseDto,
+    EstadisticasBatchRequestDto,
+    EstadisticasBatchResponseDto,
     ListarResiduosResponseDto,
     TipoResiduoRequesDto,
     TipoResiduoResponseDto,
     AnalisisIARequestDto,
     AnalisisIAResponseDto,
+    ListarAnalisisResponseDto,
+    AnomaliaResiduoDto,
+    AnalisisBatchRequestDto,
+    AnalisisBatchResponseDto,
+    MetricasLLMDto,
 )
-from database import get_db
+from database import al_volcar_buffer, get_db, get_schema
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(route_class=RutaPerfilable)
+
+# Tienen manejador propio en la aplicación (503 / 504): los endpoints
+# no deben convertirlas en un 500
+ERRORES_DE_PLATAFORMA = (CapacidadAgotadaError, ConsultaCanceladaError)
 
 
 # ============================================================
 #  Dependency Injector
 # ============================================================
-def get_waste_service(conn=Depends(get_db)) -> WasteService:
-    tipos_repo = TiposResiduosRepository(conn)
-    residuos_repo = ResiduosRepository(conn)
-    analisis_repo = AnalisisIARepository(conn)
-    return WasteService(tipos_repo, residuos_repo, analisis_repo)
+def get_waste_service(sesion=Depends(get_db)) -> WasteService:
+    tipos_repo = TiposResiduosRepository(sesion)
+    residuos_repo = ResiduosRepository(sesion)
+    analisis_repo = AnalisisIARepository(sesion)
+    anomalias_repo = AnomaliasRepository(sesion)
+    return WasteService(tipos_repo, residuos_repo, analisis_repo, anomalias_repo)
+
+
+@al_volcar_buffer
+def _anomalias_tras_volcado(sesion, registros: list[dict]) -> None:
+    # Una sola actualización de anomalías por lote agrupado, agrupada por
+    # (tipo, día), en la transacción del volcado
+    get_waste_service(sesion).actualizar_anomalias(registros)
 
 
 # ============================================================
@@ -60,6 +90,8 @@ def crear_tipo_residuo(
     except ValueError as e:
         logger.warning(f"Validación fallida al crear tipo: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error interno al crear tipo: {e}")
         raise HTTPException(status_code=500, detail="Error interno al crear tipo de residuo.")
@@ -70,6 +102,8 @@ def get_tipo_residuo(tipo_id: int, service: WasteService = Depends(get_waste_ser
         return service.obtener_tipo_por_id(tipo_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener tipo de residuo: {e}")
         raise HTTPException(status_code=500, detail="Error interno")
@@ -81,6 +115,8 @@ def get_tipo_residuo(tipo_id: int, service: WasteService = Depends(get_waste_ser
 def listar_tipos_residuo(service: WasteService = Depends(get_waste_service)):
     try:
         return service.listar_tipos()
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error al listar tipos: {e}")
         raise HTTPException(status_code=500, detail="No se pudieron obtener los tipos de residuo.")
@@ -101,6 +137,8 @@ def obtener_residuo(
         return service.obtener_residuo_por_id(registro_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error interno al obtener residuo {registro_id}: {e}")
         raise HTTPException(status_code=500, detail="Error interno al obtener el residuo.")
@@ -115,10 +153,13 @@ def listar_residuos(
     service: WasteService = Depends(get_waste_service),
 ):
     try:
-        return service.listar_residuos(fecha_inicio, fecha_fin)
+        # Filas de confianza: se serializan sin revalidar el response_model
+        return FastJSONResponse(service.listar_residuos_filas(fecha_inicio, fecha_fin))
     except ValueError as e:
         logger.warning(f"Rango inválido: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error al listar residuos: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno al listar residuos: {e}")
@@ -136,9 +177,13 @@ def registrar_residuo(
 ):
     try:
         return service.registrar_residuo(request)
+    except RegistroDuplicadoError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         logger.warning(f"Error de validación al registrar residuo: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error interno al registrar residuo: {e}")
         raise HTTPException(status_code=500, detail="Error interno al registrar residuo.")
@@ -156,20 +201,94 @@ def obtener_estadisticas(
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas: {e}")
         raise HTTPException(status_code=500, detail="Error interno")
 
 
+@router.post("/estadisticas/batch", response_model=EstadisticasBatchResponseDto)
+def obtener_estadisticas_batch(
+    request: EstadisticasBatchRequestDto,
+    service: WasteService = Depends(get_waste_service)
+):
+    """
+    Estadísticas de varios rangos en una sola consulta, con la variación
+    de cada rango respecto al primero.
+    """
+    try:
+        return service.obtener_estadisticas_batch(
+            [(r.fecha_inicio, r.fecha_fin) for r in request.rangos]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo estadísticas batch: {e}")
+        raise HTTPException(status_code=500, detail="Error interno")
+
+
+@router.websocket("/ws/dashboard")
+async def dashboard_en_vivo_ws(websocket: WebSocket, fecha_inicio: date, fecha_fin: date):
+    """
+    Dashboard en vivo: al conectarse se recibe un `snapshot` de las
+    estadísticas del rango y después un `delta` (tipos con su total
+    actualizado y registros nuevos) cada vez que una escritura lo toca.
+    """
+    try:
+        schema = get_schema(websocket)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    if fecha_fin < fecha_inicio:
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION,
+            reason="La fecha fin debe ser mayor o igual a la fecha inicio",
+        )
+        return
+    if not escuchando():
+        # Sin eventos de cambio no habría deltas: el cliente debe sondear
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Eventos de cambio no disponibles")
+        return
+
+    await websocket.accept()
+    try:
+        suscripcion = await dashboard_en_vivo.suscribir(schema, fecha_inicio, fecha_fin)
+    except DashboardSaturadoError as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=str(e))
+        return
+    except Exception as e:
+        logger.error(f"Error iniciando dashboard en vivo: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+
+    try:
+        await dashboard_en_vivo.atender(websocket, suscripcion)
+    finally:
+        dashboard_en_vivo.cancelar(suscripcion)
+
+
 @router.post("/registros/upload-txt", status_code=201)
 async def registrar_residuos_txt(
     archivo: UploadFile = File(...),
+    modo: str = Query(default="insertar", description="insertar | upsert"),
+    clave: str = Query(default=",".join(CLAVE_NATURAL), description="Clave natural para el modo upsert"),
+    aislar_errores: bool = Query(default=False, description="Descartar solo los tramos que fallen"),
+    commit_asincrono: bool = Query(default=False, description="synchronous_commit=off (solo upsert)"),
     service: WasteService = Depends(get_waste_service),
 ):
     try:
-        return await service.registrar_residuos_desde_txt(archivo)
+        return await service.registrar_residuos_desde_txt(
+            archivo, modo, clave, aislar_errores, commit_asincrono
+        )
+    except RegistroDuplicadoError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error al procesar archivo TXT: {e}")
         raise HTTPException(status_code=500, detail="Error interno procesando archivo TXT")
@@ -178,12 +297,20 @@ async def registrar_residuos_txt(
 @router.post("/registros/lote", status_code=201)
 def registrar_residuos_lote(
     registros: list[CrearResiduoRequestDto],
+    modo: str = Query(default="insertar", description="insertar | upsert"),
+    clave: str = Query(default=",".join(CLAVE_NATURAL), description="Clave natural para el modo upsert"),
+    aislar_errores: bool = Query(default=False, description="Descartar solo los tramos que fallen"),
+    commit_asincrono: bool = Query(default=False, description="synchronous_commit=off (solo upsert)"),
     service: WasteService = Depends(get_waste_service)
 ):
     try:
-        return service.registrar_residuos_lote(registros)
+        return service.registrar_residuos_lote(registros, modo, clave, aislar_errores, commit_asincrono)
+    except RegistroDuplicadoError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error registrando lote: {e}")
         raise HTTPException(status_code=500, detail="Error interno al registrar lote")
@@ -191,6 +318,92 @@ def registrar_residuos_lote(
 
 
 
+# ============================================================
+#  Endpoints de Exportación (Parquet / Arrow)
+# ============================================================
+def _respuesta_export(archivo, formato: str, nombre: str) -> StreamingResponse:
+    media_type, extension = FORMATOS_EXPORT[formato]
+
+    def contenido():
+        with archivo:
+            while bloque := archivo.read(1024 * 1024):
+                yield bloque
+
+    return StreamingResponse(
+        contenido(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{extension}"'},
+    )
+
+
+@router.get("/export/registros")
+def exportar_registros(
+    fecha_inicio: date,
+    fecha_fin: date,
+    formato: str = Query(default="parquet", description="parquet | arrow"),
+    service: WasteService = Depends(get_waste_service),
+):
+    try:
+        archivo = service.exportar_registros(fecha_inicio, fecha_fin, formato)
+        return _respuesta_export(archivo, formato, f"registros_{fecha_inicio}_{fecha_fin}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportNoDisponibleError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.error(f"Error exportando registros: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al exportar registros.")
+
+
+@router.get("/export/estadisticas-diarias")
+def exportar_estadisticas_diarias(
+    fecha_inicio: date,
+    fecha_fin: date,
+    formato: str = Query(default="parquet", description="parquet | arrow"),
+    service: WasteService = Depends(get_waste_service),
+):
+    try:
+        archivo = service.exportar_estadisticas_diarias(fecha_inicio, fecha_fin, formato)
+        return _respuesta_export(archivo, formato, f"estadisticas_diarias_{fecha_inicio}_{fecha_fin}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExportNoDisponibleError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.error(f"Error exportando estadísticas diarias: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al exportar estadísticas.")
+
+
+# ============================================================
+#  Endpoints de Anomalías
+# ============================================================
+@router.get(
+    "/anomalias",
+    response_model=List[AnomaliaResiduoDto]
+)
+def listar_anomalias(
+    fecha_inicio: date,
+    fecha_fin: date,
+    service: WasteService = Depends(get_waste_service),
+):
+    """
+    Días marcados como anómalos durante la ingesta; no recorre el histórico.
+    """
+    try:
+        return service.listar_anomalias(fecha_inicio, fecha_fin)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.error(f"Error al listar anomalías: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al listar anomalías.")
+
+
 # ============================================================
 #  Endpoints de Análisis con IA
 # ============================================================
@@ -201,16 +414,23 @@ def registrar_residuos_lote(
 )
 def generar_analisis(
     request: AnalisisIARequestDto,
+    modo: str = Query(default="completo", description="completo | jerarquico"),
     service: WasteService = Depends(get_waste_service),
 ):
     """
     Genera un análisis IA en base a varios registros de residuos.
+
+    Con `modo=jerarquico` el informe se construye a partir de resúmenes
+    semanales cacheados y solo se vuelven a resumir las semanas cuyos
+    registros cambiaron.
     """
     try:
-        return service.generar_analisis(request)
+        return service.generar_analisis(request, modo)
     except ValueError as e:
         logger.warning(f"No se pudo generar análisis: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except RuntimeError as e:
         logger.error(f"Error IA Azure: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -241,6 +461,9 @@ def generar_analisis_estadistico(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    except ERRORES_DE_PLATAFORMA:
+        raise
+
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -249,19 +472,86 @@ def generar_analisis_estadistico(
         raise HTTPException(status_code=500, detail="Error inesperado generando análisis estadístico.")
 
 
+@router.post(
+    "/analisis/batch",
+    response_model=AnalisisBatchResponseDto,
+    status_code=status.HTTP_201_CREATED
+)
+def generar_analisis_batch(
+    request: AnalisisBatchRequestDto,
+    service: WasteService = Depends(get_waste_service)
+):
+    """
+    Genera análisis estadísticos para una lista de rangos y/o periodos
+    rodantes (semanas o meses de un intervalo) y devuelve un reporte del
+    lote con el estado de cada rango, los tokens usados y el coste estimado.
+    """
+    try:
+        return service.generar_analisis_batch(
+            [(r.fecha_inicio, r.fecha_fin) for r in request.rangos],
+            [(p.fecha_inicio, p.fecha_fin, p.periodo) for p in request.periodos],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.exception("Error inesperado generando análisis en lote")
+        raise HTTPException(status_code=500, detail="Error inesperado generando análisis en lote.")
+
+
 
 @router.get(
     "/analisis",
-    response_model=List[AnalisisIAResponseDto]
+    response_model=ListarAnalisisResponseDto
 )
-def listar_analisis(service: WasteService = Depends(get_waste_service)):
+def listar_analisis(
+    limite: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    modelo: Optional[str] = None,
+    service: WasteService = Depends(get_waste_service),
+):
+    """
+    Lista análisis paginados sin el texto completo de recomendaciones,
+    que se obtiene con GET /analisis/{id}.
+    """
     try:
-        return service.listar_analisis()
+        return service.listar_analisis(limite, cursor, fecha_inicio, fecha_fin, modelo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener análisis: {e}")
         raise HTTPException(status_code=500, detail="Error interno al obtener los análisis.")
 
 
+@router.get(
+    "/analisis/metricas",
+    response_model=List[MetricasLLMDto]
+)
+def metricas_llm(
+    fecha_inicio: date,
+    fecha_fin: date,
+    service: WasteService = Depends(get_waste_service),
+):
+    """
+    p50/p95 de latencia del modelo y tokens consumidos por día y modelo,
+    a partir de la contabilidad guardada con cada análisis.
+    """
+    try:
+        return service.metricas_llm(fecha_inicio, fecha_fin)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo métricas del modelo: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al obtener las métricas.")
+
+
 @router.get(
     "/analisis/{analisis_id}",
     response_model=AnalisisIAResponseDto
@@ -271,6 +561,8 @@ def obtener_analisis(analisis_id: int, service: WasteService = Depends(get_waste
         return service.obtener_analisis_por_id(analisis_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ERRORES_DE_PLATAFORMA:
+        raise
     except Exception as e:
         logger.error(f"Error interno al obtener análisis {analisis_id}: {e}")
         raise HTTPException(status_code=500, detail="Error interno al obtener el análisis.")
@@ -0,0 +1,110 @@
+import json
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+from app.infrastructure.admission import CapacidadAgotadaError, grupo_admision
+
+logger = logging.getLogger(__name__)
+
+# Rutas que nunca se encolan (sondas y documentación)
+RUTAS_EXENTAS = ("/health", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+def grupo_de_ruta(metodo: str, path: str) -> str | None:
+    """
+    Asigna cada petición a un grupo de admisión. Generar análisis (POST
+    que llama al modelo) y exportar tienen su propio cupo para que no
+    consuman el de las rutas baratas como `/tipos`.
+    """
+    if path.endswith(RUTAS_EXENTAS):
+        return None
+
+    segmentos = path.strip("/").split("/")
+    if "analisis" in segmentos and metodo == "POST":
+        return "analisis"
+    if "export" in segmentos:
+        return "export"
+    return "general"
+
+
+async def _enviar_503(send, detalle: str, retry_after: int) -> None:
+    cuerpo = json.dumps({"detail": detalle}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(cuerpo)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+class AdmissionMiddleware:
+    """
+    Limita la concurrencia por grupo de rutas con colas acotadas y
+    responde 503 con `Retry-After` cuando el grupo está saturado, antes
+    de que la petición ocupe un hilo o una conexión.
+    """
+
+    def __init__(self, app, timeout_cola: float, retry_after: int):
+        self.app = app
+        self.timeout_cola = timeout_cola
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        nombre = grupo_de_ruta(scope["method"], scope["path"])
+        if nombre is None:
+            await self.app(scope, receive, send)
+            return
+
+        grupo = grupo_admision(nombre)
+        if not await grupo.entrar(self.timeout_cola):
+            metrics.incrementar(f"admision.rechazos.{nombre}")
+            logger.warning(f"Petición rechazada por saturación del grupo {nombre}: {scope['path']}")
+            await _enviar_503(send, "Servicio saturado, reintente más tarde", self.retry_after)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            grupo.salir()
+
+
+async def _capacidad_agotada(request: Request, exc: CapacidadAgotadaError) -> JSONResponse:
+    logger.warning(f"{exc} en {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servicio saturado, reintente más tarde"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def setup_admission(app: FastAPI) -> None:
+    """
+    Registra el control de admisión y el manejador que convierte
+    CapacidadAgotadaError (pool de conexiones o ranuras del modelo
+    agotados) en 503 con `Retry-After`.
+
+    Args:
+        app: Instancia de la aplicación FastAPI
+    """
+    app.add_exception_handler(CapacidadAgotadaError, _capacidad_agotada)
+
+    if not settings.ADMISSION_ENABLED:
+        return
+
+    app.add_middleware(
+        AdmissionMiddleware,
+        timeout_cola=settings.ADMISSION_COLA_TIMEOUT_S,
+        retry_after=settings.ADMISSION_RETRY_AFTER_S,
+    )
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+from app.config.settings import settings
+from app.infrastructure.sampling_profiler import MuestreadorPerfil, en_perfil
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-token"
+PROFILE_QUERY = "profile_token"
+
+
+def firmar_token_perfil(secreto: str, path: str, expira: int) -> str:
+    """
+    Genera el token `<expira>.<firma>` que habilita el perfilado de `path`
+    hasta el instante `expira` (epoch en segundos).
+    """
+    firma = hmac.new(secreto.encode(), f"{expira}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expira}.{firma}"
+
+
+def _token_valido(secreto: str, path: str, token: str) -> bool:
+    try:
+        expira_str, _ = token.split(".", 1)
+        expira = int(expira_str)
+    except ValueError:
+        return False
+
+    if expira < time.time():
+        return False
+
+    esperado = firmar_token_perfil(secreto, path, expira)
+    return hmac.compare_digest(esperado, token)
+
+
+class ProfilingMiddleware:
+    """
+    Perfila bajo demanda una sola petición.
+
+    Se activa con un token firmado en la cabecera `X-Profile-Token` o en el
+    parámetro `profile_token`. El perfil (formato speedscope) se guarda en
+    PROFILING_DIR y su identificador se devuelve en `X-Profile-Id`.
+    Las peticiones sin token solo pagan la búsqueda de la cabecera.
+    """
+
+    def __init__(self, app, secreto: str, directorio: str, intervalo_ms: float):
+        self.app = app
+        self.secreto = secreto
+        self.directorio = Path(directorio)
+        self.intervalo_ms = intervalo_ms
+
+    def _token(self, scope) -> str | None:
+        for nombre, valor in scope.get("headers", []):
+            if nombre == PROFILE_HEADER:
+                return valor.decode("latin-1")
+
+        query = scope.get("query_string", b"")
+        if query and PROFILE_QUERY.encode() in query:
+            valores = parse_qs(query.decode("latin-1")).get(PROFILE_QUERY)
+            if valores:
+                return valores[0]
+        return None
+
+    def _guardar(self, perfil_id: str, perfil: dict) -> Path:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        destino = self.directorio / f"{perfil_id}.speedscope.json"
+        destino.write_text(json.dumps(perfil))
+        return destino
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = self._token(scope)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not _token_valido(self.secreto, scope["path"], token):
+            logger.warning(f"Token de perfilado inválido para {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        perfil_id = uuid.uuid4().hex
+
+        async def send_con_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", perfil_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        muestreador = MuestreadorPerfil(self.intervalo_ms)
+        token = muestreador.iniciar()
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            muestreador.detener(token)
+            nombre = f"{scope['method']} {scope['path']}"
+            try:
+                destino = await asyncio.to_thread(
+                    self._guardar, perfil_id, muestreador.speedscope(nombre)
+                )
+                logger.info(f"Perfil de {nombre} guardado en {destino}")
+            except Exception as e:
+                logger.error(f"No se pudo guardar el perfil {perfil_id}: {e}")
+
+
+class RutaPerfilable(APIRoute):
+    """
+    Ruta cuyo endpoint se muestrea cuando su petición se perfila: el
+    perfil solo contiene el hilo (o la corrutina) que atiende la petición.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, en_perfil(endpoint), **kwargs)
+
+
+def setup_profiling(app: FastAPI) -> None:
+    """
+    Registra el middleware de perfilado si PROFILING_SECRET está definido.
+    Sin secreto el middleware no se instala y el coste es nulo.
+
+    Args:
+        app: Instancia de la aplicación FastAPI
+    """
+    if not settings.PROFILING_SECRET:
+        return
+
+    app.add_middleware(
+        ProfilingMiddleware,
+        secreto=settings.PROFILING_SECRET,
+        directorio=settings.PROFILING_DIR,
+        intervalo_ms=settings.PROFILING_INTERVAL_MS,
+    )
@@ -1,4 +1,4 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, field_validator
 from pathlib import Path
 from typing import Any
@@ -7,7 +7,21 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 ENV_FILE = BASE_DIR / ".env"
 
 
-class Settings(BaseSettings):
+def _validar_puerto(v: Any) -> int:
+    if v in (None, ""):
+        return 5432
+    try:
+        return int(v)
+    except Exception:
+        return 5432
+
+
+class _SeccionSettings(BaseSettings):
+    # Cada sección lee el mismo .env e ignora las variables de las demás
+    model_config = SettingsConfigDict(env_file=str(ENV_FILE), extra="ignore")
+
+
+class DatabaseSettings(_SeccionSettings):
     # ============================================================
     # PostgreSQL (psycopg2)
     # ============================================================
@@ -21,6 +35,80 @@ class Settings(BaseSettings):
     # URL completa (usada en algunos casos)
     DATABASE_URL: str
 
+    # Pools de conexiones (uno por tenant)
+    DB_POOL_MIN: int = Field(default=1)
+    DB_POOL_MAX: int = Field(default=5)
+    DB_POOL_TIMEOUT_S: float = Field(default=5.0)
+
+    # Group commit de POST /registros (inserciones individuales agrupadas)
+    WRITE_BUFFER_ENABLED: bool = Field(default=False)
+    WRITE_BUFFER_MAX_FILAS: int = Field(default=200)
+    WRITE_BUFFER_ESPERA_MS: float = Field(default=5.0)
+    WRITE_BUFFER_TIMEOUT_S: float = Field(default=10.0)
+
+    # Ingesta en lote: filas por savepoint dentro de la unidad de trabajo
+    INGESTA_TRAMO_FILAS: int = Field(default=5000)
+
+    # Réplicas de lectura (DSN libpq); vacío = todo al primario
+    POSTGRES_READ_REPLICAS: list[str] = Field(default=[])
+    REPLICA_MAX_LAG_S: float = Field(default=5.0)
+    REPLICA_LAG_CHECK_S: float = Field(default=2.0)
+    REPLICA_READ_YOUR_WRITES_S: float = Field(default=10.0)
+
+    # Multi-sede: cada tenant usa su propio schema
+    TENANT_HEADER: str = Field(default="X-Tenant-Id")
+    TENANT_SCHEMAS: dict[str, str] = Field(default={})
+    # Con prefijo solo se atienden los schemas ya provisionados en la base
+    TENANT_SCHEMA_PREFIX: str | None = Field(default=None)
+    # Pools abiertos a la vez (primario y réplicas); se cierra el menos usado
+    TENANT_POOLS_MAX: int = Field(default=50)
+
+    # statement_timeout por ruta ("<MÉTODO> <segmento>" o "<segmento>");
+    # 0 desactiva el límite
+    STATEMENT_TIMEOUT_MS: int = Field(default=30000)
+    STATEMENT_TIMEOUTS_RUTA_MS: dict[str, int] = Field(default={
+        "tipos": 2000,
+        "GET registros": 15000,
+        "POST registros": 120000,
+        "estadisticas": 10000,
+        "anomalias": 10000,
+        "export": 300000,
+    })
+
+    # Instrumentación de consultas
+    SLOW_QUERY_MS: int = Field(default=500)
+    QUERY_EXPLAIN_SAMPLE_RATE: float = Field(default=0.0)
+
+    # Sentencias preparadas por conexión (desactivar detrás de pgbouncer
+    # en modo transaction, donde la conexión de servidor cambia)
+    PREPARED_STATEMENTS_ENABLED: bool = Field(default=True)
+
+    # Invalidación de cachés locales entre workers (LISTEN/NOTIFY)
+    CAMBIOS_ESCUCHA_ENABLED: bool = Field(default=True)
+    CAMBIOS_POLL_S: float = Field(default=1.0)
+    CAMBIOS_KEEPALIVE_S: float = Field(default=30.0)
+    CACHE_TIPOS_TTL_S: float = Field(default=300.0)
+    CACHE_ESTADISTICAS_TTL_S: float = Field(default=60.0)
+
+    # Espera máxima de una petición por un cálculo idéntico en curso
+    # (single-flight); al agotarse se responde 503
+    SINGLE_FLIGHT_ESPERA_ESTADISTICAS_S: float = Field(default=15.0)
+    SINGLE_FLIGHT_ESPERA_ANALISIS_S: float = Field(default=120.0)
+
+    @field_validator("POSTGRES_PORT", mode="before")
+    @classmethod
+    def validate_port_integers(cls, v: Any) -> int:
+        return _validar_puerto(v)
+
+    @field_validator("DATABASE_URL", mode="before")
+    @classmethod
+    def validate_database_url(cls, v: Any) -> str:
+        if not v:
+            raise ValueError("DATABASE_URL es requerido en el archivo .env")
+        return str(v)
+
+
+class AppSettings(_SeccionSettings):
     # ============================================================
     # FastAPI
     # ============================================================
@@ -32,32 +120,52 @@ class Settings(BaseSettings):
     # CORS
     ALLOWED_ORIGINS: list[str] = Field(default=["*"])
 
-    # ============================================================
-    # Azure OpenAI (solo generativa, GPT-4o-mini)
-    # ============================================================
-    AZURE_OPENAI_KEY: str
-    AZURE_OPENAI_ENDPOINT: str
-    AZURE_OPENAI_DEPLOYMENT: str = Field(default="gpt-4o-mini")
+    # Perfilado bajo demanda (deshabilitado si no hay secreto)
+    PROFILING_SECRET: str | None = Field(default=None)
+    PROFILING_DIR: str = Field(default="/tmp/waste-api-profiles")
+    PROFILING_INTERVAL_MS: float = Field(default=5.0)
 
-    # ============================================================
-    # VALIDADORES
-    # ============================================================
-    @field_validator("POSTGRES_PORT", "API_PORT", mode="before")
-    @classmethod
-    def validate_port_integers(cls, v: Any) -> int:
-        if v in (None, ""):
-            return 5432
-        try:
-            return int(v)
-        except Exception:
-            return 5432
+    # Exportación columnar (filas por record batch)
+    EXPORT_LOTE_FILAS: int = Field(default=50000)
 
-    @field_validator("DATABASE_URL", mode="before")
+    # Detección de anomalías (línea base EWMA por tipo de residuo)
+    ANOMALIA_UMBRAL_SIGMA: float = Field(default=3.0)
+    ANOMALIA_ALPHA: float = Field(default=0.1)
+    ANOMALIA_MIN_DIAS: int = Field(default=7)
+
+    # Control de admisión: grupo -> (concurrentes, en cola)
+    ADMISSION_ENABLED: bool = Field(default=True)
+    ADMISSION_LIMITES: dict[str, tuple[int, int]] = Field(default={
+        "analisis": (3, 6),
+        "export": (2, 4),
+        "general": (32, 64),
+    })
+    ADMISSION_COLA_TIMEOUT_S: float = Field(default=2.0)
+    ADMISSION_RETRY_AFTER_S: int = Field(default=2)
+
+    # Dashboard en vivo (WebSocket)
+    DASHBOARD_MAX_SUSCRIPTORES: int = Field(default=500)
+    DASHBOARD_AGRUPAR_MS: float = Field(default=250.0)
+    DASHBOARD_COLA_MAX: int = Field(default=64)
+    DASHBOARD_MAX_REGISTROS_DELTA: int = Field(default=200)
+
+    # Planificador interno: un único líder por advisory lock (de sesión:
+    # requiere conexión directa, no pgbouncer en modo transaction)
+    PLANIFICADOR_ENABLED: bool = Field(default=True)
+    PLANIFICADOR_LOCK_ID: int = Field(default=7_424_001)
+    PLANIFICADOR_TICK_S: float = Field(default=60.0)
+    PLANIFICADOR_VENTANA_H: float = Field(default=3.0)
+    PLANIFICADOR_HORA_INFORMES: str = Field(default="02:00")
+    PLANIFICADOR_HORA_CALENTAR: str = Field(default="05:30")
+    PLANIFICADOR_RANGOS_ESTADISTICAS: list[str] = Field(default=[
+        "ayer", "semana_actual", "semana_anterior", "ultimos_7_dias", "mes_actual",
+    ])
+    PLANIFICADOR_RANGOS_INFORMES: list[str] = Field(default=["ayer", "ultimos_7_dias"])
+
+    @field_validator("API_PORT", mode="before")
     @classmethod
-    def validate_database_url(cls, v: Any) -> str:
-        if not v:
-            raise ValueError("DATABASE_URL es requerido en el archivo .env")
-        return str(v)
+    def validate_port_integers(cls, v: Any) -> int:
+        return _validar_puerto(v)
 
     @field_validator("DEBUG", mode="before")
     @classmethod
@@ -66,8 +174,60 @@ class Settings(BaseSettings):
             return v.lower().strip() in ("true", "1", "yes", "on")
         return bool(v)
 
-    class Config:
-        env_file = str(ENV_FILE)
+
+class AzureOpenAISettings(_SeccionSettings):
+    # ============================================================
+    # Azure OpenAI (solo generativa, GPT-4o-mini)
+    # ============================================================
+    AZURE_OPENAI_KEY: str
+    AZURE_OPENAI_ENDPOINT: str
+    AZURE_OPENAI_DEPLOYMENT: str = Field(default="gpt-4o-mini")
+
+    # Llamadas simultáneas al modelo por proceso
+    LLM_MAX_CONCURRENTES: int = Field(default=4)
+    LLM_SLOT_TIMEOUT_S: float = Field(default=0.5)
+
+    # Reintentos propios ante errores transitorios del modelo
+    LLM_MAX_REINTENTOS: int = Field(default=2)
+    LLM_REINTENTO_BASE_S: float = Field(default=0.5)
+
+    # Precio por 1K tokens (USD) para estimar el coste de los análisis
+    LLM_COSTE_PROMPT_1K_USD: float = Field(default=0.00015)
+    LLM_COSTE_COMPLETION_1K_USD: float = Field(default=0.0006)
+
+    # Análisis en lote: llamadas al modelo en paralelo y espera por ranura
+    ANALISIS_BATCH_MAX_RANGOS: int = Field(default=80)
+    ANALISIS_BATCH_CONCURRENCIA: int = Field(default=3)
+    ANALISIS_BATCH_SLOT_TIMEOUT_S: float = Field(default=60.0)
+
+
+class Settings:
+    """
+    Fachada sobre las secciones de configuración.
+
+    Cada sección se carga y valida la primera vez que se accede a uno de
+    sus campos, de modo que una réplica que solo atiende `/registros`
+    arranca sin las variables de Azure OpenAI.
+    """
+
+    SECCIONES = (DatabaseSettings, AppSettings, AzureOpenAISettings)
+
+    def __init__(self):
+        self._secciones: dict[type, BaseSettings] = {}
+
+    def seccion(self, cls: type[BaseSettings]) -> BaseSettings:
+        if cls not in self._secciones:
+            self._secciones[cls] = cls()
+        return self._secciones[cls]
+
+    def __getattr__(self, nombre: str) -> Any:
+        for cls in self.SECCIONES:
+            if nombre in cls.model_fields:
+                valor = getattr(self.seccion(cls), nombre)
+                # Los siguientes accesos ya no pasan por __getattr__
+                setattr(self, nombre, valor)
+                return valor
+        raise AttributeError(nombre)
 
 
 settings = Settings()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.infrastructure import metrics
+from app.infrastructure.cancelacion import (
+    SCOPE_CANCELADOR,
+    CanceladorConsultas,
+    ClienteDesconectadoError,
+    ConsultaCanceladaError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DesconexionMiddleware:
+    """
+    Vigila `receive` durante toda la petición. Los mensajes se reenvían
+    a la aplicación a través de una cola; cuando llega `http.disconnect`
+    se cancelan las consultas en curso de la petición.
+
+    Una vez enviado el último fragmento de la respuesta, la desconexión
+    es el cierre normal del cliente: no cancela lo que la aplicación
+    siga ejecutando (tareas en segundo plano, limpieza de dependencias).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cancelador = CanceladorConsultas()
+        scope[SCOPE_CANCELADOR] = cancelador
+        cola: asyncio.Queue = asyncio.Queue()
+        respondida = False
+
+        async def enviar(mensaje):
+            nonlocal respondida
+            if mensaje["type"] == "http.response.body" and not mensaje.get("more_body", False):
+                respondida = True
+            await send(mensaje)
+
+        async def vigilar():
+            while True:
+                mensaje = await receive()
+                await cola.put(mensaje)
+                if mensaje["type"] == "http.disconnect":
+                    if not respondida:
+                        metrics.incrementar("cancelacion.desconexiones")
+                        await asyncio.to_thread(cancelador.cancelar)
+                    return
+
+        vigilante = asyncio.create_task(vigilar())
+        try:
+            await self.app(scope, cola.get, enviar)
+        finally:
+            vigilante.cancel()
+
+
+async def _consulta_cancelada(request: Request, exc: ConsultaCanceladaError) -> JSONResponse:
+    if isinstance(exc, ClienteDesconectadoError):
+        # Nadie leerá la respuesta
+        logger.info(f"Petición abandonada por el cliente: {request.url.path}")
+    else:
+        metrics.incrementar("cancelacion.timeouts")
+        logger.warning(f"Consulta cancelada por statement_timeout en {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=504,
+        content={"detail": "La consulta superó el tiempo máximo permitido"},
+    )
+
+
+def setup_timeouts(app: FastAPI) -> None:
+    """
+    Registra la cancelación de consultas al desconectarse el cliente y el
+    manejador que convierte las consultas canceladas en 504.
+
+    Args:
+        app: Instancia de la aplicación FastAPI
+    """
+    app.add_exception_handler(ConsultaCanceladaError, _consulta_cancelada)
+    app.add_middleware(DesconexionMiddleware)
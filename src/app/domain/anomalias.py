@@ -0,0 +1,37 @@
+import math
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+
+@dataclass
+class LineaBase:
+    """
+    Estado incremental de un tipo de residuo: media y varianza móviles
+    (exponenciales) de sus totales diarios ya cerrados.
+    """
+    tipo_residuo_id: int
+    n: int = 0
+    media: float = 0.0
+    varianza: float = 0.0
+    ultimo_dia: Optional[date] = None
+
+    def incorporar(self, valor: float, alpha: float) -> None:
+        """
+        Añade un total diario a la línea base en O(1) (EWMA de media y
+        varianza); no requiere volver a leer el histórico.
+        """
+        if self.n == 0:
+            self.media = valor
+            self.varianza = 0.0
+        else:
+            delta = valor - self.media
+            self.media += alpha * delta
+            self.varianza = (1 - alpha) * (self.varianza + alpha * delta * delta)
+        self.n += 1
+
+    def z_score(self, valor: float) -> Optional[float]:
+        desviacion = math.sqrt(self.varianza)
+        if desviacion <= 1e-9:
+            return None
+        return (valor - self.media) / desviacion
@@ -1,13 +1,34 @@
+import base64
 import logging
-from datetime import date
-from typing import List
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 import io
-from openai import AzureOpenAI
 
 from app.config.settings import settings
+from app.infrastructure.ai_client import UsoLLM, completar
+from app.infrastructure import metrics
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.cache_local import CacheLocal
+from app.infrastructure.cambios import Cambio, escuchando, suscribir
+from app.infrastructure.cancelacion import ClienteDesconectadoError
+from app.infrastructure.sampling_profiler import propagar_perfil
+from app.infrastructure.single_flight import SingleFlight
+from app.infrastructure.unit_of_work import unidad_de_trabajo
+from app.infrastructure.arrow_export import (
+    FORMATOS_EXPORT,
+    escribir_export,
+    esquema_estadisticas_diarias,
+    esquema_registros,
+)
 from app.infrastructure.tipos_residuos_repository import TiposResiduosRepository
-from app.infrastructure.residuos_repository import ResiduosRepository
+from app.infrastructure.residuos_repository import ResiduosRepository, CLAVE_NATURAL
 from app.infrastructure.analisis_repository import AnalisisIARepository
+from app.infrastructure.anomalias_repository import AnomaliasRepository
+from app.domain.anomalias import LineaBase
 
 from app.dto.waste_dto import (
     CrearResiduoRequestDto,
@@ -15,14 +36,74 @@ from app.dto.waste_dto import (
     ListarResiduosResponseDto,
     AnalisisIARequestDto,
     AnalisisIAResponseDto,
+    AnalisisIAResumenDto,
+    ListarAnalisisResponseDto,
     TipoResiduoRequesDto,
     TipoResiduoResponseDto,
     EstadisticaTipoDto, 
-    EstadisticasResponseDto
+    EstadisticasResponseDto,
+    EstadisticasBatchResponseDto,
+    DeltaEstadisticasDto,
+    DeltaTipoDto,
+    AnomaliaResiduoDto,
+    AnalisisBatchItemDto,
+    AnalisisBatchResponseDto,
+    MetricasLLMDto,
 )
 
 logger = logging.getLogger(__name__)
 
+MODOS_INGESTA = ("insertar", "upsert")
+MAX_RANGOS_BATCH = 24
+MODOS_ANALISIS = ("completo", "jerarquico")
+
+# Compartidos por todas las peticiones del proceso (el servicio es por petición)
+_vuelos_estadisticas = SingleFlight(
+    "estadisticas", settings.SINGLE_FLIGHT_ESPERA_ESTADISTICAS_S, reintentar_en=(ClienteDesconectadoError,)
+)
+_vuelos_analisis = SingleFlight(
+    "analisis", settings.SINGLE_FLIGHT_ESPERA_ANALISIS_S, reintentar_en=(ClienteDesconectadoError,)
+)
+
+# Cachés locales del proceso, invalidadas por los eventos de cambio (NOTIFY)
+_cache_tipos = CacheLocal("tipos", ttl_s=settings.CACHE_TIPOS_TTL_S)
+_cache_estadisticas = CacheLocal("estadisticas", ttl_s=settings.CACHE_ESTADISTICAS_TTL_S)
+
+
+def _rangos_de_clave(clave: tuple) -> list[tuple[date, date]]:
+    # Claves de estadísticas: ("rango", schema, fi, ff) o ("batch", schema, rangos)
+    if clave[0] == "rango":
+        return [(clave[2], clave[3])]
+    return list(clave[2])
+
+
+def _invalidar_caches(cambio: Cambio) -> None:
+    if cambio.entidad in (None, "tipos"):
+        _cache_tipos.invalidar(lambda clave: cambio.schema in (None, clave[0]))
+    if cambio.entidad in (None, "residuos"):
+        _cache_estadisticas.invalidar(
+            lambda clave: any(cambio.afecta(clave[1], fi, ff) for fi, ff in _rangos_de_clave(clave))
+        )
+
+
+suscribir(_invalidar_caches, al_confirmar=True)
+
+
+def _cacheado(cache: CacheLocal, clave: tuple, sesion, fn):
+    # Sin escucha de cambios no hay forma de saber si la entrada sigue
+    # vigente; con read-your-writes, la entrada pudo llenarse en otro
+    # worker antes de que este recibiera el evento de la escritura
+    if not escuchando() or sesion.lee_sus_escrituras:
+        return fn()
+
+    def llenar():
+        # Se llena desde el primario: un valor leído de una réplica con
+        # retraso seguiría en caché tras el evento de cambio que lo invalida
+        with sesion.leyendo_de_primaria():
+            return fn()
+
+    return cache.obtener_o_calcular(clave, llenar)
+
 
 class WasteService:
 
@@ -31,16 +112,27 @@ class WasteService:
         tipos_repo: TiposResiduosRepository,
         residuos_repo: ResiduosRepository,
         analisis_repo: AnalisisIARepository,
+        anomalias_repo: AnomaliasRepository,
     ):
         self.tipos_repo = tipos_repo
         self.residuos_repo = residuos_repo
         self.analisis_repo = analisis_repo
+        self.anomalias_repo = anomalias_repo
 
-        self.ai_client = AzureOpenAI(
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-            api_key=settings.AZURE_OPENAI_KEY,
-            api_version="2024-05-01-preview",
-        )
+    @property
+    def schema(self) -> str:
+        return self.residuos_repo.schema
+
+    def _coalescer(self, vuelos: SingleFlight, clave: tuple, fn):
+        # Con read-your-writes activo no sirve el resultado de un líder
+        # que pudo leer antes de la escritura del cliente
+        if self.residuos_repo.sesion.lee_sus_escrituras:
+            return fn()
+        return vuelos.hacer(clave, fn)
+
+    def _unidad_de_trabajo(self, commit_sincrono: bool = True):
+        # Todos los repositorios del servicio comparten la sesión de la petición
+        return unidad_de_trabajo(self.residuos_repo.sesion, commit_sincrono)
 
     # ============================================================
     # TIPOS DE RESIDUO
@@ -58,19 +150,35 @@ class WasteService:
         logger.info(f"Tipo de residuo creado: {nombre} (ID {tipo_id})")
         return TipoResiduoResponseDto(id=tipo_id, nombre=nombre, descripcion=descripcion)
 
+    def _tipos_por_id(self) -> dict[int, dict]:
+        return _cacheado(
+            _cache_tipos,
+            (self.schema,),
+            self.tipos_repo.sesion,
+            lambda: {t["id"]: t for t in self.tipos_repo.listar()},
+        )
+
+    def _buscar_tipo(self, tipo_id: int) -> Optional[dict]:
+        tipo = self._tipos_por_id().get(tipo_id)
+        if tipo is None:
+            # Puede ser un tipo recién creado en otro worker cuyo evento
+            # aún no ha llegado: se confirma contra la base de datos
+            tipo = self.tipos_repo.obtener_por_id(tipo_id)
+        return tipo
+
     def listar_tipos(self) -> List[TipoResiduoResponseDto]:
-        tipos = self.tipos_repo.listar()
+        tipos = self._tipos_por_id().values()
         return [TipoResiduoResponseDto(**t) for t in tipos]
 
     def validar_tipo_residuo(self, tipo_residuo_id: int):
-        tipo = self.tipos_repo.obtener_por_id(tipo_residuo_id)
+        tipo = self._buscar_tipo(tipo_residuo_id)
         if not tipo:
             logger.error(f"Tipo de residuo no encontrado: ID={tipo_residuo_id}")
             raise ValueError("El tipo de residuo no existe")
         return tipo
     
     def obtener_tipo_por_id(self, tipo_id: int) -> TipoResiduoResponseDto:
-        tipo = self.tipos_repo.obtener_por_id(tipo_id)
+        tipo = self._buscar_tipo(tipo_id)
 
         if not tipo:
             logger.error(f"Tipo de residuo no encontrado: ID={tipo_id}")
@@ -94,21 +202,133 @@ class WasteService:
             logger.error(f"Fecha inválida: {dto.dia}")
             raise ValueError("Fecha inválida")
 
+        agrupado = self.residuos_repo.agrupa_escrituras
         residuo_id = self.residuos_repo.crear(
             dia=dto.dia,
             cantidad_kg=dto.cantidad_kg,
             tipo_residuo_id=dto.tipo_residuo_id,
+            source_line_id=dto.source_line_id,
         )
 
         logger.info(
             f"Registro creado: ID={residuo_id} Tipo={dto.tipo_residuo_id} {dto.cantidad_kg}kg"
         )
 
+        # Con group commit las anomalías se actualizan una vez por volcado,
+        # en su misma transacción (ver `al_volcar_buffer`)
+        if not agrupado:
+            self.actualizar_anomalias([{"dia": dto.dia, "tipo_residuo_id": dto.tipo_residuo_id}])
+
         return CrearResiduoResponseDto(id=residuo_id, **dto.model_dump())
     
 
 
-    async def registrar_residuos_desde_txt(self, archivo) -> dict:
+    @staticmethod
+    def _validar_modo_ingesta(modo: str, clave: str | None, commit_asincrono: bool = False) -> None:
+        if modo not in MODOS_INGESTA:
+            raise ValueError(f"Modo de ingesta inválido: {modo}")
+
+        if commit_asincrono and modo != "upsert":
+            # Solo una carga idempotente puede repetirse si se pierde el commit
+            raise ValueError("commit_asincrono solo está permitido en modo upsert")
+
+        if modo == "upsert":
+            columnas = tuple(c.strip() for c in (clave or "").split(",") if c.strip())
+            if set(columnas) != set(CLAVE_NATURAL):
+                raise ValueError(
+                    f"Clave natural no soportada: {clave}. Use {','.join(CLAVE_NATURAL)}"
+                )
+
+    def _persistir_tramo(self, registros: list[dict], modo: str) -> dict:
+        if modo == "upsert":
+            return self.residuos_repo.upsert_lote(registros)
+        return {"insertados": self.residuos_repo.crear_lote(registros)}
+
+    def _persistir_lote(
+        self,
+        registros: list[dict],
+        modo: str,
+        aislar_errores: bool = False,
+        commit_asincrono: bool = False,
+    ) -> dict:
+        """
+        Persiste la ingesta en una sola unidad de trabajo, en tramos de
+        INGESTA_TRAMO_FILAS filas con un savepoint cada uno.
+
+        Con `aislar_errores` un tramo que falla se deshace y se informa sin
+        descartar los demás; sin él, cualquier fallo deshace toda la carga.
+        `commit_asincrono` confirma con synchronous_commit=off (solo upsert).
+        """
+        if modo == "upsert":
+            sin_clave = [r for r in registros if not r.get("source_line_id")]
+            if sin_clave:
+                raise ValueError("El modo upsert requiere source_line_id en todos los registros")
+
+        tamano = settings.INGESTA_TRAMO_FILAS
+        totales: dict[str, int] = defaultdict(int)
+        persistidos: list[dict] = []
+        tramos_fallidos = []
+
+        with self._unidad_de_trabajo(commit_sincrono=not commit_asincrono) as uow:
+            for inicio in range(0, len(registros), tamano):
+                tramo = registros[inicio:inicio + tamano]
+                try:
+                    with uow.savepoint():
+                        resultado = self._persistir_tramo(tramo, modo)
+                except Exception as e:
+                    if not aislar_errores:
+                        raise
+                    logger.warning(f"Tramo de ingesta rechazado (filas {inicio + 1}-{inicio + len(tramo)}): {e}")
+                    tramos_fallidos.append({
+                        "fila_inicio": inicio + 1,
+                        "filas": len(tramo),
+                        "error": str(e),
+                    })
+                    continue
+
+                for campo, valor in resultado.items():
+                    totales[campo] += valor
+                persistidos += tramo
+
+            self.actualizar_anomalias(persistidos)
+
+        if modo == "upsert":
+            logger.info(
+                f"Upsert de lote: {totales['insertados']} insertados, "
+                f"{totales['actualizados']} actualizados, {totales['sin_cambios']} sin cambios"
+            )
+        else:
+            logger.info(f"{totales['insertados']} registros creados en lote")
+
+        respuesta = {"registros_creados": totales["insertados"]}
+        if modo == "upsert":
+            respuesta.update(
+                insertados=totales["insertados"],
+                actualizados=totales["actualizados"],
+                sin_cambios=totales["sin_cambios"],
+                duplicados_en_lote=totales["duplicados_en_lote"],
+            )
+        if aislar_errores:
+            respuesta.update(
+                registros_rechazados=sum(t["filas"] for t in tramos_fallidos),
+                tramos_fallidos=tramos_fallidos,
+            )
+        return respuesta
+
+    async def registrar_residuos_desde_txt(
+        self,
+        archivo,
+        modo: str = "insertar",
+        clave: str | None = None,
+        aislar_errores: bool = False,
+        commit_asincrono: bool = False,
+    ) -> dict:
+        """
+        Cada línea tiene el formato `dia,cantidad_kg,tipo_residuo_id[,source_line_id]`.
+        En modo upsert source_line_id es obligatorio en todas las líneas.
+        """
+        self._validar_modo_ingesta(modo, clave, commit_asincrono)
+
         # Leer contenido como texto
         contenido = (await archivo.read()).decode("utf-8")
         lineas = contenido.strip().split("\n")
@@ -121,10 +341,14 @@ class WasteService:
         for numero_linea, linea in enumerate(lineas, start=1):
             partes = [p.strip() for p in linea.split(",")]
 
-            if len(partes) != 3:
+            if len(partes) not in (3, 4):
                 raise ValueError(f"Formato inválido en la línea {numero_linea}: {linea}")
 
-            dia_str, cantidad_str, tipo_str = partes
+            dia_str, cantidad_str, tipo_str = partes[:3]
+            source_line_id = partes[3] if len(partes) == 4 and partes[3] else None
+
+            if source_line_id is None and modo == "upsert":
+                raise ValueError(f"Falta source_line_id en la línea {numero_linea} (obligatorio en modo upsert)")
 
             # Validar fecha
             try:
@@ -152,23 +376,33 @@ class WasteService:
             registros.append({
                 "dia": dia,
                 "cantidad_kg": cantidad,
-                "tipo_residuo_id": tipo_residuo_id
+                "tipo_residuo_id": tipo_residuo_id,
+                "source_line_id": source_line_id,
             })
 
         # Registrar en lote
-        creados = self.residuos_repo.crear_lote(registros)
+        resultado = self._persistir_lote(registros, modo, aislar_errores, commit_asincrono)
 
         return {
-            "registros_creados": creados,
+            **resultado,
             "lineas_procesadas": len(registros)
         }
 
     
 
-    def registrar_residuos_lote(self, registros: list[CrearResiduoRequestDto]) -> dict:
+    def registrar_residuos_lote(
+        self,
+        registros: list[CrearResiduoRequestDto],
+        modo: str = "insertar",
+        clave: str | None = None,
+        aislar_errores: bool = False,
+        commit_asincrono: bool = False,
+    ) -> dict:
         if not registros:
             raise ValueError("La lista de registros está vacía")
 
+        self._validar_modo_ingesta(modo, clave, commit_asincrono)
+
         registros_validados = []
 
         for dto in registros:
@@ -186,14 +420,11 @@ class WasteService:
             registros_validados.append({
                 "dia": dto.dia,
                 "cantidad_kg": dto.cantidad_kg,
-                "tipo_residuo_id": dto.tipo_residuo_id
+                "tipo_residuo_id": dto.tipo_residuo_id,
+                "source_line_id": dto.source_line_id,
             })
 
-        creados = self.residuos_repo.crear_lote(registros_validados)
-
-        logger.info(f"{creados} registros creados en lote")
-
-        return {"registros_creados": creados}
+        return self._persistir_lote(registros_validados, modo, aislar_errores, commit_asincrono)
     
     def obtener_residuo_por_id(self, registro_id: int) -> ListarResiduosResponseDto:
         row = self.residuos_repo.obtener_por_id(registro_id)
@@ -205,10 +436,11 @@ class WasteService:
 
 
 
-    def listar_residuos(
-        self, fecha_inicio: date, fecha_fin: date
-    ) -> List[ListarResiduosResponseDto]:
-
+    def listar_residuos_filas(self, fecha_inicio: date, fecha_fin: date) -> list[dict]:
+        """
+        Devuelve las filas de la BD sin construir DTOs, para serializarlas
+        directamente con FastJSONResponse.
+        """
         if fecha_fin < fecha_inicio:
             logger.error(f"Rango de fechas inválido: {fecha_inicio} - {fecha_fin}")
             raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
@@ -216,20 +448,12 @@ class WasteService:
         registros = self.residuos_repo.listar_por_rango(fecha_inicio, fecha_fin)
         logger.info(f"{len(registros)} registros encontrados en rango dado")
 
-        return [ListarResiduosResponseDto(**r) for r in registros]
+        return registros
     
 
    
-    def obtener_estadisticas(self, fecha_inicio: date, fecha_fin: date) -> EstadisticasResponseDto:
-
-        if fecha_fin < fecha_inicio:
-            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
-
-        rows = self.residuos_repo.estadisticas_por_rango(fecha_inicio, fecha_fin)
-
-        if not rows:
-            raise ValueError("No existen registros en el rango indicado")
-
+    @staticmethod
+    def _construir_estadisticas(fecha_inicio: date, fecha_fin: date, rows: list[dict]) -> EstadisticasResponseDto:
         # Total global
         total_global = sum(float(r["total_kg"]) for r in rows)
 
@@ -263,11 +487,318 @@ class WasteService:
             tipos=tipos_dto
         )
 
+    def obtener_estadisticas(self, fecha_inicio: date, fecha_fin: date) -> EstadisticasResponseDto:
+        """
+        Las peticiones concurrentes del mismo rango (refrescos de un
+        dashboard) comparten una única consulta de agregación, y el
+        resultado se cachea hasta que un evento de cambio toque el rango.
+        """
+        if fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        clave = ("rango", self.schema, fecha_inicio, fecha_fin)
+
+        def calcular():
+            return self._coalescer(
+                _vuelos_estadisticas,
+                clave,
+                lambda: self._calcular_estadisticas(fecha_inicio, fecha_fin),
+            )
+
+        return _cacheado(_cache_estadisticas, clave, self.residuos_repo.sesion, calcular)
+
+    def _calcular_estadisticas(self, fecha_inicio: date, fecha_fin: date) -> EstadisticasResponseDto:
+        # Rangos estándar precalculados por el planificador (ver precalcular_estadisticas)
+        precalculada = self.residuos_repo.obtener_precalculadas(fecha_inicio, fecha_fin)
+        if precalculada is not None:
+            metrics.incrementar("precalculadas.aciertos")
+            rows = precalculada["datos"]
+        else:
+            metrics.incrementar("precalculadas.fallos")
+            rows = self.residuos_repo.estadisticas_por_rango(fecha_inicio, fecha_fin)
+
+        if not rows:
+            raise ValueError("No existen registros en el rango indicado")
+
+        return self._construir_estadisticas(fecha_inicio, fecha_fin, rows)
+
+    def precalcular_estadisticas(self, fecha_inicio: date, fecha_fin: date) -> bool:
+        """
+        Guarda el agregado del rango en estadisticas_precalculadas (si no
+        estaba ya) para que todos los workers lo sirvan sin recalcularlo.
+        Las escrituras que tocan el rango lo descartan en su transacción.
+        """
+        if self.residuos_repo.obtener_precalculadas(fecha_inicio, fecha_fin) is not None:
+            return False
+        return self.residuos_repo.precalcular(fecha_inicio, fecha_fin)
+
+    @staticmethod
+    def _variacion(actual: float, base: float) -> Optional[float]:
+        if base == 0:
+            return None
+        return round((actual - base) / base * 100, 2)
+
+    def _calcular_deltas(self, estadisticas: list[EstadisticasResponseDto]) -> list[DeltaEstadisticasDto]:
+        """
+        Diferencias de cada rango respecto al primero (rango base), en
+        total y por tipo de residuo.
+        """
+        base = estadisticas[0]
+        base_por_tipo = {t.tipo_id: t for t in base.tipos}
+        deltas = []
+
+        for i, actual in enumerate(estadisticas[1:], start=1):
+            actual_por_tipo = {t.tipo_id: t for t in actual.tipos}
+            tipos = []
+
+            for tipo_id in sorted(base_por_tipo.keys() | actual_por_tipo.keys()):
+                t_base = base_por_tipo.get(tipo_id)
+                t_actual = actual_por_tipo.get(tipo_id)
+                kg_base = t_base.total_kg if t_base else 0.0
+                kg_actual = t_actual.total_kg if t_actual else 0.0
+
+                tipos.append(DeltaTipoDto(
+                    tipo_id=tipo_id,
+                    tipo_residuo=(t_actual or t_base).tipo_residuo,
+                    diferencia_kg=round(kg_actual - kg_base, 2),
+                    variacion_porcentaje=self._variacion(kg_actual, kg_base),
+                ))
+
+            deltas.append(DeltaEstadisticasDto(
+                rango_base=0,
+                rango=i,
+                diferencia_total_kg=round(actual.total_global_kg - base.total_global_kg, 2),
+                variacion_porcentaje=self._variacion(actual.total_global_kg, base.total_global_kg),
+                tipos=tipos,
+            ))
+
+        return deltas
+
+    def obtener_estadisticas_batch(self, rangos: list[tuple[date, date]]) -> EstadisticasBatchResponseDto:
+        """
+        Estadísticas de N rangos con una sola consulta. Un rango sin
+        registros devuelve total 0 en lugar de error, para poder
+        compararlo con los demás.
+        """
+        if not rangos:
+            raise ValueError("Debe indicar al menos un rango")
+        if len(rangos) > MAX_RANGOS_BATCH:
+            raise ValueError(f"Máximo {MAX_RANGOS_BATCH} rangos por consulta")
+        for fecha_inicio, fecha_fin in rangos:
+            if fecha_fin < fecha_inicio:
+                raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        clave = ("batch", self.schema, tuple(rangos))
+
+        def calcular():
+            return self._coalescer(
+                _vuelos_estadisticas,
+                clave,
+                lambda: self._calcular_estadisticas_batch(rangos),
+            )
+
+        return _cacheado(_cache_estadisticas, clave, self.residuos_repo.sesion, calcular)
+
+    def _calcular_estadisticas_batch(self, rangos: list[tuple[date, date]]) -> EstadisticasBatchResponseDto:
+        por_rango = defaultdict(list)
+        for r in self.residuos_repo.estadisticas_multi_rango(rangos):
+            por_rango[r["idx"]].append(r)
+
+        estadisticas = [
+            self._construir_estadisticas(fi, ff, por_rango[i])
+            for i, (fi, ff) in enumerate(rangos)
+        ]
+
+        return EstadisticasBatchResponseDto(
+            rangos=estadisticas,
+            deltas=self._calcular_deltas(estadisticas),
+        )
+
+
+    # ============================================================
+    # EXPORTACIÓN COLUMNAR
+    # ============================================================
+    @staticmethod
+    def _validar_export(fecha_inicio: date, fecha_fin: date, formato: str) -> None:
+        if fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+        if formato not in FORMATOS_EXPORT:
+            raise ValueError(f"Formato no soportado: {formato}. Use {', '.join(FORMATOS_EXPORT)}")
+
+    def exportar_registros(self, fecha_inicio: date, fecha_fin: date, formato: str):
+        """
+        Devuelve un archivo Parquet o Arrow IPC con los registros del rango,
+        construido por lotes desde un cursor de servidor.
+        """
+        self._validar_export(fecha_inicio, fecha_fin, formato)
+        lotes = self.residuos_repo.iterar_registros(
+            fecha_inicio, fecha_fin, settings.EXPORT_LOTE_FILAS
+        )
+        return escribir_export(formato, esquema_registros(), lotes)
+
+    def exportar_estadisticas_diarias(self, fecha_inicio: date, fecha_fin: date, formato: str):
+        self._validar_export(fecha_inicio, fecha_fin, formato)
+        lotes = self.residuos_repo.iterar_estadisticas_diarias(
+            fecha_inicio, fecha_fin, settings.EXPORT_LOTE_FILAS
+        )
+        return escribir_export(formato, esquema_estadisticas_diarias(), lotes)
+
+
+    # ============================================================
+    # ANOMALÍAS
+    # ============================================================
+    def actualizar_anomalias(self, registros: list[dict]) -> None:
+        """
+        Actualiza incrementalmente el estado de anomalías con los pares
+        (tipo, día) afectados por una ingesta o por un volcado del buffer
+        de escritura.
+
+        Solo se recalculan los totales de esos días. Cuando llega un día
+        posterior al último visto, el total del día anterior se incorpora
+        a la línea base EWMA del tipo. El día en curso se compara contra
+        esa línea base y se marca si supera ANOMALIA_UMBRAL_SIGMA. Los días
+        atrasados se evalúan pero no alteran la línea base.
+        """
+        pares = sorted(
+            {(r["tipo_residuo_id"], r["dia"]) for r in registros},
+            key=lambda p: (p[0], p[1]),
+        )
+        if not pares:
+            return
+
+        # Dentro de la unidad de trabajo de la ingesta (o de una propia);
+        # el savepoint evita que un fallo aquí deshaga los registros
+        with self._unidad_de_trabajo() as uow:
+            try:
+                with uow.savepoint():
+                    self._recalcular_anomalias(pares)
+            except Exception as e:
+                logger.error(f"Error actualizando anomalías: {e}")
+
+    def _recalcular_anomalias(self, pares: list[tuple[int, date]]) -> None:
+        totales = {
+            (t["tipo_residuo_id"], t["dia"]): float(t["total_kg"])
+            for t in self.anomalias_repo.recalcular_totales_diarios(pares)
+        }
+
+        tipos = sorted({tipo for tipo, _ in pares})
+        lineas = {
+            e["tipo_residuo_id"]: LineaBase(**e)
+            for e in self.anomalias_repo.bloquear_estados(tipos)
+        }
+
+        # Totales del último día visto de cada tipo, pendientes de incorporar
+        previos = [(l.tipo_residuo_id, l.ultimo_dia) for l in lineas.values() if l.ultimo_dia]
+        if previos:
+            for t in self.anomalias_repo.totales_diarios(previos):
+                totales.setdefault((t["tipo_residuo_id"], t["dia"]), float(t["total_kg"]))
+
+        dias_por_tipo = defaultdict(list)
+        for tipo, dia in pares:
+            dias_por_tipo[tipo].append(dia)
+
+        anomalias, normales = [], []
+        for tipo, dias in dias_por_tipo.items():
+            linea = lineas[tipo]
+
+            for dia in dias:
+                if linea.ultimo_dia is not None and dia > linea.ultimo_dia:
+                    total_previo = totales.get((tipo, linea.ultimo_dia))
+                    if total_previo is not None:
+                        linea.incorporar(total_previo, settings.ANOMALIA_ALPHA)
+                if linea.ultimo_dia is None or dia > linea.ultimo_dia:
+                    linea.ultimo_dia = dia
+
+                total = totales.get((tipo, dia))
+                z = linea.z_score(total) if total is not None else None
+
+                if (
+                    z is not None
+                    and linea.n >= settings.ANOMALIA_MIN_DIAS
+                    and z > settings.ANOMALIA_UMBRAL_SIGMA
+                ):
+                    anomalias.append(
+                        (tipo, dia, total, linea.media, math.sqrt(linea.varianza), z)
+                    )
+                else:
+                    normales.append((tipo, dia))
+
+        self.anomalias_repo.guardar_estados([
+            (l.tipo_residuo_id, l.n, l.media, l.varianza, l.ultimo_dia)
+            for l in lineas.values()
+        ])
+        if anomalias:
+            self.anomalias_repo.registrar_anomalias(anomalias)
+            logger.warning(f"{len(anomalias)} días anómalos detectados")
+        if normales:
+            self.anomalias_repo.descartar_anomalias(normales)
+
+    def reconstruir_lineas_base(self) -> int:
+        """
+        Backfill de la detección incremental para datos anteriores a ella:
+        recalcula los totales diarios de todo el histórico y rehace la
+        línea base EWMA de cada tipo con sus días cerrados (todos menos el
+        último, que queda como día en curso). No marca anomalías
+        históricas. Devuelve el número de tipos reconstruidos.
+        """
+        with self._unidad_de_trabajo():
+            self.anomalias_repo.recalcular_totales_historicos()
+            totales = self.anomalias_repo.totales_historicos()
+
+            tipos = sorted({t["tipo_residuo_id"] for t in totales})
+            if not tipos:
+                return 0
+            # Bloquea los estados frente a ingestas concurrentes
+            self.anomalias_repo.bloquear_estados(tipos)
+
+            lineas = {tipo: LineaBase(tipo) for tipo in tipos}
+            total_previo = {}
+            for t in totales:
+                linea = lineas[t["tipo_residuo_id"]]
+                if linea.ultimo_dia is not None:
+                    linea.incorporar(total_previo[linea.tipo_residuo_id], settings.ANOMALIA_ALPHA)
+                linea.ultimo_dia = t["dia"]
+                total_previo[linea.tipo_residuo_id] = float(t["total_kg"])
+
+            self.anomalias_repo.guardar_estados([
+                (l.tipo_residuo_id, l.n, l.media, l.varianza, l.ultimo_dia)
+                for l in lineas.values()
+            ])
+
+        logger.info(f"Líneas base de anomalías reconstruidas: {len(tipos)} tipos")
+        return len(tipos)
+
+    def listar_anomalias(self, fecha_inicio: date, fecha_fin: date) -> List[AnomaliaResiduoDto]:
+        if fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        rows = self.anomalias_repo.listar_por_rango(fecha_inicio, fecha_fin)
+        return [AnomaliaResiduoDto(**r) for r in rows]
+
 
     # ============================================================
     # ANÁLISIS IA
     # ============================================================
-    def generar_analisis(self, dto: AnalisisIARequestDto) -> AnalisisIAResponseDto:
+    def generar_analisis(self, dto: AnalisisIARequestDto, modo: str = "completo") -> AnalisisIAResponseDto:
+        """
+        Peticiones idénticas concurrentes comparten una sola llamada al
+        modelo y un solo análisis guardado.
+
+        - completo: todos los registros del rango en un único prompt
+        - jerarquico: reduce resúmenes semanales cacheados (ver
+          `_generar_analisis_jerarquico`)
+        """
+        if modo not in MODOS_ANALISIS:
+            raise ValueError(f"Modo no soportado: {modo}. Use uno de {', '.join(MODOS_ANALISIS)}")
+
+        generar = self._generar_analisis if modo == "completo" else self._generar_analisis_jerarquico
+        return self._coalescer(
+            _vuelos_analisis,
+            (modo, self.schema, dto.fecha_inicio, dto.fecha_fin),
+            lambda: generar(dto),
+        )
+
+    def _generar_analisis(self, dto: AnalisisIARequestDto) -> AnalisisIAResponseDto:
 
         if dto.fecha_fin < dto.fecha_inicio:
             raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
@@ -279,6 +810,7 @@ class WasteService:
             raise ValueError("No existen registros en el rango indicado")
 
         # 2. Construir texto enriquecido para la IA
+        inicio_prompt = time.perf_counter()
         texto_registros = "\n".join(
             f"{r['dia']} — {r['tipo_residuo']} "
             f"({r['descripcion_tipo_residuo']}): "
@@ -312,19 +844,19 @@ class WasteService:
 
         Responde en español, con un tono profesional y claro.
         """
+        prompt_ms = (time.perf_counter() - inicio_prompt) * 1000
 
         # 4. Llamada a Azure OpenAI
+        # Sin ranura libre se responde 503 en vez de encolar la llamada
         try:
-            resp = self.ai_client.chat.completions.create(
-                model=settings.AZURE_OPENAI_DEPLOYMENT,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.4,
-            )
-            texto_ai = resp.choices[0].message.content
-
+            texto_ai, uso = completar(prompt, temperature=0.4)
+        except CapacidadAgotadaError:
+            raise
         except Exception as e:
             logger.error(f"Error generando análisis IA: {e}")
             raise RuntimeError("Error al generar análisis con IA")
+        uso.prompt_ms = prompt_ms
+        uso.registros_entrada = len(registros)
 
         # 5. Guardar en BD
         row = self.analisis_repo.crear(
@@ -333,6 +865,7 @@ class WasteService:
             resumen="Resumen automático generado por IA",
             recomendaciones=texto_ai,
             modelo_usado=settings.AZURE_OPENAI_DEPLOYMENT,
+            uso=uso,
         )
 
         logger.info(f"Análisis IA creado {row}")
@@ -340,26 +873,251 @@ class WasteService:
         return AnalisisIAResponseDto(**row)
     
 
+    @staticmethod
+    def _prompt_resumen_semanal(fecha_inicio: date, fecha_fin: date, registros: list[dict]) -> str:
+        texto_registros = "\n".join(
+            f"{r['dia']} — {r['tipo_residuo']} "
+            f"({r['descripcion_tipo_residuo']}): "
+            f"{float(r['cantidad_kg'])} kg"
+            for r in registros
+        )
+        return f"""
+        Eres un especialista en gestión de residuos en comedores industriales.
+
+        Registros de residuos de la semana del {fecha_inicio} al {fecha_fin}:
+        {texto_registros}
+
+        Resume la semana en un máximo de 150 palabras: totales aproximados
+        por tipo, días con picos o reducciones e irregularidades observadas.
+        Este resumen se combinará con los de otras semanas, así que incluye
+        solo hechos, sin recomendaciones.
+
+        Responde en español.
+        """
+
+    @staticmethod
+    def _prompt_reduccion(fecha_inicio: date, fecha_fin: date, resumenes: list[tuple[date, date, str]]) -> str:
+        texto_resumenes = "\n\n".join(
+            f"Semana {fi} — {ff}:\n{resumen}" for fi, ff, resumen in resumenes
+        )
+        return f"""
+        Eres un especialista en gestión de residuos en comedores industriales.
+
+        A continuación se muestran resúmenes semanales de los residuos generados
+        entre el {fecha_inicio} y el {fecha_fin}, en orden cronológico:
+
+        {texto_resumenes}
+
+        Con esta información, genera:
+
+        1. Un análisis narrativo del comportamiento de los residuos durante el periodo.
+        2. Observaciones sobre la evolución semana a semana (picos, reducciones, irregularidades).
+        3. Posibles causas operativas que expliquen estos cambios.
+        4. Recomendaciones prácticas aplicables al funcionamiento diario del comedor.
+        5. Oportunidades simples de valorización basadas en los tipos observados.
+
+        Responde en español, con un tono profesional y claro.
+        """
+
+    def _generar_analisis_jerarquico(self, dto: AnalisisIARequestDto) -> AnalisisIAResponseDto:
+        """
+        Análisis map-reduce por semanas naturales:
+
+        1. map: cada semana se resume una vez y se guarda en
+           resumenes_semanales con la huella de sus registros
+        2. solo se vuelven a resumir las semanas cuya huella cambió
+        3. reduce: el informe final se genera a partir de los resúmenes
+
+        El coste en tokens y latencia es proporcional a las semanas
+        modificadas, no a los registros del rango.
+        """
+        if dto.fecha_fin < dto.fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        semanas = self.residuos_repo.huellas_semanales(dto.fecha_inicio, dto.fecha_fin)
+        if not semanas:
+            raise ValueError("No existen registros en el rango indicado")
+
+        cache = {
+            (r["fecha_inicio"], r["fecha_fin"]): r
+            for r in self.analisis_repo.resumenes_semanales(dto.fecha_inicio, dto.fecha_fin)
+        }
+        resumenes: dict[tuple[date, date], str] = {}
+        pendientes = []
+        for semana in semanas:
+            clave = (semana["fecha_inicio"], semana["fecha_fin"])
+            previo = cache.get(clave)
+            if previo is not None and previo["huella"] == semana["huella"]:
+                resumenes[clave] = previo["resumen"]
+            else:
+                pendientes.append(semana)
+
+        metrics.incrementar("resumen_semanal.reutilizados", len(semanas) - len(pendientes))
+        metrics.incrementar("resumen_semanal.generados", len(pendientes))
+
+        # Contabilidad del análisis completo: todas las llamadas (map y
+        # reduce) y la latencia total de la fase de modelo
+        uso = UsoLLM(registros_entrada=sum(int(s["registros"]) for s in semanas))
+
+        # 1. Map: resumir solo las semanas nuevas o modificadas
+        if pendientes:
+            rangos = [(s["fecha_inicio"], s["fecha_fin"]) for s in pendientes]
+            por_semana = defaultdict(list)
+            for r in self.residuos_repo.listar_por_rangos(rangos):
+                por_semana[r["idx"]].append(r)
+
+            inicio_prompt = time.perf_counter()
+            prompts = {i: self._prompt_resumen_semanal(fi, ff, por_semana[i]) for i, (fi, ff) in enumerate(rangos)}
+            uso.prompt_ms += (time.perf_counter() - inicio_prompt) * 1000
+
+            inicio_llm = time.perf_counter()
+            resultados, errores = self._llamar_modelo_en_paralelo(
+                prompts, "Resúmenes semanales", interactivo=True
+            )
+            uso.llm_ms += (time.perf_counter() - inicio_llm) * 1000
+            for _, uso_semana in resultados.values():
+                uso.tokens_prompt += uso_semana.tokens_prompt
+                uso.tokens_completion += uso_semana.tokens_completion
+                uso.reintentos += uso_semana.reintentos
+
+            # Los resúmenes obtenidos se guardan aunque otra semana falle.
+            # Si los registros cambian entre la huella y la lectura, la huella
+            # guardada no coincidirá con la siguiente y la semana se rehace.
+            if resultados:
+                self.analisis_repo.guardar_resumenes_semanales([
+                    (
+                        *rangos[i],
+                        pendientes[i]["huella"],
+                        pendientes[i]["registros"],
+                        texto,
+                        settings.AZURE_OPENAI_DEPLOYMENT,
+                        uso_semana.tokens_prompt,
+                        uso_semana.tokens_completion,
+                    )
+                    for i, (texto, uso_semana) in resultados.items()
+                ])
+                for i, (texto, _) in resultados.items():
+                    resumenes[rangos[i]] = texto
+
+            if errores:
+                raise RuntimeError("Error al generar análisis con IA")
+
+        # 2. Reduce: informe del rango completo a partir de los resúmenes
+        inicio_prompt = time.perf_counter()
+        prompt = self._prompt_reduccion(
+            dto.fecha_inicio,
+            dto.fecha_fin,
+            [(fi, ff, resumenes[(fi, ff)]) for fi, ff in sorted(resumenes)],
+        )
+        uso.prompt_ms += (time.perf_counter() - inicio_prompt) * 1000
+        try:
+            texto_ai, uso_reduccion = self._llamar_modelo_lote(prompt, interactivo=True)
+        except CapacidadAgotadaError:
+            raise
+        except Exception as e:
+            logger.error(f"Error generando análisis jerárquico: {e}")
+            raise RuntimeError("Error al generar análisis con IA")
+        uso.llm_ms += uso_reduccion.llm_ms
+        uso.tokens_prompt += uso_reduccion.tokens_prompt
+        uso.tokens_completion += uso_reduccion.tokens_completion
+        uso.reintentos += uso_reduccion.reintentos
+
+        row = self.analisis_repo.crear(
+            fecha_inicio=dto.fecha_inicio,
+            fecha_fin=dto.fecha_fin,
+            resumen=(
+                f"Análisis jerárquico generado por IA ({len(semanas)} semanas, "
+                f"{len(pendientes)} resumidas de nuevo)"
+            ),
+            recomendaciones=texto_ai,
+            modelo_usado=settings.AZURE_OPENAI_DEPLOYMENT,
+            uso=uso,
+        )
+
+        logger.info(
+            f"Análisis jerárquico {dto.fecha_inicio} - {dto.fecha_fin}: "
+            f"{len(semanas) - len(pendientes)}/{len(semanas)} semanas reutilizadas"
+        )
+        return AnalisisIAResponseDto(**row)
+
     def generar_analisis_estadistico(self, fecha_inicio: date, fecha_fin: date) -> AnalisisIAResponseDto:
+        """
+        Si el planificador ya generó el informe del rango y sus datos no
+        han cambiado desde entonces, se devuelve ese análisis sin llamar
+        al modelo.
+        """
+        return self._coalescer(
+            _vuelos_analisis,
+            ("estadistico", self.schema, fecha_inicio, fecha_fin),
+            lambda: self._generar_analisis_estadistico(fecha_inicio, fecha_fin),
+        )
+
+    def _generar_analisis_estadistico(self, fecha_inicio: date, fecha_fin: date) -> AnalisisIAResponseDto:
 
         if fecha_fin < fecha_inicio:
             raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
 
+        # Informe nocturno aún vigente: los datos del rango no han cambiado
+        # desde que se generó
+        precalculada = self.residuos_repo.obtener_precalculadas(fecha_inicio, fecha_fin)
+        if precalculada is not None and precalculada["analisis_id"] is not None:
+            row = self.analisis_repo.obtener_por_id(precalculada["analisis_id"])
+            if row is not None:
+                metrics.incrementar("informe_precalculado.reutilizados")
+                return AnalisisIAResponseDto(**row)
+
         # 1. Obtener estadísticas reales
-        stats = self.residuos_repo.estadisticas_por_rango(fecha_inicio, fecha_fin)
+        if precalculada is not None:
+            stats = precalculada["datos"]
+        else:
+            stats = self.residuos_repo.estadisticas_por_rango(fecha_inicio, fecha_fin)
         if not stats:
             raise ValueError("No existen registros en el rango indicado")
 
+        # 2. Convertir estadísticas a texto para IA
+        inicio_prompt = time.perf_counter()
+        prompt = self._prompt_estadistico(stats)
+        prompt_ms = (time.perf_counter() - inicio_prompt) * 1000
+
+        # Sin ranura libre se responde 503 en vez de encolar la llamada
+        try:
+            texto_ai, uso = completar(prompt, temperature=0.3)
+        except CapacidadAgotadaError:
+            raise
+        except Exception as e:
+            logger.error(f"Error IA: {e}")
+            raise RuntimeError("Error al generar análisis con IA")
+        uso.prompt_ms = prompt_ms
+        uso.registros_entrada = sum(int(s["cantidad_registros"]) for s in stats)
+
+        # 5. Guardar en BD
+        with self._unidad_de_trabajo():
+            row = self.analisis_repo.crear(
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin,
+                resumen="Análisis estadístico avanzado generado por IA",
+                recomendaciones=texto_ai,
+                modelo_usado=settings.AZURE_OPENAI_DEPLOYMENT,
+                uso=uso,
+            )
+            if precalculada is not None:
+                self.residuos_repo.vincular_analisis_precalculado(
+                    fecha_inicio, fecha_fin, precalculada["fecha_calculo"], row["id"]
+                )
+
+        return AnalisisIAResponseDto(**row)
+
+    @staticmethod
+    def _prompt_estadistico(stats: list[dict]) -> str:
         total_global = sum(float(s["total_kg"]) for s in stats)
 
-        # 2. Convertir estadísticas a texto para IA
         texto_stats = "\n".join(
             f"{s['tipo_residuo']} ({s['descripcion_tipo_residuo']}): "
             f"{float(s['total_kg'])} kg — {round((float(s['total_kg'])/total_global)*100, 2)}%"
             for s in stats
         )
 
-        prompt = f"""
+        return f"""
     Eres un especialista en gestión de residuos industriales.
 
     Usa las siguientes estadísticas para generar un informe avanzado.
@@ -380,36 +1138,256 @@ class WasteService:
     Responde solo en español.
     """
 
-        try:
-            resp = self.ai_client.chat.completions.create(
-                model=settings.AZURE_OPENAI_DEPLOYMENT,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-            )
-            texto_ai = resp.choices[0].message.content
 
-        except Exception as e:
-            logger.error(f"Error IA: {e}")
-            raise RuntimeError("Error al generar análisis con IA")
+    # ============================================================
+    # ANÁLISIS EN LOTE
+    # ============================================================
+    @staticmethod
+    def _expandir_periodo(fecha_inicio: date, fecha_fin: date, periodo: str) -> list[tuple[date, date]]:
+        """
+        Divide [fecha_inicio, fecha_fin] en semanas (lunes a domingo) o
+        meses naturales; el primer y el último tramo se recortan al rango.
+        """
+        if fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
 
-        # 5. Guardar en BD
-        row = self.analisis_repo.crear(
-            fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin,
-            resumen="Análisis estadístico avanzado generado por IA",
-            recomendaciones=texto_ai,
-            modelo_usado=settings.AZURE_OPENAI_DEPLOYMENT,
+        tramos = []
+        if periodo == "semana":
+            actual = fecha_inicio - timedelta(days=fecha_inicio.weekday())
+            while actual <= fecha_fin:
+                fin = actual + timedelta(days=6)
+                tramos.append((max(actual, fecha_inicio), min(fin, fecha_fin)))
+                actual = fin + timedelta(days=1)
+        elif periodo == "mes":
+            actual = fecha_inicio.replace(day=1)
+            while actual <= fecha_fin:
+                siguiente = (actual + timedelta(days=32)).replace(day=1)
+                tramos.append((max(actual, fecha_inicio), min(siguiente - timedelta(days=1), fecha_fin)))
+                actual = siguiente
+        else:
+            raise ValueError(f"Periodo no soportado: {periodo}")
+        return tramos
+
+    def _llamar_modelo_lote(self, prompt: str, interactivo: bool = False) -> tuple[str, UsoLLM]:
+        # Una petición interactiva no espera ranura más de LLM_SLOT_TIMEOUT_S
+        timeout_ranura = None if interactivo else settings.ANALISIS_BATCH_SLOT_TIMEOUT_S
+        return completar(prompt, temperature=0.3, timeout_ranura=timeout_ranura)
+
+    def _llamar_modelo_en_paralelo(
+        self, prompts: dict, etiqueta: str, interactivo: bool = False
+    ) -> tuple[dict, dict]:
+        """
+        Lanza un prompt por clave en ANALISIS_BATCH_CONCURRENCIA hilos.
+        Devuelve {clave: (texto, UsoLLM)} para las llamadas correctas y
+        {clave: excepción} para las fallidas.
+        """
+        resultados, errores = {}, {}
+        if not prompts:
+            return resultados, errores
+
+        hilos = min(settings.ANALISIS_BATCH_CONCURRENCIA, len(prompts))
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="analisis-lote") as pool:
+            # Los hilos hijos se muestrean con la petición si se está perfilando
+            llamar = propagar_perfil(self._llamar_modelo_lote)
+            futuros = {pool.submit(llamar, p, interactivo): clave for clave, p in prompts.items()}
+            for completados, futuro in enumerate(as_completed(futuros), start=1):
+                clave = futuros[futuro]
+                try:
+                    resultados[clave] = futuro.result()
+                except Exception as e:
+                    logger.error(f"{etiqueta}: error IA en {clave}: {e}")
+                    errores[clave] = e
+                logger.info(f"{etiqueta}: {completados}/{len(prompts)} completados")
+
+        return resultados, errores
+
+    def generar_analisis_batch(
+        self, rangos: list[tuple[date, date]], periodos: list[tuple[date, date, str]]
+    ) -> AnalisisBatchResponseDto:
+        """
+        Genera el análisis estadístico de muchos periodos a la vez:
+
+        - las estadísticas de todos los rangos salen de una sola consulta
+        - las llamadas al modelo se reparten en ANALISIS_BATCH_CONCURRENCIA
+          hilos, respetando el límite global de ranuras del modelo
+        - los análisis generados se guardan con un único INSERT multi-fila
+
+        Un rango sin registros o cuya llamada falla no invalida el resto.
+        """
+        todos = list(rangos)
+        for fecha_inicio, fecha_fin, periodo in periodos:
+            todos += self._expandir_periodo(fecha_inicio, fecha_fin, periodo)
+        todos = list(dict.fromkeys(todos))
+
+        if not todos:
+            raise ValueError("Debe indicar al menos un rango o periodo")
+        if len(todos) > settings.ANALISIS_BATCH_MAX_RANGOS:
+            raise ValueError(f"Máximo {settings.ANALISIS_BATCH_MAX_RANGOS} rangos por lote")
+        for fecha_inicio, fecha_fin in todos:
+            if fecha_fin < fecha_inicio:
+                raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        inicio = time.perf_counter()
+
+        # 1. Estadísticas de todos los rangos en una consulta
+        por_rango = defaultdict(list)
+        for r in self.residuos_repo.estadisticas_multi_rango(todos):
+            por_rango[r["idx"]].append(r)
+
+        items = [
+            AnalisisBatchItemDto(fecha_inicio=fi, fecha_fin=ff, estado="sin_datos")
+            for fi, ff in todos
+        ]
+        pendientes = [i for i in range(len(todos)) if por_rango[i]]
+        textos: dict[int, str] = {}
+
+        # 2. Llamadas al modelo con paralelismo acotado
+        prompts, prompt_ms = {}, {}
+        for i in pendientes:
+            inicio_prompt = time.perf_counter()
+            prompts[i] = self._prompt_estadistico(por_rango[i])
+            prompt_ms[i] = (time.perf_counter() - inicio_prompt) * 1000
+
+        resultados, errores = self._llamar_modelo_en_paralelo(prompts, "Análisis en lote")
+        for i, e in errores.items():
+            items[i].estado = "error"
+            items[i].error = str(e)
+        usos: dict[int, UsoLLM] = {}
+        for i, (texto, uso) in resultados.items():
+            uso.prompt_ms = prompt_ms[i]
+            uso.registros_entrada = sum(int(r["cantidad_registros"]) for r in por_rango[i])
+            textos[i] = texto
+            usos[i] = uso
+            items[i].tokens_prompt = uso.tokens_prompt
+            items[i].tokens_completion = uso.tokens_completion
+
+        # 3. Guardar todos los análisis generados de una vez
+        if textos:
+            filas = self.analisis_repo.crear_lote([
+                (
+                    todos[i][0],
+                    todos[i][1],
+                    "Análisis estadístico avanzado generado por IA",
+                    textos[i],
+                    settings.AZURE_OPENAI_DEPLOYMENT,
+                    *usos[i].columnas(),
+                )
+                for i in sorted(textos)
+            ])
+            ids = {(f["fecha_inicio"], f["fecha_fin"]): f["id"] for f in filas}
+            for i in textos:
+                items[i].estado = "generado"
+                items[i].analisis_id = ids[todos[i]]
+
+        tokens_prompt = sum(it.tokens_prompt for it in items)
+        tokens_completion = sum(it.tokens_completion for it in items)
+        coste = (
+            tokens_prompt / 1000 * settings.LLM_COSTE_PROMPT_1K_USD
+            + tokens_completion / 1000 * settings.LLM_COSTE_COMPLETION_1K_USD
         )
 
-        return AnalisisIAResponseDto(**row)
+        reporte = AnalisisBatchResponseDto(
+            total=len(items),
+            generados=sum(1 for it in items if it.estado == "generado"),
+            sin_datos=sum(1 for it in items if it.estado == "sin_datos"),
+            fallidos=sum(1 for it in items if it.estado == "error"),
+            tokens_prompt=tokens_prompt,
+            tokens_completion=tokens_completion,
+            coste_estimado_usd=round(coste, 6),
+            duracion_s=round(time.perf_counter() - inicio, 3),
+            items=items,
+        )
+        logger.info(
+            f"Análisis en lote: {reporte.generados}/{reporte.total} generados, "
+            f"{reporte.fallidos} fallidos, {tokens_prompt + tokens_completion} tokens, "
+            f"~{reporte.coste_estimado_usd} USD en {reporte.duracion_s} s"
+        )
+        return reporte
 
 
     # ============================================================
     # OBTENER ANÁLISIS
     # ============================================================
-    def listar_analisis(self) -> List[AnalisisIAResponseDto]:
-        rows = self.analisis_repo.listar()
-        return [AnalisisIAResponseDto(**r) for r in rows]
+    @staticmethod
+    def _codificar_cursor(fecha_creacion: datetime, analisis_id: int) -> str:
+        valor = f"{fecha_creacion.isoformat()}|{analisis_id}"
+        return base64.urlsafe_b64encode(valor.encode()).decode()
+
+    @staticmethod
+    def _decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+        try:
+            valor = base64.urlsafe_b64decode(cursor.encode()).decode()
+            fecha_str, id_str = valor.split("|", 1)
+            return datetime.fromisoformat(fecha_str), int(id_str)
+        except Exception:
+            raise ValueError("Cursor de paginación inválido")
+
+    def listar_analisis(
+        self,
+        limite: int = 20,
+        cursor: Optional[str] = None,
+        fecha_inicio: Optional[date] = None,
+        fecha_fin: Optional[date] = None,
+        modelo: Optional[str] = None,
+    ) -> ListarAnalisisResponseDto:
+        if fecha_inicio and fecha_fin and fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        cursor_fecha, cursor_id = self._decodificar_cursor(cursor) if cursor else (None, None)
+
+        # Se pide una fila extra para saber si hay página siguiente
+        rows = self.analisis_repo.listar_resumen(
+            limite=limite + 1,
+            cursor_fecha=cursor_fecha,
+            cursor_id=cursor_id,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            modelo=modelo,
+        )
+
+        siguiente = None
+        if len(rows) > limite:
+            rows = rows[:limite]
+            ultimo = rows[-1]
+            siguiente = self._codificar_cursor(ultimo["fecha_creacion"], ultimo["id"])
+
+        return ListarAnalisisResponseDto(
+            items=[AnalisisIAResumenDto(**r) for r in rows],
+            siguiente_cursor=siguiente,
+        )
+
+    def metricas_llm(self, fecha_inicio: date, fecha_fin: date) -> List[MetricasLLMDto]:
+        """
+        Latencia (p50/p95) y consumo de tokens del modelo por día y
+        modelo, con el coste estimado según LLM_COSTE_*_1K_USD.
+        """
+        if fecha_fin < fecha_inicio:
+            raise ValueError("La fecha fin debe ser mayor o igual a la fecha inicio")
+
+        metricas = []
+        for r in self.analisis_repo.metricas_llm(fecha_inicio, fecha_fin):
+            tokens_prompt = int(r["tokens_prompt"] or 0)
+            tokens_completion = int(r["tokens_completion"] or 0)
+            coste = (
+                tokens_prompt / 1000 * settings.LLM_COSTE_PROMPT_1K_USD
+                + tokens_completion / 1000 * settings.LLM_COSTE_COMPLETION_1K_USD
+            )
+            metricas.append(MetricasLLMDto(
+                dia=r["dia"],
+                modelo=r["modelo"],
+                analisis=r["analisis"],
+                llm_ms_p50=round(r["llm_ms_p50"], 1),
+                llm_ms_p95=round(r["llm_ms_p95"], 1),
+                prompt_ms_p50=round(r["prompt_ms_p50"] or 0, 3),
+                tokens_prompt=tokens_prompt,
+                tokens_completion=tokens_completion,
+                tokens_prompt_p50=r["tokens_prompt_p50"] or 0,
+                tokens_prompt_p95=r["tokens_prompt_p95"] or 0,
+                reintentos=int(r["reintentos"] or 0),
+                registros_entrada_media=round(float(r["registros_entrada_media"] or 0), 1),
+                coste_estimado_usd=round(coste, 6),
+            ))
+        return metricas
 
     def obtener_analisis_por_id(self, analisis_id: int) -> AnalisisIAResponseDto:
         row = self.analisis_repo.obtener_por_id(analisis_id)
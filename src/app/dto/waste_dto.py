@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import date, datetime
-from typing import Optional
+from typing import Literal, Optional
 
 # ==============================
 # Tipos de residuos
@@ -21,6 +21,7 @@ class CrearResiduoRequestDto(BaseModel):
     dia: date
     cantidad_kg: float
     tipo_residuo_id: int
+    source_line_id: Optional[str] = None
 
 class CrearResiduoResponseDto(CrearResiduoRequestDto):
     id: int
@@ -53,6 +54,41 @@ class AnalisisIAResponseDto(BaseModel):
     modelo_usado: str
     fecha_creacion: Optional[datetime] = None
 
+    # Contabilidad del modelo (None en análisis antiguos)
+    tokens_prompt: Optional[int] = None
+    tokens_completion: Optional[int] = None
+    prompt_ms: Optional[float] = None
+    llm_ms: Optional[float] = None
+    reintentos: Optional[int] = None
+    registros_entrada: Optional[int] = None
+
+class AnalisisIAResumenDto(BaseModel):
+    id: int
+    fecha_inicio: date
+    fecha_fin: date
+    resumen: Optional[str]
+    modelo_usado: str
+    fecha_creacion: Optional[datetime] = None
+
+class ListarAnalisisResponseDto(BaseModel):
+    items: list[AnalisisIAResumenDto]
+    siguiente_cursor: Optional[str] = None
+
+class MetricasLLMDto(BaseModel):
+    dia: date
+    modelo: str
+    analisis: int
+    llm_ms_p50: float
+    llm_ms_p95: float
+    prompt_ms_p50: float
+    tokens_prompt: int
+    tokens_completion: int
+    tokens_prompt_p50: float
+    tokens_prompt_p95: float
+    reintentos: int
+    registros_entrada_media: float
+    coste_estimado_usd: float
+
 
 
 ## estadisticaa
@@ -75,3 +111,86 @@ class EstadisticasResponseDto(BaseModel):
     fecha_fin: str
     total_global_kg: float
     tipos: list[EstadisticaTipoDto]
+
+class RangoFechasDto(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
+
+class EstadisticasBatchRequestDto(BaseModel):
+    rangos: list[RangoFechasDto]
+
+class DeltaTipoDto(BaseModel):
+    tipo_id: int
+    tipo_residuo: str
+    diferencia_kg: float
+    variacion_porcentaje: Optional[float] = None
+
+class DeltaEstadisticasDto(BaseModel):
+    rango_base: int
+    rango: int
+    diferencia_total_kg: float
+    variacion_porcentaje: Optional[float] = None
+    tipos: list[DeltaTipoDto]
+
+class EstadisticasBatchResponseDto(BaseModel):
+    rangos: list[EstadisticasResponseDto]
+    deltas: list[DeltaEstadisticasDto]
+
+
+## anomalías
+
+class AnomaliaResiduoDto(BaseModel):
+    tipo_residuo_id: int
+    tipo_residuo: str
+    dia: date
+    total_kg: float
+    media_base_kg: float
+    desviacion_base_kg: float
+    z_score: float
+    fecha_deteccion: Optional[datetime] = None
+
+
+## análisis en lote
+
+class PeriodoRodanteDto(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
+    periodo: Literal["semana", "mes"]
+
+class AnalisisBatchRequestDto(BaseModel):
+    rangos: list[RangoFechasDto] = []
+    periodos: list[PeriodoRodanteDto] = []
+
+class AnalisisBatchItemDto(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
+    estado: Literal["generado", "sin_datos", "error"]
+    analisis_id: Optional[int] = None
+    error: Optional[str] = None
+    tokens_prompt: int = 0
+    tokens_completion: int = 0
+
+class AnalisisBatchResponseDto(BaseModel):
+    total: int
+    generados: int
+    sin_datos: int
+    fallidos: int
+    tokens_prompt: int
+    tokens_completion: int
+    coste_estimado_usd: float
+    duracion_s: float
+    items: list[AnalisisBatchItemDto]
+
+
+## dashboard en vivo
+
+class DashboardMensajeDto(BaseModel):
+    # snapshot: estado completo al suscribirse; delta: tipos cuyo total
+    # cambió (valores absolutos) y registros nuevos desde el último mensaje
+    tipo: Literal["snapshot", "delta"]
+    fecha_inicio: date
+    fecha_fin: date
+    total_global_kg: float
+    tipos: list[EstadisticaTipoDto]
+    registros: list[ListarResiduosResponseDto] = []
+    registros_truncados: bool = False
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CapacidadAgotadaError(Exception):
+    """
+    Un recurso compartido (conexiones a la BD, ranuras del modelo) está
+    saturado; la petición debe reintentarse pasados `retry_after` segundos.
+    """
+
+    def __init__(self, recurso: str, retry_after: int | None = None):
+        super().__init__(f"Capacidad agotada: {recurso}")
+        self.recurso = recurso
+        self.retry_after = retry_after if retry_after is not None else settings.ADMISSION_RETRY_AFTER_S
+
+
+# ============================================================
+#  Límite síncrono (hilos del threadpool)
+# ============================================================
+class LimiteRecurso:
+    """
+    Semáforo con espera acotada: si no hay hueco en `timeout` segundos
+    se lanza CapacidadAgotadaError en lugar de seguir esperando.
+    """
+
+    def __init__(self, recurso: str, maximo: int, timeout: float):
+        self.recurso = recurso
+        self.maximo = maximo
+        self.timeout = timeout
+        self._semaforo = threading.BoundedSemaphore(maximo)
+
+    @contextmanager
+    def ocupar(self, timeout: float | None = None):
+        espera = self.timeout if timeout is None else timeout
+        if not self._semaforo.acquire(timeout=espera):
+            metrics.incrementar(f"admision.rechazos.{self.recurso}")
+            raise CapacidadAgotadaError(self.recurso)
+        try:
+            yield
+        finally:
+            self._semaforo.release()
+
+
+_lock = threading.Lock()
+_limite_llm: LimiteRecurso | None = None
+
+
+def ranura_llm(timeout: float | None = None):
+    """
+    Reserva una de las LLM_MAX_CONCURRENTES llamadas simultáneas al modelo.
+    `timeout` sustituye a LLM_SLOT_TIMEOUT_S (los lotes esperan más).
+    """
+    global _limite_llm
+
+    if _limite_llm is None:
+        with _lock:
+            if _limite_llm is None:
+                _limite_llm = LimiteRecurso(
+                    "llm", settings.LLM_MAX_CONCURRENTES, settings.LLM_SLOT_TIMEOUT_S
+                )
+    return _limite_llm.ocupar(timeout)
+
+
+# ============================================================
+#  Grupos de admisión (event loop)
+# ============================================================
+class GrupoAdmision:
+    """
+    Concurrencia máxima de un grupo de rutas con una cola acotada.
+    Si la cola está llena, o la espera supera el timeout, la petición se
+    rechaza de inmediato en lugar de acumularse en el threadpool.
+    """
+
+    def __init__(self, nombre: str, max_concurrentes: int, max_cola: int):
+        self.nombre = nombre
+        self.max_concurrentes = max_concurrentes
+        self.max_cola = max_cola
+        self.activas = 0
+        self.en_cola = 0
+        self._semaforo = asyncio.Semaphore(max_concurrentes)
+
+    async def entrar(self, timeout: float) -> bool:
+        if not self._semaforo.locked():
+            await self._semaforo.acquire()
+        else:
+            if self.en_cola >= self.max_cola:
+                return False
+            self.en_cola += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.en_cola -= 1
+
+        self.activas += 1
+        return True
+
+    def salir(self) -> None:
+        self.activas -= 1
+        self._semaforo.release()
+
+
+_grupos: Dict[str, GrupoAdmision] = {}
+
+
+def grupo_admision(nombre: str) -> GrupoAdmision:
+    if nombre not in _grupos:
+        maximo, cola = settings.ADMISSION_LIMITES.get(
+            nombre, settings.ADMISSION_LIMITES["general"]
+        )
+        _grupos[nombre] = GrupoAdmision(nombre, maximo, cola)
+    return _grupos[nombre]
+
+
+def estado_admision() -> Dict[str, Dict[str, int]]:
+    return {
+        nombre: {
+            "activas": g.activas,
+            "en_cola": g.en_cola,
+            "max_concurrentes": g.max_concurrentes,
+            "max_cola": g.max_cola,
+        }
+        for nombre, g in _grupos.items()
+    }
@@ -0,0 +1,101 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+from app.infrastructure.admission import ranura_llm
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cliente = None
+
+
+def get_ai_client():
+    """
+    Devuelve el cliente de Azure OpenAI compartido por el proceso.
+
+    El SDK (openai + httpx) se importa y el cliente se construye en el
+    primer uso, no al importar la aplicación. Los reintentos del SDK se
+    desactivan: los hace `completar` para poder contarlos.
+    """
+    global _cliente
+
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                from openai import AzureOpenAI
+
+                _cliente = AzureOpenAI(
+                    azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+                    api_key=settings.AZURE_OPENAI_KEY,
+                    api_version="2024-05-01-preview",
+                    max_retries=0,
+                )
+    return _cliente
+
+
+@dataclass
+class UsoLLM:
+    """
+    Contabilidad de un análisis: tokens, tiempo de construcción del
+    prompt, latencia del modelo (con reintentos y esperas), reintentos y
+    filas de entrada.
+    """
+
+    tokens_prompt: int = 0
+    tokens_completion: int = 0
+    prompt_ms: float = 0.0
+    llm_ms: float = 0.0
+    reintentos: int = 0
+    registros_entrada: int = 0
+
+    def columnas(self) -> tuple:
+        # Orden de las columnas de contabilidad de analisis_ia
+        return (
+            self.tokens_prompt,
+            self.tokens_completion,
+            round(self.prompt_ms, 3),
+            round(self.llm_ms, 3),
+            self.reintentos,
+            self.registros_entrada,
+        )
+
+
+def completar(prompt: str, temperature: float, timeout_ranura: float | None = None) -> tuple[str, UsoLLM]:
+    """
+    Una llamada de chat al modelo dentro de una ranura LLM. Los errores
+    transitorios (429, 5xx, conexión y timeout) se reintentan hasta
+    LLM_MAX_REINTENTOS veces con espera exponencial y jitter.
+    """
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    uso = UsoLLM()
+    with ranura_llm(timeout=timeout_ranura):
+        inicio = time.perf_counter()
+        for intento in range(settings.LLM_MAX_REINTENTOS + 1):
+            try:
+                resp = get_ai_client().chat.completions.create(
+                    model=settings.AZURE_OPENAI_DEPLOYMENT,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                )
+                break
+            except (APIConnectionError, InternalServerError, RateLimitError) as e:
+                if intento == settings.LLM_MAX_REINTENTOS:
+                    raise
+                espera = settings.LLM_REINTENTO_BASE_S * 2 ** intento * (1 + random.random())
+                uso.reintentos += 1
+                metrics.incrementar("llm.reintentos")
+                logger.warning(f"Error transitorio del modelo ({type(e).__name__}), reintento en {espera:.2f}s")
+                time.sleep(espera)
+        uso.llm_ms = (time.perf_counter() - inicio) * 1000
+
+    metrics.incrementar("llm.llamadas")
+    consumo = getattr(resp, "usage", None)
+    uso.tokens_prompt = getattr(consumo, "prompt_tokens", 0) or 0
+    uso.tokens_completion = getattr(consumo, "completion_tokens", 0) or 0
+    return resp.choices[0].message.content, uso
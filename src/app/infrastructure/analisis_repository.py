@@ -1,42 +1,134 @@
-import psycopg2.extras
 from typing import List, Dict, Any, Optional
-from app.config.settings import settings
+from app.infrastructure.ai_client import UsoLLM
+from app.infrastructure.base_repository import BaseRepository
+from app.infrastructure.query_registry import COLUMNAS_ANALISIS
 
-class AnalisisIARepository:
-    def __init__(self, conn):
-        self.conn = conn
-        self.schema = settings.POSTGRES_SCHEMA
+class AnalisisIARepository(BaseRepository):
 
-    def crear(self, fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado):
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        cursor.execute(f"""
-            INSERT INTO {self.schema}.analisis_ia
-            (fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING *
-        """, (fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado))
+    def crear(self, fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado, uso: UsoLLM | None = None):
+        cursor = self._ejecutar_consulta(
+            "analisis.crear",
+            (fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado,
+             *(uso or UsoLLM()).columnas()),
+            dict_rows=True,
+        )
 
         row = cursor.fetchone()
-        self.conn.commit()
+        self._confirmar()
         return row
 
+    def crear_lote(self, filas: list[tuple]) -> List[Dict[str, Any]]:
+        """
+        Inserta varios análisis con un único INSERT multi-fila.
+        Cada fila: (fecha_inicio, fecha_fin, resumen, recomendaciones,
+        modelo_usado, *UsoLLM.columnas()).
+        """
+        rows = self._ejecutar_valores(
+            "analisis.crear_lote",
+            f"""
+            INSERT INTO {self.schema}.analisis_ia
+            (fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado,
+             tokens_prompt, tokens_completion, prompt_ms, llm_ms, reintentos, registros_entrada)
+            VALUES %s
+            RETURNING {COLUMNAS_ANALISIS}
+            """,
+            filas,
+            dict_rows=True,
+            page_size=max(len(filas), 1),
+        )
+        self._confirmar()
+        return rows
+
+
+
+    def resumenes_semanales(self, fecha_inicio, fecha_fin) -> List[Dict[str, Any]]:
+        cursor = self._ejecutar_consulta(
+            "analisis.resumenes_semanales", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
+        return cursor.fetchall()
 
+    def guardar_resumenes_semanales(self, filas: list[tuple]) -> None:
+        """
+        Guarda (o reemplaza) los resúmenes de semana. Cada fila:
+        (fecha_inicio, fecha_fin, huella, registros, resumen, modelo_usado,
+        tokens_prompt, tokens_completion).
+        """
+        self._ejecutar_valores(
+            "analisis.guardar_resumenes_semanales",
+            f"""
+            INSERT INTO {self.schema}.resumenes_semanales
+            (fecha_inicio, fecha_fin, huella, registros, resumen, modelo_usado,
+             tokens_prompt, tokens_completion)
+            VALUES %s
+            ON CONFLICT (fecha_inicio, fecha_fin) DO UPDATE SET
+                huella = EXCLUDED.huella,
+                registros = EXCLUDED.registros,
+                resumen = EXCLUDED.resumen,
+                modelo_usado = EXCLUDED.modelo_usado,
+                tokens_prompt = EXCLUDED.tokens_prompt,
+                tokens_completion = EXCLUDED.tokens_completion,
+                fecha_creacion = CURRENT_TIMESTAMP
+            """,
+            filas,
+            fetch=False,
+        )
+        self._confirmar()
 
-    def listar(self) -> List[Dict[str, Any]]:
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(f"""
-            SELECT *
+    def listar_resumen(
+        self,
+        limite: int,
+        cursor_fecha=None,
+        cursor_id: Optional[int] = None,
+        fecha_inicio=None,
+        fecha_fin=None,
+        modelo: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista análisis sin las columnas de texto grandes, paginando por
+        keyset sobre (fecha_creacion, id) en orden descendente.
+        Los filtros de fecha devuelven los análisis cuyo periodo se solapa
+        con el rango indicado.
+        """
+        condiciones = []
+        params: list = []
+
+        if cursor_fecha is not None and cursor_id is not None:
+            condiciones.append("(fecha_creacion, id) < (%s, %s)")
+            params += [cursor_fecha, cursor_id]
+        if fecha_inicio is not None:
+            condiciones.append("fecha_fin >= %s")
+            params.append(fecha_inicio)
+        if fecha_fin is not None:
+            condiciones.append("fecha_inicio <= %s")
+            params.append(fecha_fin)
+        if modelo is not None:
+            condiciones.append("modelo_usado = %s")
+            params.append(modelo)
+
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        params.append(limite)
+
+        cursor = self._ejecutar("analisis.listar_resumen", f"""
+            SELECT id, fecha_inicio, fecha_fin, resumen, modelo_usado, fecha_creacion
             FROM {self.schema}.analisis_ia
-            ORDER BY fecha_creacion DESC
-        """)
+            {where}
+            ORDER BY fecha_creacion DESC, id DESC
+            LIMIT %s
+        """, params, dict_rows=True, lectura=True)
+        return cursor.fetchall()
+
+    def metricas_llm(self, fecha_inicio, fecha_fin) -> List[Dict[str, Any]]:
+        """
+        Percentiles de latencia y consumo de tokens por día de creación
+        y modelo. Los análisis sin contabilidad no cuentan.
+        """
+        cursor = self._ejecutar_consulta(
+            "analisis.metricas_llm", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
         return cursor.fetchall()
 
     def obtener_por_id(self, analisis_id: int) -> Optional[Dict[str, Any]]:
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(f"""
-            SELECT *
-            FROM {self.schema}.analisis_ia
-            WHERE id = %s
-        """, (analisis_id,))
+        cursor = self._ejecutar_consulta(
+            "analisis.obtener_por_id", (analisis_id,), dict_rows=True, lectura=True
+        )
         return cursor.fetchone()
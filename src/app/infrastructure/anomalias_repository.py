@@ -0,0 +1,139 @@
+from datetime import date
+from typing import List, Dict, Any
+from app.infrastructure.base_repository import BaseRepository
+
+_PLANTILLA_PAR = "(%s::int, %s::date)"
+
+
+class AnomaliasRepository(BaseRepository):
+
+    def recalcular_totales_diarios(self, pares: list[tuple[int, date]]) -> List[Dict[str, Any]]:
+        """
+        Recalcula el total diario de cada par (tipo_residuo_id, dia) afectado
+        por una ingesta y lo guarda en residuos_diarios.
+        """
+        return self._ejecutar_valores(
+            "anomalias.recalcular_totales_diarios",
+            f"""
+            INSERT INTO {self.schema}.residuos_diarios (tipo_residuo_id, dia, total_kg)
+            SELECT rr.tipo_residuo_id, rr.dia, SUM(rr.cantidad_kg)
+            FROM {self.schema}.registros_residuos rr
+            JOIN (VALUES %s) AS p(tipo_residuo_id, dia)
+                ON rr.tipo_residuo_id = p.tipo_residuo_id AND rr.dia = p.dia
+            GROUP BY rr.tipo_residuo_id, rr.dia
+            -- Mismo orden de bloqueo en todas las transacciones concurrentes
+            ORDER BY rr.tipo_residuo_id, rr.dia
+            ON CONFLICT (tipo_residuo_id, dia) DO UPDATE SET total_kg = EXCLUDED.total_kg
+            RETURNING tipo_residuo_id, dia, total_kg
+            """,
+            pares,
+            dict_rows=True,
+            template=_PLANTILLA_PAR,
+        )
+
+    def recalcular_totales_historicos(self) -> None:
+        """
+        Recalcula residuos_diarios con todo el histórico (backfill de la
+        detección incremental).
+        """
+        self._ejecutar(
+            "anomalias.recalcular_totales_historicos",
+            f"""
+            INSERT INTO {self.schema}.residuos_diarios (tipo_residuo_id, dia, total_kg)
+            SELECT tipo_residuo_id, dia, SUM(cantidad_kg)
+            FROM {self.schema}.registros_residuos
+            GROUP BY tipo_residuo_id, dia
+            ORDER BY tipo_residuo_id, dia
+            ON CONFLICT (tipo_residuo_id, dia) DO UPDATE SET total_kg = EXCLUDED.total_kg
+            """,
+        )
+
+    def totales_historicos(self) -> List[Dict[str, Any]]:
+        cursor = self._ejecutar(
+            "anomalias.totales_historicos",
+            f"""
+            SELECT tipo_residuo_id, dia, total_kg
+            FROM {self.schema}.residuos_diarios
+            ORDER BY tipo_residuo_id, dia
+            """,
+            dict_rows=True,
+        )
+        return cursor.fetchall()
+
+    def totales_diarios(self, pares: list[tuple[int, date]]) -> List[Dict[str, Any]]:
+        return self._ejecutar_valores(
+            "anomalias.totales_diarios",
+            f"""
+            SELECT d.tipo_residuo_id, d.dia, d.total_kg
+            FROM {self.schema}.residuos_diarios d
+            JOIN (VALUES %s) AS p(tipo_residuo_id, dia)
+                ON d.tipo_residuo_id = p.tipo_residuo_id AND d.dia = p.dia
+            """,
+            pares,
+            dict_rows=True,
+            template=_PLANTILLA_PAR,
+        )
+
+    def bloquear_estados(self, tipos: list[int]) -> List[Dict[str, Any]]:
+        """
+        Obtiene (creándolo si falta) el estado de cada tipo bloqueando sus
+        filas hasta el fin de la transacción.
+        """
+        self._ejecutar_consulta("anomalias.crear_estados", (tipos,))
+
+        cursor = self._ejecutar_consulta(
+            "anomalias.bloquear_estados", (tipos,), dict_rows=True
+        )
+        return cursor.fetchall()
+
+    def guardar_estados(self, estados: list[tuple]) -> None:
+        self._ejecutar_valores(
+            "anomalias.guardar_estados",
+            f"""
+            UPDATE {self.schema}.anomalias_estado AS e
+            SET n = v.n, media = v.media, varianza = v.varianza, ultimo_dia = v.ultimo_dia
+            FROM (VALUES %s) AS v(tipo_residuo_id, n, media, varianza, ultimo_dia)
+            WHERE e.tipo_residuo_id = v.tipo_residuo_id
+            """,
+            estados,
+            template="(%s::int, %s::int, %s::float8, %s::float8, %s::date)",
+            fetch=False,
+        )
+
+    def registrar_anomalias(self, anomalias: list[tuple]) -> None:
+        self._ejecutar_valores(
+            "anomalias.registrar",
+            f"""
+            INSERT INTO {self.schema}.anomalias_residuos
+            (tipo_residuo_id, dia, total_kg, media_base_kg, desviacion_base_kg, z_score)
+            VALUES %s
+            ON CONFLICT (tipo_residuo_id, dia) DO UPDATE SET
+                total_kg = EXCLUDED.total_kg,
+                media_base_kg = EXCLUDED.media_base_kg,
+                desviacion_base_kg = EXCLUDED.desviacion_base_kg,
+                z_score = EXCLUDED.z_score,
+                fecha_deteccion = CURRENT_TIMESTAMP
+            """,
+            anomalias,
+            template="(%s::int, %s::date, %s, %s::float8, %s::float8, %s::float8)",
+            fetch=False,
+        )
+
+    def descartar_anomalias(self, pares: list[tuple[int, date]]) -> None:
+        self._ejecutar_valores(
+            "anomalias.descartar",
+            f"""
+            DELETE FROM {self.schema}.anomalias_residuos a
+            USING (VALUES %s) AS p(tipo_residuo_id, dia)
+            WHERE a.tipo_residuo_id = p.tipo_residuo_id AND a.dia = p.dia
+            """,
+            pares,
+            template=_PLANTILLA_PAR,
+            fetch=False,
+        )
+
+    def listar_por_rango(self, fecha_inicio: date, fecha_fin: date) -> List[Dict[str, Any]]:
+        cursor = self._ejecutar_consulta(
+            "anomalias.listar_por_rango", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
+        return cursor.fetchall()
@@ -0,0 +1,92 @@
+import tempfile
+from typing import Iterable
+
+FORMATOS_EXPORT = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Archivos de export por encima de este tamaño se vuelcan a disco
+_MAX_MEMORIA_BYTES = 32 * 1024 * 1024
+
+
+class ExportNoDisponibleError(RuntimeError):
+    """pyarrow no está instalado en este despliegue."""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ExportNoDisponibleError("La exportación columnar requiere pyarrow")
+    return pyarrow
+
+
+def esquema_registros():
+    pa = _pyarrow()
+    return pa.schema([
+        ("id", pa.int64()),
+        ("dia", pa.date32()),
+        ("cantidad_kg", pa.float64()),
+        ("tipo_residuo_id", pa.int32()),
+        ("tipo_residuo", pa.dictionary(pa.int32(), pa.string())),
+        ("descripcion_tipo_residuo", pa.dictionary(pa.int32(), pa.string())),
+        ("fecha_creacion", pa.timestamp("us")),
+        ("source_line_id", pa.string()),
+    ])
+
+
+def esquema_estadisticas_diarias():
+    pa = _pyarrow()
+    return pa.schema([
+        ("dia", pa.date32()),
+        ("tipo_residuo_id", pa.int32()),
+        ("tipo_residuo", pa.dictionary(pa.int32(), pa.string())),
+        ("cantidad_registros", pa.int64()),
+        ("total_kg", pa.float64()),
+        ("promedio_kg", pa.float64()),
+        ("minimo_kg", pa.float64()),
+        ("maximo_kg", pa.float64()),
+    ])
+
+
+def _record_batch(esquema, filas: list[tuple]):
+    pa = _pyarrow()
+    columnas = list(zip(*filas))
+    arrays = [
+        pa.array(columna, type=campo.type)
+        for campo, columna in zip(esquema, columnas)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+
+def escribir_export(formato: str, esquema, lotes: Iterable[list[tuple]]):
+    """
+    Convierte los lotes de filas (tuplas en el orden del esquema) en
+    record batches y los escribe como Parquet o como Arrow IPC stream.
+
+    Devuelve un archivo temporal posicionado al inicio; solo se mantiene
+    en memoria un lote a la vez.
+    """
+    pa = _pyarrow()
+    if formato not in FORMATOS_EXPORT:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    destino = tempfile.SpooledTemporaryFile(max_size=_MAX_MEMORIA_BYTES)
+
+    if formato == "parquet":
+        escritor = pa.parquet.ParquetWriter(destino, esquema, compression="zstd")
+    else:
+        escritor = pa.ipc.new_stream(destino, esquema)
+
+    try:
+        for filas in lotes:
+            if filas:
+                escritor.write_batch(_record_batch(esquema, filas))
+    finally:
+        escritor.close()
+
+    destino.seek(0)
+    return destino
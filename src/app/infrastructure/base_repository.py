@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+
+import psycopg2.errors
+import psycopg2.extras
+from app.config.settings import settings
+from app.infrastructure import query_registry
+from app.infrastructure.cambios import CANAL, SQL_NOTIFICAR, Cambio, carga_cambio, despachar_confirmados
+from app.infrastructure.cancelacion import ClienteDesconectadoError, ConsultaCanceladaError
+from app.infrastructure.query_instrumentation import (
+    ejecutar_instrumentado,
+    ejecutar_valores_instrumentado,
+)
+
+
+class BaseRepository:
+    """
+    Base común de los repositorios: todas las sentencias pasan por
+    `_ejecutar`, que las mide y etiqueta con un nombre estable
+    (por ejemplo `residuos.listar_por_rango`).
+
+    Las sentencias marcadas con `lectura=True` pueden ir a una réplica;
+    el resto, y los commits, van siempre al primario de la sesión.
+
+    Las sentencias estáticas viven en `query_registry` y se ejecutan con
+    `_ejecutar_consulta`, que las prepara una vez por conexión.
+    """
+
+    def __init__(self, sesion):
+        self.sesion = sesion
+        self.schema = sesion.schema
+
+    @property
+    def conn(self):
+        return self.sesion.primaria
+
+    @contextmanager
+    def _cancelable(self, nombre: str):
+        """
+        Traduce la cancelación de Postgres (statement_timeout o
+        desconexión del cliente) a errores de dominio.
+        """
+        try:
+            yield
+        except psycopg2.errors.QueryCanceled as e:
+            if getattr(self.sesion, "cliente_desconectado", False):
+                raise ClienteDesconectadoError(f"Consulta [{nombre}] cancelada: el cliente cerró la conexión") from e
+            raise ConsultaCanceladaError(f"Consulta [{nombre}] cancelada: {e}".strip()) from e
+
+    def _cursor(self, conn, dict_rows: bool = False):
+        if dict_rows:
+            return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        return conn.cursor()
+
+    def _ejecutar(
+        self, nombre: str, sql: str, params=None, dict_rows: bool = False,
+        many: bool = False, lectura: bool = False,
+    ):
+        conn = self.sesion.lectura() if lectura else self.conn
+        cursor = self._cursor(conn, dict_rows)
+        with self._cancelable(nombre):
+            return ejecutar_instrumentado(conn, cursor, nombre, sql, params, many=many)
+
+    def _ejecutar_consulta(
+        self, nombre: str, params=None, dict_rows: bool = False, lectura: bool = False,
+    ):
+        """
+        Ejecuta una sentencia del registro central. Con
+        PREPARED_STATEMENTS_ENABLED la primera ejecución en cada conexión
+        hace PREPARE y las siguientes solo EXECUTE, evitando reanalizar
+        y replanificar el texto en cada llamada.
+        """
+        conn = self.sesion.lectura() if lectura else self.conn
+        cursor = self._cursor(conn, dict_rows)
+        s = query_registry.sentencia(nombre, self.schema)
+
+        with self._cancelable(nombre):
+            if not settings.PREPARED_STATEMENTS_ENABLED:
+                return ejecutar_instrumentado(conn, cursor, nombre, s.sql, params)
+
+            sql = query_registry.preparar(conn, s)
+            return ejecutar_instrumentado(
+                conn, cursor, nombre, sql, params, es_lectura=s.es_lectura
+            )
+
+    def _ejecutar_valores(
+        self, nombre: str, sql: str, valores: list, dict_rows: bool = False,
+        page_size: int = 1000, template: str | None = None, fetch: bool = True,
+    ) -> list:
+        """
+        `fetch=False` para sentencias sin filas de resultado (UPDATE o
+        DELETE sin RETURNING).
+        """
+        cursor = self._cursor(self.conn, dict_rows)
+        with self._cancelable(nombre):
+            return ejecutar_valores_instrumentado(
+                self.conn, cursor, nombre, sql, valores,
+                page_size=page_size, template=template, fetch=fetch,
+            )
+
+    def _iterar_lotes(self, nombre: str, sql: str, params, tamano_lote: int):
+        """
+        Recorre el resultado con un cursor de servidor (en la conexión de
+        lectura) y lo entrega en listas de hasta `tamano_lote` tuplas.
+        """
+        conn = self.sesion.lectura()
+        cursor = conn.cursor(name=f"cursor_{nombre.replace('.', '_')}")
+        cursor.itersize = tamano_lote
+        try:
+            with self._cancelable(nombre):
+                ejecutar_instrumentado(conn, cursor, nombre, sql, params)
+                while True:
+                    filas = cursor.fetchmany(tamano_lote)
+                    if not filas:
+                        break
+                    yield filas
+        finally:
+            cursor.close()
+
+    def _publicar_cambio(self, entidad: str, desde=None, hasta=None) -> None:
+        """
+        NOTIFY del cambio en la transacción en curso: los demás workers
+        lo reciben al confirmarse y nunca si se deshace.
+        """
+        self._ejecutar(
+            "cambios.notificar",
+            SQL_NOTIFICAR,
+            (CANAL, carga_cambio(self.schema, entidad, desde, hasta)),
+        )
+        self._anotar_cambio(entidad, desde, hasta)
+
+    def _anotar_cambio(self, entidad: str, desde=None, hasta=None) -> None:
+        # Este proceso lo aplica en el commit (ver cambios.despachar_confirmados)
+        self.sesion.cambios_pendientes.append(Cambio(self.schema, entidad, desde, hasta))
+
+    def _confirmar(self) -> None:
+        # Dentro de una unidad de trabajo el commit lo hace la unidad
+        if self.sesion.uow is not None:
+            self.sesion.uow.registrar_escritura()
+            return
+        self.conn.commit()
+        despachar_confirmados(self.sesion.cambios_pendientes)
+        self.sesion.marcar_escritura()
@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable
+
+from app.infrastructure import metrics
+
+_FALTA = object()
+
+
+class CacheLocal:
+    """
+    Caché en memoria del proceso con caducidad `ttl_s`.
+
+    La coherencia entre workers no depende del TTL: las entradas se
+    invalidan al recibir los eventos de cambio (ver
+    `app.infrastructure.cambios`). El TTL solo acota cuánto puede durar
+    una entrada obsoleta si se pierde un evento.
+
+    `generacion()` se toma antes de calcular un valor y se pasa a
+    `guardar`: si entretanto hubo una invalidación, el valor (calculado
+    quizá con datos ya cambiados) no se guarda.
+    """
+
+    def __init__(self, nombre: str, ttl_s: float, max_entradas: int = 1024):
+        self.nombre = nombre
+        self.ttl_s = ttl_s
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas: Dict[Hashable, tuple[float, Any]] = {}
+        self._generacion = 0
+
+    def obtener(self, clave: Hashable, defecto: Any = None) -> Any:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] <= time.monotonic():
+                del self._entradas[clave]
+                entrada = None
+
+        if entrada is None:
+            metrics.incrementar(f"cache.{self.nombre}.fallos")
+            return defecto
+        metrics.incrementar(f"cache.{self.nombre}.aciertos")
+        return entrada[1]
+
+    def generacion(self) -> int:
+        with self._lock:
+            return self._generacion
+
+    def guardar(self, clave: Hashable, valor: Any, generacion: int) -> None:
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            if clave not in self._entradas and len(self._entradas) >= self.max_entradas:
+                # Se descarta la entrada más antigua (orden de inserción)
+                del self._entradas[next(iter(self._entradas))]
+            self._entradas[clave] = (time.monotonic() + self.ttl_s, valor)
+
+    def invalidar(self, predicado: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            self._generacion += 1
+            claves = [c for c in self._entradas if predicado(c)]
+            for clave in claves:
+                del self._entradas[clave]
+        if claves:
+            metrics.incrementar(f"cache.{self.nombre}.invalidadas", len(claves))
+        return len(claves)
+
+    def limpiar(self) -> None:
+        self.invalidar(lambda clave: True)
+
+    def obtener_o_calcular(self, clave: Hashable, fn: Callable[[], Any]) -> Any:
+        valor = self.obtener(clave, _FALTA)
+        if valor is not _FALTA:
+            return valor
+        generacion = self.generacion()
+        valor = fn()
+        self.guardar(clave, valor, generacion)
+        return valor
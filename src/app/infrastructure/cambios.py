@@ -0,0 +1,205 @@
+import json
+import logging
+import select
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable
+
+import psycopg2
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+# Canal común a todos los schemas; el schema va en la carga del evento
+CANAL = "waste_cambios"
+SQL_NOTIFICAR = "SELECT pg_notify(%s, %s)"
+
+
+@dataclass(frozen=True)
+class Cambio:
+    """
+    Evento de escritura. `desde`/`hasta` acotan los días afectados
+    (None: sin rango, afecta a todo el schema). Un evento con
+    `schema=None` pide resincronizar: se invalida todo.
+    """
+
+    schema: str | None
+    entidad: str | None
+    desde: date | None = None
+    hasta: date | None = None
+
+    def afecta(self, schema: str, fecha_inicio: date, fecha_fin: date) -> bool:
+        if self.schema is not None and self.schema != schema:
+            return False
+        if self.desde is None or self.hasta is None:
+            return True
+        return self.desde <= fecha_fin and fecha_inicio <= self.hasta
+
+
+RESINCRONIZAR = Cambio(schema=None, entidad=None)
+
+
+def carga_cambio(schema: str, entidad: str, desde: date | None = None, hasta: date | None = None) -> str:
+    return json.dumps({
+        "schema": schema,
+        "entidad": entidad,
+        "desde": desde.isoformat() if desde else None,
+        "hasta": hasta.isoformat() if hasta else None,
+    })
+
+
+def _leer_carga(carga: str) -> Cambio:
+    datos = json.loads(carga)
+    return Cambio(
+        schema=datos["schema"],
+        entidad=datos["entidad"],
+        desde=date.fromisoformat(datos["desde"]) if datos.get("desde") else None,
+        hasta=date.fromisoformat(datos["hasta"]) if datos.get("hasta") else None,
+    )
+
+
+# ============================================================
+#  Suscriptores locales
+# ============================================================
+_suscriptores: list[Callable[[Cambio], None]] = []
+_suscriptores_al_confirmar: list[Callable[[Cambio], None]] = []
+
+
+def suscribir(fn: Callable[[Cambio], None], al_confirmar: bool = False) -> None:
+    """
+    `al_confirmar=True` además entrega a `fn`, en el mismo hilo y justo
+    tras el commit, los cambios confirmados por este proceso, sin esperar
+    al eco del LISTEN (las cachés locales no pueden quedar un instante
+    por detrás de una escritura de la propia petición).
+    """
+    _suscriptores.append(fn)
+    if al_confirmar:
+        _suscriptores_al_confirmar.append(fn)
+
+
+def _repartir(suscriptores: list, cambio: Cambio) -> None:
+    for fn in list(suscriptores):
+        try:
+            fn(cambio)
+        except Exception as e:
+            logger.error(f"Error procesando evento de cambio {cambio}: {e}")
+
+
+def despachar(cambio: Cambio) -> None:
+    _repartir(_suscriptores, cambio)
+
+
+def despachar_confirmados(cambios: list[Cambio]) -> None:
+    """
+    Reparte a los suscriptores `al_confirmar` los cambios de una
+    transacción recién confirmada y vacía la lista.
+    """
+    pendientes = list(cambios)
+    cambios.clear()
+    for cambio in pendientes:
+        _repartir(_suscriptores_al_confirmar, cambio)
+
+
+# ============================================================
+#  Escucha (un hilo por proceso)
+# ============================================================
+class EscuchaCambios:
+    """
+    Hilo con una conexión dedicada en autocommit que hace LISTEN sobre
+    CANAL y reparte cada notificación a los suscriptores.
+
+    Postgres entrega las notificaciones al confirmarse la transacción
+    que las emitió (y las descarta si se deshace), así que un evento
+    nunca precede a los datos. Tras cada (re)conexión se despacha
+    RESINCRONIZAR, porque los eventos emitidos sin escucha se pierden.
+    """
+
+    def __init__(self):
+        self._parar = threading.Event()
+        self._hilo: threading.Thread | None = None
+        self.conectada = False
+
+    def iniciar(self) -> None:
+        if self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="escucha-cambios", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=settings.CAMBIOS_POLL_S + 1)
+            self._hilo = None
+
+    def _conectar(self):
+        conn = psycopg2.connect(
+            host=settings.POSTGRES_HOST,
+            port=settings.POSTGRES_PORT,
+            database=settings.POSTGRES_DB,
+            user=settings.POSTGRES_USER,
+            password=settings.POSTGRES_PASSWORD,
+            application_name="waste-api-escucha",
+        )
+        conn.autocommit = True
+        conn.cursor().execute(f"LISTEN {CANAL}")
+        return conn
+
+    def _bucle(self) -> None:
+        espera = 1.0
+        while not self._parar.is_set():
+            conn = None
+            try:
+                conn = self._conectar()
+                self.conectada = True
+                espera = 1.0
+                logger.info(f"Escuchando eventos de cambio en '{CANAL}'")
+                despachar(RESINCRONIZAR)
+                self._escuchar(conn)
+            except Exception as e:
+                metrics.incrementar("cambios.reconexiones")
+                logger.warning(f"Escucha de cambios interrumpida, reintento en {espera:.0f}s: {e}")
+            finally:
+                self.conectada = False
+                if conn is not None and not conn.closed:
+                    conn.close()
+            self._parar.wait(espera)
+            espera = min(espera * 2, 30.0)
+
+    def _escuchar(self, conn) -> None:
+        ultima_actividad = time.monotonic()
+        while not self._parar.is_set():
+            listos, _, _ = select.select([conn], [], [], settings.CAMBIOS_POLL_S)
+            if not listos:
+                # Sin tráfico: comprobar que la conexión sigue viva
+                if time.monotonic() - ultima_actividad >= settings.CAMBIOS_KEEPALIVE_S:
+                    conn.cursor().execute("SELECT 1")
+                    ultima_actividad = time.monotonic()
+                continue
+
+            conn.poll()
+            ultima_actividad = time.monotonic()
+            while conn.notifies:
+                notificacion = conn.notifies.pop(0)
+                try:
+                    cambio = _leer_carga(notificacion.payload)
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Evento de cambio no válido: {notificacion.payload!r} ({e})")
+                    continue
+                metrics.incrementar("cambios.recibidos")
+                despachar(cambio)
+
+
+escucha_cambios = EscuchaCambios()
+
+
+def escuchando() -> bool:
+    """
+    True si este proceso recibe eventos de cambio. Sin escucha las
+    cachés locales no pueden mantenerse coherentes y no deben usarse.
+    """
+    return escucha_cambios.conectada
@@ -0,0 +1,70 @@
+import logging
+import threading
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Clave del scope ASGI donde el middleware deja el cancelador de la petición
+SCOPE_CANCELADOR = "waste.cancelador"
+
+
+class ConsultaCanceladaError(Exception):
+    """
+    Postgres canceló la sentencia (statement_timeout o cancelación
+    explícita); se responde 504.
+    """
+
+
+class ClienteDesconectadoError(ConsultaCanceladaError):
+    """La consulta se canceló porque el cliente cerró la conexión."""
+
+
+class CanceladorConsultas:
+    """
+    Conexiones en uso por una petición. Si el cliente se desconecta,
+    `cancelar` envía una petición de cancelación (equivalente a
+    pg_cancel_backend) a la consulta en curso de cada una.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conexiones: list = []
+        self.desconectado = False
+
+    def registrar(self, conn) -> None:
+        with self._lock:
+            if self.desconectado:
+                raise ClienteDesconectadoError("El cliente cerró la conexión")
+            self._conexiones.append(conn)
+
+    def liberar(self, conn) -> None:
+        with self._lock:
+            if conn in self._conexiones:
+                self._conexiones.remove(conn)
+
+    def cancelar(self) -> None:
+        with self._lock:
+            self.desconectado = True
+            conexiones = list(self._conexiones)
+
+        for conn in conexiones:
+            try:
+                conn.cancel()
+                logger.info("Consulta cancelada por desconexión del cliente")
+            except Exception as e:
+                logger.warning(f"No se pudo cancelar la consulta: {e}")
+
+
+def statement_timeout_ms(metodo: str, path: str) -> int:
+    """
+    Presupuesto de statement_timeout de una ruta: la primera entrada de
+    STATEMENT_TIMEOUTS_RUTA_MS que coincida con "<MÉTODO> <segmento>" o
+    con "<segmento>", o STATEMENT_TIMEOUT_MS si ninguna coincide.
+    """
+    limites = settings.STATEMENT_TIMEOUTS_RUTA_MS
+    for segmento in path.strip("/").split("/"):
+        for clave in (f"{metodo} {segmento}", segmento):
+            if clave in limites:
+                return limites[clave]
+    return settings.STATEMENT_TIMEOUT_MS
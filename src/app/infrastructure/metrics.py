@@ -0,0 +1,25 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_lock = threading.Lock()
+_contadores: Dict[str, int] = defaultdict(int)
+
+
+def incrementar(nombre: str, n: int = 1) -> None:
+    with _lock:
+        _contadores[nombre] += n
+
+
+def contadores() -> Dict[str, int]:
+    with _lock:
+        return dict(_contadores)
+
+
+def ratio(aciertos: str, fallos: str) -> float | None:
+    """
+    Proporción aciertos / (aciertos + fallos) de dos contadores.
+    """
+    with _lock:
+        a, f = _contadores.get(aciertos, 0), _contadores.get(fallos, 0)
+    return round(a / (a + f), 4) if a + f else None
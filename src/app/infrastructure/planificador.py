@@ -0,0 +1,139 @@
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Callable
+
+import psycopg2
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TareaProgramada:
+    nombre: str
+    hora: time
+    fn: Callable[[], None]
+    ultima_ejecucion: date | None = None
+
+    def pendiente(self, ahora: datetime) -> bool:
+        """
+        Una vez al día, a partir de `hora` y dentro de la ventana de
+        PLANIFICADOR_VENTANA_H (un arranque a media mañana no lanza los
+        trabajos de madrugada en plena hora punta).
+        """
+        programada = datetime.combine(ahora.date(), self.hora)
+        return (
+            self.ultima_ejecucion != ahora.date()
+            and programada <= ahora < programada + timedelta(hours=settings.PLANIFICADOR_VENTANA_H)
+        )
+
+
+class Planificador:
+    """
+    Trabajos periódicos del servicio en un hilo del proceso.
+
+    Todos los workers arrancan el planificador, pero solo ejecuta tareas
+    el que obtiene el advisory lock PLANIFICADOR_LOCK_ID. El lock es de
+    sesión y vive en una conexión dedicada: si el líder muere o pierde la
+    conexión, Postgres lo libera y otro worker lo toma en el siguiente
+    ciclo. Las tareas deben ser idempotentes, porque un relevo puede
+    repetir la del día.
+    """
+
+    def __init__(self):
+        self._tareas: list[TareaProgramada] = []
+        self._parar = threading.Event()
+        self._hilo: threading.Thread | None = None
+        self._conn = None
+        self.lider = False
+
+    def programar(self, nombre: str, hora: str, fn: Callable[[], None]) -> None:
+        # Reprogramar una tarea con el mismo nombre la sustituye
+        self._tareas = [t for t in self._tareas if t.nombre != nombre]
+        self._tareas.append(TareaProgramada(nombre, time.fromisoformat(hora), fn))
+
+    def estado(self) -> dict:
+        return {
+            "lider": self.lider,
+            "tareas": {
+                t.nombre: t.ultima_ejecucion.isoformat() if t.ultima_ejecucion else None
+                for t in self._tareas
+            },
+        }
+
+    def iniciar(self) -> None:
+        if self._hilo is not None:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="planificador", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+            self._hilo = None
+        self._soltar()
+
+    def _bucle(self) -> None:
+        while not self._parar.is_set():
+            try:
+                if self._es_lider():
+                    self._ejecutar_pendientes(datetime.now())
+            except Exception as e:
+                logger.warning(f"Planificador: conexión de liderazgo perdida: {e}")
+                self._soltar()
+            self._parar.wait(settings.PLANIFICADOR_TICK_S)
+
+    def _es_lider(self) -> bool:
+        if self._conn is None or self._conn.closed:
+            self.lider = False
+            self._conn = psycopg2.connect(
+                host=settings.POSTGRES_HOST,
+                port=settings.POSTGRES_PORT,
+                database=settings.POSTGRES_DB,
+                user=settings.POSTGRES_USER,
+                password=settings.POSTGRES_PASSWORD,
+                application_name="waste-api-planificador",
+            )
+            self._conn.autocommit = True
+
+        cursor = self._conn.cursor()
+        if self.lider:
+            # El lock sigue siendo nuestro mientras la sesión siga viva
+            cursor.execute("SELECT 1")
+            return True
+
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (settings.PLANIFICADOR_LOCK_ID,))
+        self.lider = cursor.fetchone()[0]
+        if self.lider:
+            metrics.incrementar("planificador.liderazgos")
+            logger.info("Planificador: este worker es el líder")
+        return self.lider
+
+    def _ejecutar_pendientes(self, ahora: datetime) -> None:
+        for tarea in self._tareas:
+            if self._parar.is_set() or not tarea.pendiente(ahora):
+                continue
+            tarea.ultima_ejecucion = ahora.date()
+            logger.info(f"Planificador: ejecutando {tarea.nombre}")
+            try:
+                tarea.fn()
+                metrics.incrementar(f"planificador.{tarea.nombre}.ejecuciones")
+            except Exception as e:
+                metrics.incrementar(f"planificador.{tarea.nombre}.errores")
+                logger.error(f"Planificador: error en {tarea.nombre}: {e}")
+
+    def _soltar(self) -> None:
+        # Cerrar la sesión libera el advisory lock
+        self.lider = False
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        self._conn = None
+
+
+planificador = Planificador()
@@ -0,0 +1,169 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict
+
+import psycopg2.extras
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_MAX_LARGO_PARAMS = 500
+
+_lock = threading.Lock()
+_estadisticas: Dict[str, Dict[str, float]] = {}
+
+
+def _acumular(nombre: str, duracion_ms: float, filas: int) -> None:
+    with _lock:
+        stats = _estadisticas.setdefault(
+            nombre,
+            {"llamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "filas": 0, "lentas": 0},
+        )
+        stats["llamadas"] += 1
+        stats["total_ms"] += duracion_ms
+        stats["max_ms"] = max(stats["max_ms"], duracion_ms)
+        stats["filas"] += max(filas, 0)
+        if duracion_ms >= settings.SLOW_QUERY_MS:
+            stats["lentas"] += 1
+
+
+def estadisticas_consultas() -> Dict[str, Dict[str, Any]]:
+    """
+    Devuelve una copia de las métricas acumuladas por nombre de consulta.
+    """
+    with _lock:
+        return {
+            nombre: {
+                **stats,
+                "promedio_ms": round(stats["total_ms"] / stats["llamadas"], 3)
+                if stats["llamadas"] else 0.0,
+            }
+            for nombre, stats in _estadisticas.items()
+        }
+
+
+def _formatear_params(params) -> str:
+    texto = repr(params)
+    if len(texto) > _MAX_LARGO_PARAMS:
+        return texto[:_MAX_LARGO_PARAMS] + "..."
+    return texto
+
+
+def _es_lectura(sql: str) -> bool:
+    return sql.lstrip().upper().startswith("SELECT")
+
+
+def _registrar_plan(conn, nombre: str, sql: str, params) -> None:
+    """
+    Registra el plan real de una consulta de lectura muestreada.
+    Solo se aplica a SELECT: EXPLAIN ANALYZE ejecuta la sentencia.
+
+    El EXPLAIN va dentro de un savepoint: si falla (por ejemplo, por
+    statement_timeout al ejecutar la consulta una segunda vez) se deshace
+    solo él y la transacción de la petición sigue utilizable.
+    """
+    cursor = conn.cursor()
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT explain_muestreo")
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+        plan = "\n".join(r[0] for r in cursor.fetchall())
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT explain_muestreo")
+        logger.info(f"Plan de consulta [{nombre}]:\n{plan}")
+    except Exception as e:
+        logger.warning(f"No se pudo obtener el plan de [{nombre}]: {e}")
+        if savepoint:
+            try:
+                cursor.execute("ROLLBACK TO SAVEPOINT explain_muestreo")
+            except Exception as e:
+                logger.warning(f"No se pudo deshacer el plan de [{nombre}]: {e}")
+
+
+def _registrar(
+    conn, nombre: str, sql: str, params, duracion_ms: float, filas: int,
+    explicable: bool, es_lectura: bool | None = None,
+) -> None:
+    _acumular(nombre, duracion_ms, filas)
+
+    if duracion_ms >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            f"Consulta lenta [{nombre}] {duracion_ms:.1f} ms, {filas} filas, "
+            f"params={_formatear_params(params)}"
+        )
+    else:
+        logger.debug(f"Consulta [{nombre}] {duracion_ms:.1f} ms, {filas} filas")
+
+    if (
+        explicable
+        and settings.QUERY_EXPLAIN_SAMPLE_RATE > 0
+        and (_es_lectura(sql) if es_lectura is None else es_lectura)
+        and random.random() < settings.QUERY_EXPLAIN_SAMPLE_RATE
+    ):
+        _registrar_plan(conn, nombre, sql, params)
+
+
+def _registrar_fallo(nombre: str, inicio: float, params, error: Exception) -> None:
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    logger.error(
+        f"Consulta fallida [{nombre}] tras {duracion_ms:.1f} ms: {error} "
+        f"params={_formatear_params(params)}"
+    )
+
+
+def ejecutar_instrumentado(
+    conn, cursor, nombre: str, sql: str, params=None, many: bool = False,
+    es_lectura: bool | None = None,
+):
+    """
+    Ejecuta una sentencia midiendo su duración y filas afectadas.
+
+    Las sentencias que superan SLOW_QUERY_MS se registran junto con sus
+    parámetros. Una fracción QUERY_EXPLAIN_SAMPLE_RATE de las lecturas se
+    registra además con su plan EXPLAIN (ANALYZE, BUFFERS). `es_lectura`
+    fuerza la clasificación cuando el texto no empieza por SELECT
+    (por ejemplo un EXECUTE de una sentencia preparada).
+    """
+    inicio = time.perf_counter()
+    try:
+        if many:
+            cursor.executemany(sql, params)
+        else:
+            cursor.execute(sql, params)
+    except Exception as e:
+        _registrar_fallo(nombre, inicio, params, e)
+        raise
+
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    _registrar(
+        conn, nombre, sql, params, duracion_ms, cursor.rowcount,
+        explicable=not many, es_lectura=es_lectura,
+    )
+    return cursor
+
+
+def ejecutar_valores_instrumentado(
+    conn, cursor, nombre: str, sql: str, valores: list, page_size: int = 1000,
+    template: str | None = None, fetch: bool = True,
+) -> list:
+    """
+    Variante de `ejecutar_instrumentado` para `execute_values` (INSERT
+    multi-fila). Con `fetch` devuelve las filas de RETURNING (o del
+    SELECT) de todas las páginas; sin él, una lista vacía.
+    """
+    inicio = time.perf_counter()
+    try:
+        filas = psycopg2.extras.execute_values(
+            cursor, sql, valores, template=template, page_size=page_size, fetch=fetch
+        )
+    except Exception as e:
+        _registrar_fallo(nombre, inicio, valores, e)
+        raise
+
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    _registrar(conn, nombre, sql, valores, duracion_ms, len(valores), explicable=False)
+    return filas if fetch else []
@@ -0,0 +1,346 @@
+import hashlib
+import re
+import threading
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+
+from app.infrastructure import metrics
+
+# ============================================================
+#  Sentencias estáticas de los repositorios
+#  ({schema} se sustituye una vez por schema; parámetros con %s)
+# ============================================================
+# Columnas de analisis_ia que se devuelven (AnalisisIAResponseDto)
+COLUMNAS_ANALISIS = """
+    id, fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado, fecha_creacion,
+    tokens_prompt, tokens_completion, prompt_ms, llm_ms, reintentos, registros_entrada
+"""
+
+CONSULTAS: dict[str, str] = {
+    # ---------------- tipos_residuos ----------------
+    "tipos.crear": """
+        INSERT INTO {schema}.tipos_residuos (nombre, descripcion)
+        VALUES (%s, %s)
+        RETURNING id
+    """,
+    "tipos.listar": """
+        SELECT *
+        FROM {schema}.tipos_residuos
+        ORDER BY id ASC
+    """,
+    "tipos.obtener_por_id": """
+        SELECT *
+        FROM {schema}.tipos_residuos
+        WHERE id = %s
+        LIMIT 1
+    """,
+
+    # ---------------- registros_residuos ----------------
+    "residuos.crear": """
+        INSERT INTO {schema}.registros_residuos
+        (dia, cantidad_kg, tipo_residuo_id, source_line_id)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    """,
+    "residuos.obtener_por_id": """
+        SELECT
+            r.id,
+            r.dia,
+            r.cantidad_kg,
+            r.tipo_residuo_id,
+            t.nombre AS tipo_residuo,
+            t.descripcion AS descripcion_tipo_residuo,
+            r.fecha_creacion
+        FROM {schema}.registros_residuos r
+        JOIN {schema}.tipos_residuos t
+            ON r.tipo_residuo_id = t.id
+        WHERE r.id = %s
+    """,
+    "residuos.listar_por_rango": """
+        SELECT
+            r.id,
+            r.dia,
+            r.cantidad_kg,
+            r.tipo_residuo_id,
+            t.nombre AS tipo_residuo,
+            t.descripcion AS descripcion_tipo_residuo,
+            r.fecha_creacion
+        FROM {schema}.registros_residuos r
+        JOIN {schema}.tipos_residuos t
+            ON r.tipo_residuo_id = t.id
+        WHERE r.dia BETWEEN %s AND %s
+        ORDER BY r.dia ASC
+    """,
+    "residuos.ultimo_id": """
+        SELECT COALESCE(MAX(id), 0)
+        FROM {schema}.registros_residuos
+    """,
+    "residuos.listar_nuevos": """
+        SELECT
+            r.id,
+            r.dia,
+            r.cantidad_kg,
+            r.tipo_residuo_id,
+            t.nombre AS tipo_residuo,
+            t.descripcion AS descripcion_tipo_residuo,
+            r.fecha_creacion
+        FROM {schema}.registros_residuos r
+        JOIN {schema}.tipos_residuos t
+            ON r.tipo_residuo_id = t.id
+        WHERE r.id > %s AND r.id <= %s
+          AND r.dia BETWEEN %s AND %s
+        ORDER BY r.id ASC
+        LIMIT %s
+    """,
+    "residuos.huellas_semanales": """
+        SELECT
+            GREATEST(date_trunc('week', r.dia::timestamp)::date, %s::date) AS fecha_inicio,
+            LEAST((date_trunc('week', r.dia::timestamp) + interval '6 days')::date, %s::date) AS fecha_fin,
+            COUNT(*) AS registros,
+            -- El tipo entra en la huella: renombrarlo cambia el resumen
+            md5(string_agg(
+                r.id || ':' || r.dia || ':' || r.tipo_residuo_id || ':' || r.cantidad_kg
+                    || ':' || t.nombre || ':' || COALESCE(t.descripcion, ''),
+                ',' ORDER BY r.id
+            )) AS huella
+        FROM {schema}.registros_residuos r
+        JOIN {schema}.tipos_residuos t ON t.id = r.tipo_residuo_id
+        WHERE r.dia BETWEEN %s AND %s
+        GROUP BY date_trunc('week', r.dia::timestamp)
+        ORDER BY 1
+    """,
+    "residuos.listar_por_rangos": """
+        WITH rangos (idx, fecha_inicio, fecha_fin) AS (
+            SELECT * FROM unnest(%s::int[], %s::date[], %s::date[])
+        )
+        SELECT
+            g.idx,
+            r.dia,
+            r.cantidad_kg,
+            t.nombre AS tipo_residuo,
+            t.descripcion AS descripcion_tipo_residuo
+        FROM rangos g
+        JOIN {schema}.registros_residuos r
+            ON r.dia BETWEEN g.fecha_inicio AND g.fecha_fin
+        JOIN {schema}.tipos_residuos t
+            ON r.tipo_residuo_id = t.id
+        ORDER BY g.idx, r.dia ASC, r.id ASC
+    """,
+    "residuos.estadisticas_por_rango": """
+        SELECT
+            tr.id AS tipo_id,
+            tr.nombre AS tipo_residuo,
+            tr.descripcion AS descripcion_tipo_residuo,
+
+            COUNT(rr.id) AS cantidad_registros,
+            SUM(rr.cantidad_kg) AS total_kg,
+            AVG(rr.cantidad_kg) AS promedio_kg,
+            MIN(rr.cantidad_kg) AS minimo_kg,
+            MAX(rr.cantidad_kg) AS maximo_kg
+
+        FROM {schema}.registros_residuos rr
+        JOIN {schema}.tipos_residuos tr
+            ON tr.id = rr.tipo_residuo_id
+
+        WHERE rr.dia BETWEEN %s AND %s
+        GROUP BY tr.id, tr.nombre, tr.descripcion
+        ORDER BY total_kg DESC
+    """,
+    "residuos.estadisticas_multi_rango": """
+        WITH rangos (idx, fecha_inicio, fecha_fin) AS (
+            SELECT * FROM unnest(%s::int[], %s::date[], %s::date[])
+        )
+        SELECT
+            r.idx,
+            tr.id AS tipo_id,
+            tr.nombre AS tipo_residuo,
+            tr.descripcion AS descripcion_tipo_residuo,
+
+            COUNT(rr.id) AS cantidad_registros,
+            SUM(rr.cantidad_kg) AS total_kg,
+            AVG(rr.cantidad_kg) AS promedio_kg,
+            MIN(rr.cantidad_kg) AS minimo_kg,
+            MAX(rr.cantidad_kg) AS maximo_kg
+
+        FROM {schema}.registros_residuos rr
+        JOIN rangos r
+            ON rr.dia BETWEEN r.fecha_inicio AND r.fecha_fin
+        JOIN {schema}.tipos_residuos tr
+            ON tr.id = rr.tipo_residuo_id
+
+        WHERE rr.dia BETWEEN %s::date AND %s::date
+        GROUP BY r.idx, tr.id, tr.nombre, tr.descripcion
+        ORDER BY r.idx, total_kg DESC
+    """,
+
+    # Notifica el cambio y descarta las estadísticas precalculadas que
+    # solapan con él, en la misma transacción que la escritura
+    "residuos.registrar_cambio": """
+        WITH invalidadas AS (
+            DELETE FROM {schema}.estadisticas_precalculadas
+            WHERE fecha_inicio <= %s AND fecha_fin >= %s
+        )
+        SELECT pg_notify(%s, %s)
+    """,
+
+    # ---------------- estadisticas_precalculadas ----------------
+    "precalculadas.obtener": """
+        SELECT datos, analisis_id, fecha_calculo
+        FROM {schema}.estadisticas_precalculadas
+        WHERE fecha_inicio = %s AND fecha_fin = %s
+    """,
+    "precalculadas.vincular_analisis": """
+        UPDATE {schema}.estadisticas_precalculadas
+        SET analisis_id = %s
+        WHERE fecha_inicio = %s AND fecha_fin = %s AND fecha_calculo = %s
+    """,
+
+    # ---------------- analisis_ia ----------------
+    "analisis.crear": """
+        INSERT INTO {schema}.analisis_ia
+        (fecha_inicio, fecha_fin, resumen, recomendaciones, modelo_usado,
+         tokens_prompt, tokens_completion, prompt_ms, llm_ms, reintentos, registros_entrada)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING """ + COLUMNAS_ANALISIS,
+    "analisis.obtener_por_id": """
+        SELECT """ + COLUMNAS_ANALISIS + """
+        FROM {schema}.analisis_ia
+        WHERE id = %s
+    """,
+
+    "analisis.metricas_llm": """
+        SELECT
+            fecha_creacion::date AS dia,
+            modelo_usado AS modelo,
+            COUNT(*) AS analisis,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY llm_ms) AS llm_ms_p50,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY llm_ms) AS llm_ms_p95,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY prompt_ms) AS prompt_ms_p50,
+            SUM(tokens_prompt) AS tokens_prompt,
+            SUM(tokens_completion) AS tokens_completion,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY tokens_prompt) AS tokens_prompt_p50,
+            percentile_cont(0.95) WITHIN GROUP (ORDER BY tokens_prompt) AS tokens_prompt_p95,
+            SUM(reintentos) AS reintentos,
+            AVG(registros_entrada) AS registros_entrada_media
+        FROM {schema}.analisis_ia
+        WHERE fecha_creacion >= %s
+          AND fecha_creacion < %s::date + 1
+          AND llm_ms IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """,
+    "analisis.resumenes_semanales": """
+        SELECT fecha_inicio, fecha_fin, huella, resumen
+        FROM {schema}.resumenes_semanales
+        WHERE fecha_inicio BETWEEN %s AND %s
+    """,
+
+    # ---------------- anomalías ----------------
+    "anomalias.crear_estados": """
+        INSERT INTO {schema}.anomalias_estado (tipo_residuo_id)
+        SELECT unnest(%s::int[])
+        ON CONFLICT (tipo_residuo_id) DO NOTHING
+    """,
+    "anomalias.bloquear_estados": """
+        SELECT tipo_residuo_id, n, media, varianza, ultimo_dia
+        FROM {schema}.anomalias_estado
+        WHERE tipo_residuo_id = ANY(%s::int[])
+        ORDER BY tipo_residuo_id
+        FOR UPDATE
+    """,
+    "anomalias.listar_por_rango": """
+        SELECT
+            a.tipo_residuo_id,
+            t.nombre AS tipo_residuo,
+            a.dia,
+            a.total_kg,
+            a.media_base_kg,
+            a.desviacion_base_kg,
+            a.z_score,
+            a.fecha_deteccion
+        FROM {schema}.anomalias_residuos a
+        JOIN {schema}.tipos_residuos t
+            ON t.id = a.tipo_residuo_id
+        WHERE a.dia BETWEEN %s AND %s
+        ORDER BY a.dia ASC, a.tipo_residuo_id ASC
+    """,
+}
+
+# Mismo agregado que estadisticas_por_rango, guardado como JSON
+CONSULTAS["precalculadas.calcular"] = """
+    INSERT INTO {schema}.estadisticas_precalculadas (fecha_inicio, fecha_fin, datos)
+    SELECT %s::date, %s::date, COALESCE(jsonb_agg(to_jsonb(e) ORDER BY e.total_kg DESC), '[]'::jsonb)
+    FROM (""" + CONSULTAS["residuos.estadisticas_por_rango"] + """) e
+    ON CONFLICT (fecha_inicio, fecha_fin) DO NOTHING
+"""
+
+
+@dataclass(frozen=True)
+class Sentencia:
+    nombre: str
+    sql: str               # texto con %s para ejecución directa
+    preparada: str         # nombre del prepared statement en el servidor
+    prepare_sql: str       # PREPARE ... AS <sql con $n>
+    execute_sql: str       # EXECUTE nombre (%s, ...)
+    es_lectura: bool
+
+
+def _es_lectura(sql: str) -> bool:
+    # Un WITH puede esconder un DELETE/INSERT/UPDATE (CTE que modifica datos)
+    texto = sql.upper()
+    return (
+        texto.lstrip().startswith(("SELECT", "WITH"))
+        and re.search(r"\b(INSERT|UPDATE|DELETE)\b", texto) is None
+    )
+
+
+@lru_cache(maxsize=None)
+def sentencia(nombre: str, schema: str) -> Sentencia:
+    """
+    Construye (una sola vez por schema) el texto de una sentencia
+    registrada y sus variantes PREPARE / EXECUTE.
+    """
+    sql = CONSULTAS[nombre].format(schema=schema)
+
+    contador = iter(range(1, sql.count("%s") + 1))
+    sql_posicional = re.sub(r"%s", lambda _: f"${next(contador)}", sql)
+    n_params = sql.count("%s")
+
+    huella = hashlib.md5(f"{schema}:{sql}".encode()).hexdigest()[:10]
+    preparada = f"q_{nombre.replace('.', '_')}_{huella}"[:63]
+    argumentos = f" ({', '.join(['%s'] * n_params)})" if n_params else ""
+
+    return Sentencia(
+        nombre=nombre,
+        sql=sql,
+        preparada=preparada,
+        prepare_sql=f"PREPARE {preparada} AS {sql_posicional}",
+        execute_sql=f"EXECUTE {preparada}{argumentos}",
+        es_lectura=_es_lectura(sql),
+    )
+
+
+# Prepared statements ya creados en cada conexión (se liberan con ella)
+_preparadas: "weakref.WeakKeyDictionary[object, set[str]]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def preparar(conn, s: Sentencia) -> str:
+    """
+    Garantiza que `s` está preparada en `conn` y devuelve el EXECUTE a
+    lanzar. Cuenta aciertos (ya preparada en esa conexión) y fallos.
+    """
+    with _lock:
+        ya_preparadas = _preparadas.setdefault(conn, set())
+        acierto = s.preparada in ya_preparadas
+
+    if acierto:
+        metrics.incrementar("prepared.aciertos")
+        return s.execute_sql
+
+    metrics.incrementar("prepared.fallos")
+    conn.cursor().execute(s.prepare_sql)
+    with _lock:
+        ya_preparadas.add(s.preparada)
+    return s.execute_sql
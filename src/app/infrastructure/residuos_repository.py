@@ -1,68 +1,153 @@
+from contextlib import contextmanager
 from datetime import date
-import psycopg2.extras
 from typing import List, Dict, Any
+
+import psycopg2.errors
+
 from app.config.settings import settings
+from app.infrastructure.base_repository import BaseRepository
+from app.infrastructure.cambios import CANAL, carga_cambio
+
+# Clave natural soportada por el índice único parcial uq_registros_residuos_clave_natural
+CLAVE_NATURAL = ("dia", "tipo_residuo_id", "source_line_id")
+
+
+class RegistroDuplicadoError(ValueError):
+    """
+    Una inserción (modo insertar) repite la clave natural de un registro
+    existente o de otro del mismo lote.
+    """
+
+
+@contextmanager
+def _sin_duplicados():
+    try:
+        yield
+    except psycopg2.errors.UniqueViolation as e:
+        detalle = e.diag.message_detail or str(e).strip()
+        raise RegistroDuplicadoError(f"Registro duplicado: {detalle}") from e
+
+
+class ResiduosRepository(BaseRepository):
+
+    @property
+    def agrupa_escrituras(self) -> bool:
+        """
+        True si `crear` pasa por el buffer de group commit. El buffer
+        confirma por su cuenta, así que no se usa dentro de una unidad
+        de trabajo.
+        """
+        return self.sesion.uow is None and self.sesion.buffer_escritura() is not None
 
-class ResiduosRepository:
-    def __init__(self, conn):
-        self.conn = conn
-        self.schema = settings.POSTGRES_SCHEMA
+    def crear(self, dia, cantidad_kg, tipo_residuo_id, source_line_id=None) -> int:
+        if self.agrupa_escrituras:
+            # Group commit: el id se devuelve tras el commit del lote agrupado
+            with _sin_duplicados():
+                residuo_id = self.sesion.buffer_escritura().enviar(
+                    dia, cantidad_kg, tipo_residuo_id, source_line_id,
+                    timeout=settings.WRITE_BUFFER_TIMEOUT_S,
+                )
+            self.sesion.marcar_escritura()
+            return residuo_id
 
-    def crear(self, dia, cantidad_kg, tipo_residuo_id) -> int:
-        cursor = self.conn.cursor()
-        cursor.execute(f"""
-            INSERT INTO {self.schema}.registros_residuos
-            (dia, cantidad_kg, tipo_residuo_id)
-            VALUES (%s, %s, %s)
-            RETURNING id
-        """, (dia, cantidad_kg, tipo_residuo_id))
+        with _sin_duplicados():
+            cursor = self._ejecutar_consulta(
+                "residuos.crear", (dia, cantidad_kg, tipo_residuo_id, source_line_id)
+            )
 
         residuo_id = cursor.fetchone()[0]
-        self.conn.commit()
+        self._registrar_cambio(dia, dia)
+        self._confirmar()
         return residuo_id
     
-    def crear_lote(self, registros: list[dict]) -> int:
+    def _registrar_cambio(self, desde: date, hasta: date) -> None:
         """
-        Inserta múltiples registros en registros_residuos.
+        NOTIFY del cambio e invalidación de las estadísticas precalculadas
+        que lo solapan, en la transacción de la escritura.
         """
-        cursor = self.conn.cursor()
+        self._ejecutar_consulta(
+            "residuos.registrar_cambio",
+            (hasta, desde, CANAL, carga_cambio(self.schema, "residuos", desde, hasta)),
+        )
+        self._anotar_cambio("residuos", desde, hasta)
 
+    def crear_lote(self, registros: list[dict]) -> int:
+        """
+        Inserta múltiples registros en registros_residuos. Una clave
+        natural repetida rechaza el lote con RegistroDuplicadoError.
+        """
         values = [
-            (r["dia"], r["cantidad_kg"], r["tipo_residuo_id"])
+            (r["dia"], r["cantidad_kg"], r["tipo_residuo_id"], r.get("source_line_id"))
             for r in registros
         ]
 
-        cursor.executemany(
-            f"""
-            INSERT INTO {self.schema}.registros_residuos
-            (dia, cantidad_kg, tipo_residuo_id)
-            VALUES (%s, %s, %s)
-            """
-        , values)
+        with _sin_duplicados():
+            self._ejecutar(
+                "residuos.crear_lote",
+                f"""
+                INSERT INTO {self.schema}.registros_residuos
+                (dia, cantidad_kg, tipo_residuo_id, source_line_id)
+                VALUES (%s, %s, %s, %s)
+                """,
+                values,
+                many=True,
+            )
 
-        self.conn.commit()
+        if values:
+            dias = [v[0] for v in values]
+            self._registrar_cambio(min(dias), max(dias))
+        self._confirmar()
 
         return len(values)
-    
-    def obtener_por_id(self, registro_id: int):
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        cursor.execute(
+    def upsert_lote(self, registros: list[dict]) -> dict:
+        """
+        Inserta o actualiza registros por su clave natural
+        (dia, tipo_residuo_id, source_line_id) con un único
+        INSERT ... ON CONFLICT multi-fila.
+
+        Las filas cuya cantidad no cambia no se reescriben. Si la clave se
+        repite dentro del lote, prevalece la última aparición.
+        """
+        por_clave = {}
+        for r in registros:
+            clave = (r["dia"], r["tipo_residuo_id"], r["source_line_id"])
+            por_clave[clave] = (r["dia"], r["cantidad_kg"], r["tipo_residuo_id"], r["source_line_id"])
+        values = list(por_clave.values())
+
+        filas = self._ejecutar_valores(
+            "residuos.upsert_lote",
             f"""
-            SELECT 
-                r.id,
-                r.dia,
-                r.cantidad_kg,
-                r.tipo_residuo_id,
-                t.nombre AS tipo_residuo,
-                t.descripcion AS descripcion_tipo_residuo,
-                r.fecha_creacion
-            FROM {self.schema}.registros_residuos r
-            JOIN {self.schema}.tipos_residuos t
-                ON r.tipo_residuo_id = t.id
-            WHERE r.id = %s
+            INSERT INTO {self.schema}.registros_residuos AS rr
+            (dia, cantidad_kg, tipo_residuo_id, source_line_id)
+            VALUES %s
+            ON CONFLICT (dia, tipo_residuo_id, source_line_id)
+                WHERE source_line_id IS NOT NULL
+            DO UPDATE SET cantidad_kg = EXCLUDED.cantidad_kg
+                WHERE rr.cantidad_kg IS DISTINCT FROM EXCLUDED.cantidad_kg
+            RETURNING (xmax = 0) AS insertado
             """,
-            (registro_id,)
+            values,
+        )
+
+        if filas:
+            dias = [v[0] for v in values]
+            self._registrar_cambio(min(dias), max(dias))
+        self._confirmar()
+
+        insertados = sum(1 for f in filas if f[0])
+        actualizados = len(filas) - insertados
+
+        return {
+            "insertados": insertados,
+            "actualizados": actualizados,
+            "sin_cambios": len(values) - len(filas),
+            "duplicados_en_lote": len(registros) - len(values),
+        }
+    
+    def obtener_por_id(self, registro_id: int):
+        cursor = self._ejecutar_consulta(
+            "residuos.obtener_por_id", (registro_id,), dict_rows=True, lectura=True
         )
 
         return cursor.fetchone()
@@ -70,55 +155,160 @@ class ResiduosRepository:
 
 
     def listar_por_rango(self, fecha_inicio, fecha_fin):
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor = self._ejecutar_consulta(
+            "residuos.listar_por_rango", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
+
+        return cursor.fetchall()
+    
+    def ultimo_id(self) -> int:
+        cursor = self._ejecutar_consulta("residuos.ultimo_id", lectura=True)
+        return cursor.fetchone()[0]
+
+    def listar_nuevos(self, desde_id: int, hasta_id: int, fecha_inicio: date, fecha_fin: date, limite: int):
+        """
+        Registros con id en (desde_id, hasta_id] y día dentro del rango,
+        en orden de id y como mucho `limite`.
+        """
+        cursor = self._ejecutar_consulta(
+            "residuos.listar_nuevos",
+            (desde_id, hasta_id, fecha_inicio, fecha_fin, limite),
+            dict_rows=True,
+            lectura=True,
+        )
+        return cursor.fetchall()
+    
+    def estadisticas_por_rango(self, fecha_inicio: date, fecha_fin: date):
+        cursor = self._ejecutar_consulta(
+            "residuos.estadisticas_por_rango", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
+
+        return cursor.fetchall()
+
+    def estadisticas_multi_rango(self, rangos: list[tuple[date, date]]):
+        """
+        Estadísticas por tipo para varios rangos en una sola pasada: los
+        registros entre el mínimo y el máximo de todos los rangos se leen
+        una vez y se agregan por (índice de rango, tipo).
+        """
+        indices = list(range(len(rangos)))
+        inicios = [r[0] for r in rangos]
+        fines = [r[1] for r in rangos]
+
+        cursor = self._ejecutar_consulta(
+            "residuos.estadisticas_multi_rango",
+            (indices, inicios, fines, min(inicios), max(fines)),
+            dict_rows=True,
+            lectura=True,
+        )
+
+        return cursor.fetchall()
+
+    def obtener_precalculadas(self, fecha_inicio: date, fecha_fin: date):
+        cursor = self._ejecutar_consulta(
+            "precalculadas.obtener", (fecha_inicio, fecha_fin), dict_rows=True, lectura=True
+        )
+        return cursor.fetchone()
+
+    def precalcular(self, fecha_inicio: date, fecha_fin: date) -> bool:
+        """
+        Guarda las estadísticas del rango si aún no estaban. El bloqueo
+        SHARE ROW EXCLUSIVE espera a las escrituras en curso que ya las
+        invalidaron y hace esperar a las nuevas hasta el commit, así que
+        nunca queda guardado un agregado anterior a una escritura.
+        """
+        self._ejecutar(
+            "precalculadas.bloquear",
+            f"LOCK TABLE {self.schema}.estadisticas_precalculadas IN SHARE ROW EXCLUSIVE MODE",
+        )
+        cursor = self._ejecutar_consulta(
+            "precalculadas.calcular", (fecha_inicio, fecha_fin, fecha_inicio, fecha_fin)
+        )
+        guardada = cursor.rowcount > 0
+        self._confirmar()
+        return guardada
 
-        cursor.execute(
+    def vincular_analisis_precalculado(self, fecha_inicio: date, fecha_fin: date, fecha_calculo, analisis_id: int) -> None:
+        """
+        Asocia un análisis a las estadísticas de las que salió; si entre
+        medias se invalidaron (otra `fecha_calculo`), no se asocia.
+        """
+        self._ejecutar_consulta(
+            "precalculadas.vincular_analisis", (analisis_id, fecha_inicio, fecha_fin, fecha_calculo)
+        )
+        self._confirmar()
+
+    def huellas_semanales(self, fecha_inicio: date, fecha_fin: date):
+        """
+        Una fila por semana natural (lunes a domingo, recortada al rango)
+        con el número de registros y una huella md5 de su contenido; la
+        huella cambia si se inserta, modifica o borra cualquier registro
+        de esa semana.
+        """
+        cursor = self._ejecutar_consulta(
+            "residuos.huellas_semanales",
+            (fecha_inicio, fecha_fin, fecha_inicio, fecha_fin),
+            dict_rows=True,
+            lectura=True,
+        )
+        return cursor.fetchall()
+
+    def listar_por_rangos(self, rangos: list[tuple[date, date]]):
+        """
+        Registros de varios rangos en una consulta, etiquetados con el
+        índice del rango (`idx`) al que pertenecen.
+        """
+        cursor = self._ejecutar_consulta(
+            "residuos.listar_por_rangos",
+            (list(range(len(rangos))), [r[0] for r in rangos], [r[1] for r in rangos]),
+            dict_rows=True,
+            lectura=True,
+        )
+        return cursor.fetchall()
+
+    def iterar_registros(self, fecha_inicio: date, fecha_fin: date, tamano_lote: int):
+        return self._iterar_lotes(
+            "residuos.exportar_registros",
             f"""
-            SELECT 
+            SELECT
                 r.id,
                 r.dia,
-                r.cantidad_kg,
+                r.cantidad_kg::float8,
                 r.tipo_residuo_id,
-                t.nombre AS tipo_residuo,
-                t.descripcion AS descripcion_tipo_residuo,
-                r.fecha_creacion
+                t.nombre,
+                t.descripcion,
+                r.fecha_creacion,
+                r.source_line_id
             FROM {self.schema}.registros_residuos r
             JOIN {self.schema}.tipos_residuos t
                 ON r.tipo_residuo_id = t.id
             WHERE r.dia BETWEEN %s AND %s
-            ORDER BY r.dia ASC
+            ORDER BY r.dia ASC, r.id ASC
             """,
-            (fecha_inicio, fecha_fin)
+            (fecha_inicio, fecha_fin),
+            tamano_lote,
         )
 
-        return cursor.fetchall()
-    
-    def estadisticas_por_rango(self, fecha_inicio: date, fecha_fin: date):
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(f"""
-            SELECT 
-                tr.id AS tipo_id,
-                tr.nombre AS tipo_residuo,
-                tr.descripcion AS descripcion_tipo_residuo,
-
-                COUNT(rr.id) AS cantidad_registros,
-                SUM(rr.cantidad_kg) AS total_kg,
-                AVG(rr.cantidad_kg) AS promedio_kg,
-                MIN(rr.cantidad_kg) AS minimo_kg,
-                MAX(rr.cantidad_kg) AS maximo_kg
-
+    def iterar_estadisticas_diarias(self, fecha_inicio: date, fecha_fin: date, tamano_lote: int):
+        return self._iterar_lotes(
+            "residuos.exportar_estadisticas_diarias",
+            f"""
+            SELECT
+                rr.dia,
+                tr.id,
+                tr.nombre,
+                COUNT(rr.id),
+                SUM(rr.cantidad_kg)::float8,
+                AVG(rr.cantidad_kg)::float8,
+                MIN(rr.cantidad_kg)::float8,
+                MAX(rr.cantidad_kg)::float8
             FROM {self.schema}.registros_residuos rr
             JOIN {self.schema}.tipos_residuos tr
                 ON tr.id = rr.tipo_residuo_id
-
             WHERE rr.dia BETWEEN %s AND %s
-            GROUP BY tr.id, tr.nombre, tr.descripcion
-            ORDER BY total_kg DESC;
-        """, (fecha_inicio, fecha_fin))
-
-        return cursor.fetchall()
-
-
-
-    
-
+            GROUP BY rr.dia, tr.id, tr.nombre
+            ORDER BY rr.dia ASC, tr.id ASC
+            """,
+            (fecha_inicio, fecha_fin),
+            tamano_lote,
+        )
@@ -0,0 +1,181 @@
+import functools
+import inspect
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Tuple
+
+# Muestreador de la petición en curso (lo fija el middleware de perfilado)
+_perfil_actual: ContextVar["MuestreadorPerfil | None"] = ContextVar("perfil_actual", default=None)
+
+
+class MuestreadorPerfil:
+    """
+    Profiler de muestreo basado en `sys._current_frames()`.
+
+    Solo se muestrean los hilos registrados por la propia petición (ver
+    `en_perfil` y `propagar_perfil`), y de cada uno solo la pila que
+    cuelga del frame con el que se registró: las demás peticiones y los
+    hilos de fondo del proceso nunca aparecen en el perfil. El resultado
+    se exporta en el formato JSON de speedscope (https://www.speedscope.app).
+    """
+
+    def __init__(self, intervalo_ms: float = 5.0):
+        self.intervalo = intervalo_ms / 1000
+        self._frames: List[Dict[str, Any]] = []
+        self._indice_frames: Dict[Tuple[str, str, int], int] = {}
+        self._muestras: Dict[int, List[Tuple[List[int], float]]] = {}
+        self._nombres_hilos: Dict[int, str] = {}
+        self._raices: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._ejecutar, name="muestreador-perfil", daemon=True)
+        self._inicio = 0.0
+        self._fin = 0.0
+
+    def iniciar(self):
+        """
+        Arranca el muestreo y lo asocia al contexto actual. Devuelve el
+        token para `detener`.
+        """
+        token = _perfil_actual.set(self)
+        self._inicio = time.perf_counter()
+        self._hilo.start()
+        return token
+
+    def detener(self, token) -> None:
+        _perfil_actual.reset(token)
+        self._detener.set()
+        self._hilo.join()
+        self._fin = time.perf_counter()
+
+    def registrar_hilo(self, raiz) -> None:
+        hilo = threading.current_thread()
+        with self._lock:
+            self._raices[hilo.ident] = raiz
+            self._nombres_hilos[hilo.ident] = hilo.name
+
+    def liberar_hilo(self) -> None:
+        with self._lock:
+            self._raices.pop(threading.get_ident(), None)
+
+    def _indice(self, frame) -> int:
+        code = frame.f_code
+        clave = (code.co_name, code.co_filename, code.co_firstlineno)
+        indice = self._indice_frames.get(clave)
+        if indice is None:
+            indice = len(self._frames)
+            self._indice_frames[clave] = indice
+            self._frames.append({"name": clave[0], "file": clave[1], "line": clave[2]})
+        return indice
+
+    def _pila(self, frame, raiz) -> List[int] | None:
+        # Solo la parte de la pila que ejecuta código de la petición; si la
+        # raíz no está (corrutina suspendida, hilo ya devuelto) no hay muestra
+        pila = []
+        while frame is not None:
+            pila.append(self._indice(frame))
+            if frame is raiz:
+                pila.reverse()
+                return pila
+            frame = frame.f_back
+        return None
+
+    def _ejecutar(self) -> None:
+        anterior = time.perf_counter()
+
+        while not self._detener.wait(self.intervalo):
+            ahora = time.perf_counter()
+            peso = (ahora - anterior) * 1000
+            anterior = ahora
+
+            with self._lock:
+                raices = list(self._raices.items())
+            if not raices:
+                continue
+
+            frames = sys._current_frames()
+            for hilo_id, raiz in raices:
+                frame = frames.get(hilo_id)
+                pila = self._pila(frame, raiz) if frame is not None else None
+                if pila is not None:
+                    self._muestras.setdefault(hilo_id, []).append((pila, peso))
+
+    def speedscope(self, nombre: str) -> Dict[str, Any]:
+        duracion_ms = (self._fin - self._inicio) * 1000
+        perfiles = []
+
+        for hilo_id, muestras in self._muestras.items():
+            perfiles.append({
+                "type": "sampled",
+                "name": self._nombres_hilos.get(hilo_id, str(hilo_id)),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": duracion_ms,
+                "samples": [pila for pila, _ in muestras],
+                "weights": [peso for _, peso in muestras],
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nombre,
+            "exporter": "waste-api",
+            "shared": {"frames": self._frames},
+            "profiles": perfiles,
+        }
+
+
+def _envolver(fn: Callable, obtener: Callable[[], "MuestreadorPerfil | None"]) -> Callable:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def envuelto_async(*args, **kwargs):
+            muestreador = obtener()
+            if muestreador is None:
+                return await fn(*args, **kwargs)
+            # El frame de la corrutina solo está en la pila del event loop
+            # mientras ejecuta código de esta petición
+            muestreador.registrar_hilo(sys._getframe())
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                muestreador.liberar_hilo()
+
+        envuelto_async.__perfilable__ = True
+        return envuelto_async
+
+    @functools.wraps(fn)
+    def envuelto(*args, **kwargs):
+        muestreador = obtener()
+        if muestreador is None:
+            return fn(*args, **kwargs)
+        muestreador.registrar_hilo(sys._getframe())
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            muestreador.liberar_hilo()
+
+    envuelto.__perfilable__ = True
+    return envuelto
+
+
+def en_perfil(fn: Callable) -> Callable:
+    """
+    Envuelve un endpoint para que, si su petición se está perfilando, se
+    muestree el hilo que lo ejecuta mientras dura la llamada.
+    """
+    if getattr(fn, "__perfilable__", False):
+        return fn
+    return _envolver(fn, _perfil_actual.get)
+
+
+def propagar_perfil(fn: Callable) -> Callable:
+    """
+    Para tareas que la petición envía a un ThreadPoolExecutor (que no
+    copia el contexto): el muestreador se toma al envolver, en el hilo
+    de la petición, y el hilo hijo se registra al ejecutar.
+    """
+    muestreador = _perfil_actual.get()
+    if muestreador is None:
+        return fn
+    return _envolver(fn, lambda: muestreador)
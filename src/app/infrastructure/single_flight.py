@@ -0,0 +1,99 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable
+
+from app.infrastructure import metrics
+from app.infrastructure.admission import CapacidadAgotadaError
+
+
+@dataclass
+class _Vuelo:
+    listo: threading.Event = field(default_factory=threading.Event)
+    resultado: Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas concurrentes: mientras una
+    computación con la misma clave está en curso, los demás llamadores
+    esperan y reciben su resultado (o su excepción) en lugar de repetirla.
+
+    No es una caché: en cuanto la computación termina, la siguiente
+    llamada con la misma clave vuelve a ejecutarse.
+
+    Si la computación del líder falla con una excepción de
+    `reintentar_en` (por ejemplo, su cliente se desconectó), los que
+    esperaban no la heredan: vuelven a intentarlo y uno pasa a ser líder.
+    Con cualquier otra excepción cada uno recibe su propia copia. Un
+    seguidor espera como mucho `espera_max_s`; después lanza
+    CapacidadAgotadaError (503).
+    """
+
+    def __init__(
+        self, nombre: str, espera_max_s: float | None = None,
+        reintentar_en: tuple[type[BaseException], ...] = (),
+    ):
+        self.nombre = nombre
+        self.espera_max_s = espera_max_s
+        self.reintentar_en = reintentar_en
+        self._lock = threading.Lock()
+        self._en_curso: Dict[Hashable, _Vuelo] = {}
+        _grupos[nombre] = self
+
+    def hacer(self, clave: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            vuelo = self._en_curso.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_curso[clave] = _Vuelo()
+
+        if not lider:
+            metrics.incrementar(f"single_flight.{self.nombre}.compartidas")
+            if not vuelo.listo.wait(self.espera_max_s):
+                metrics.incrementar(f"single_flight.{self.nombre}.esperas_agotadas")
+                raise CapacidadAgotadaError(f"cálculo compartido de {self.nombre}")
+            if isinstance(vuelo.error, self.reintentar_en):
+                return self.hacer(clave, fn)
+            if vuelo.error is not None:
+                raise _copia(vuelo.error) from vuelo.error
+            return vuelo.resultado
+
+        metrics.incrementar(f"single_flight.{self.nombre}.ejecutadas")
+        try:
+            vuelo.resultado = fn()
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+            vuelo.listo.set()
+
+
+def _copia(error: BaseException) -> BaseException:
+    # Una excepción por seguidor (el traceback de cada hilo no se mezcla
+    # con el del líder), con los mismos args y atributos, sin volver a
+    # ejecutar su __init__
+    copia = type(error).__new__(type(error), *error.args)
+    copia.args = error.args
+    copia.__dict__.update(error.__dict__)
+    return copia
+
+
+_grupos: Dict[str, SingleFlight] = {}
+
+
+def ratios_coalescencia() -> Dict[str, float | None]:
+    """
+    Fracción de llamadas de cada grupo que se resolvieron compartiendo
+    una computación ya en curso.
+    """
+    return {
+        nombre: metrics.ratio(
+            f"single_flight.{nombre}.compartidas",
+            f"single_flight.{nombre}.ejecutadas",
+        )
+        for nombre in _grupos
+    }
@@ -1,41 +1,24 @@
-import psycopg2.extras
 from typing import List, Dict, Any, Optional
-from app.config.settings import settings
+from app.infrastructure.base_repository import BaseRepository
 
-class TiposResiduosRepository:
-    def __init__(self, conn):
-        self.conn = conn
-        self.schema = settings.POSTGRES_SCHEMA
+class TiposResiduosRepository(BaseRepository):
 
     def crear(self, nombre: str, descripcion: str | None = None) -> int:
-        cursor = self.conn.cursor()
-        cursor.execute(f"""
-            INSERT INTO {self.schema}.tipos_residuos (nombre, descripcion)
-            VALUES (%s, %s)
-            RETURNING id
-        """, (nombre, descripcion))
+        cursor = self._ejecutar_consulta("tipos.crear", (nombre, descripcion))
 
         new_id = cursor.fetchone()[0]
-        self.conn.commit()
+        self._publicar_cambio("tipos")
+        self._confirmar()
         return new_id
 
     def listar(self) -> List[Dict[str, Any]]:
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(f"""
-            SELECT *
-            FROM {self.schema}.tipos_residuos
-            ORDER BY id ASC
-        """)
+        cursor = self._ejecutar_consulta("tipos.listar", dict_rows=True, lectura=True)
         return cursor.fetchall()
     
     def obtener_por_id(self, tipo_id: int) -> Optional[Dict[str, Any]]:
-        cursor = self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute(f"""
-            SELECT *
-            FROM {self.schema}.tipos_residuos
-            WHERE id = %s
-            LIMIT 1
-        """, (tipo_id,))
+        cursor = self._ejecutar_consulta(
+            "tipos.obtener_por_id", (tipo_id,), dict_rows=True, lectura=True
+        )
         result = cursor.fetchone()
         return result 
     
@@ -0,0 +1,81 @@
+import itertools
+import logging
+from contextlib import contextmanager
+
+from app.infrastructure.cambios import despachar_confirmados
+
+logger = logging.getLogger(__name__)
+
+
+class UnidadDeTrabajo:
+    """
+    Transacción de una operación lógica sobre la conexión primaria de la
+    sesión. Mientras está activa, `BaseRepository._confirmar` no hace
+    commit: todas las escrituras se confirman (o se descartan) juntas al
+    salir de `unidad_de_trabajo`.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.hubo_escritura = False
+        self._savepoints = itertools.count(1)
+
+    def registrar_escritura(self) -> None:
+        self.hubo_escritura = True
+
+    def commit_asincrono(self) -> None:
+        """
+        `synchronous_commit = off` solo para esta transacción: el commit no
+        espera al flush del WAL. Una caída puede perder las últimas
+        transacciones confirmadas (nunca corromperlas), así que solo debe
+        usarse en cargas idempotentes que se pueden repetir.
+        """
+        self.conn.cursor().execute("SET LOCAL synchronous_commit = off")
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Aísla un tramo de la transacción: si falla, se deshace solo ese
+        tramo y la excepción se propaga; el resto de la unidad sigue viva.
+        """
+        nombre = f"uow_sp_{next(self._savepoints)}"
+        cursor = self.conn.cursor()
+        cursor.execute(f"SAVEPOINT {nombre}")
+        try:
+            yield
+        except BaseException:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {nombre}")
+            raise
+        cursor.execute(f"RELEASE SAVEPOINT {nombre}")
+
+
+@contextmanager
+def unidad_de_trabajo(sesion, commit_sincrono: bool = True):
+    """
+    Abre una unidad de trabajo en la sesión, o se une a la que ya esté
+    abierta (las unidades anidadas no hacen commit propio).
+    """
+    actual = sesion.uow
+    if actual is not None:
+        if not commit_sincrono:
+            actual.commit_asincrono()
+        yield actual
+        return
+
+    uow = UnidadDeTrabajo(sesion.primaria)
+    sesion.uow = uow
+    try:
+        if not commit_sincrono:
+            uow.commit_asincrono()
+        yield uow
+        uow.conn.commit()
+    except BaseException:
+        uow.conn.rollback()
+        sesion.cambios_pendientes.clear()
+        raise
+    finally:
+        sesion.uow = None
+
+    despachar_confirmados(sesion.cambios_pendientes)
+    if uow.hubo_escritura:
+        sesion.marcar_escritura()
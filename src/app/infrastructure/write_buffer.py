@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app.infrastructure import metrics, query_registry
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.cambios import CANAL, Cambio, carga_cambio, despachar_confirmados
+from app.infrastructure.query_instrumentation import (
+    ejecutar_instrumentado,
+    ejecutar_valores_instrumentado,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class _Pendiente:
+    valores: tuple
+    listo: threading.Event = field(default_factory=threading.Event)
+    id: Optional[int] = None
+    error: Optional[Exception] = None
+
+
+class BufferEscritura:
+    """
+    Agrupa inserciones individuales en registros_residuos (group commit).
+
+    Las peticiones concurrentes se acumulan durante `espera_ms` o hasta
+    `max_filas` y un hilo dedicado las vuelca con un único INSERT
+    multi-fila y un único commit. Cada llamador recibe su propio id y
+    solo retorna después del commit, así que la confirmación es durable.
+
+    El volcado usa una conexión propia (`conectar`), fuera del pool de
+    las peticiones: con el pool agotado por peticiones que esperan al
+    buffer, el buffer no podría volcar. `tras_volcado(schema, conn,
+    registros)` se ejecuta en la transacción de cada volcado con los
+    registros insertados (dia, tipo_residuo_id).
+
+    Si la fila no se confirma en `timeout` (o el buffer está cerrado) se
+    lanza CapacidadAgotadaError (503). `cerrar` vuelca lo pendiente,
+    detiene el hilo y cierra su conexión.
+    """
+
+    def __init__(
+        self, schema: str, conectar: Callable, max_filas: int, espera_ms: float,
+        tras_volcado: Callable | None = None,
+    ):
+        self.schema = schema
+        self.conectar = conectar
+        self.tras_volcado = tras_volcado
+        self.max_filas = max_filas
+        self.espera = espera_ms / 1000
+        self._conn = None
+        self._cerrado = False
+        self._cola: list[_Pendiente] = []
+        self._cond = threading.Condition()
+        self._hilo = threading.Thread(
+            target=self._bucle, name=f"buffer-escritura-{schema}", daemon=True
+        )
+        self._hilo.start()
+
+    def enviar(self, dia, cantidad_kg, tipo_residuo_id, source_line_id, timeout: float) -> int:
+        pendiente = _Pendiente((dia, cantidad_kg, tipo_residuo_id, source_line_id))
+
+        with self._cond:
+            if self._cerrado:
+                raise CapacidadAgotadaError("buffer de escritura")
+            self._cola.append(pendiente)
+            self._cond.notify()
+
+        if not pendiente.listo.wait(timeout):
+            with self._cond:
+                en_cola = pendiente in self._cola
+                if en_cola:
+                    self._cola.remove(pendiente)
+            if en_cola:
+                # Retirado antes de volcarse: el registro no se insertará
+                metrics.incrementar("admision.rechazos.buffer_escritura")
+                raise CapacidadAgotadaError("buffer de escritura")
+            # Ya está en un volcado: se espera su resultado para no
+            # responder error de un registro que acaba confirmado
+            pendiente.listo.wait()
+        if pendiente.error is not None:
+            raise pendiente.error
+        return pendiente.id
+
+    def cerrar(self, espera_s: float = 0) -> None:
+        """
+        El hilo vuelca lo que quede en la cola y termina; `espera_s`
+        acota cuánto se espera a que lo haga (0: no se espera).
+        """
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+        if espera_s > 0:
+            self._hilo.join(espera_s)
+
+    def _tomar_lote(self) -> list[_Pendiente]:
+        # Lista vacía: buffer cerrado y sin filas pendientes
+        with self._cond:
+            while not self._cola and not self._cerrado:
+                self._cond.wait()
+
+            # Ventana de agrupación desde la primera fila pendiente
+            limite = time.monotonic() + self.espera
+            while len(self._cola) < self.max_filas and not self._cerrado:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+
+            lote = self._cola[:self.max_filas]
+            del self._cola[:self.max_filas]
+            return lote
+
+    def _bucle(self) -> None:
+        while lote := self._tomar_lote():
+            try:
+                self._volcar(lote)
+            except Exception as e:
+                logger.error(f"Error volcando buffer de escritura ({len(lote)} filas): {e}")
+                for p in lote:
+                    if not p.listo.is_set():
+                        p.error = e
+                        p.listo.set()
+
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+        logger.info(f"Buffer de escritura cerrado: schema={self.schema}")
+
+    def _conexion(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.conectar()
+        return self._conn
+
+    def _volcar(self, lote: list[_Pendiente]) -> None:
+        conn = self._conexion()
+        try:
+            cursor = conn.cursor()
+            tabla = f"{self.schema}.registros_residuos"
+
+            # Los ids se reservan antes del INSERT para asignarlos sin ambigüedad
+            ejecutar_instrumentado(
+                conn, cursor, "residuos.reservar_ids",
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                (tabla, len(lote)),
+            )
+            ids = [r[0] for r in cursor.fetchall()]
+
+            try:
+                ejecutar_valores_instrumentado(
+                    conn, cursor, "residuos.crear_agrupado",
+                    f"""
+                    INSERT INTO {tabla}
+                    (id, dia, cantidad_kg, tipo_residuo_id, source_line_id)
+                    VALUES %s
+                    RETURNING id
+                    """,
+                    [(i, *p.valores) for i, p in zip(ids, lote)],
+                )
+                errores = {}
+            except Exception as e:
+                # Aislar la fila culpable sin perder el resto del lote
+                logger.warning(f"Lote agrupado rechazado, reintentando fila a fila: {e}")
+                conn.rollback()
+                errores = self._volcar_fila_a_fila(conn, tabla, ids, lote)
+
+            insertados = [p for i, p in zip(ids, lote) if i not in errores]
+            if insertados and self.tras_volcado is not None:
+                self._ejecutar_tras_volcado(conn, insertados)
+
+            dias = [p.valores[0] for p in insertados]
+            cambios = []
+            if dias:
+                ejecutar_instrumentado(
+                    conn, cursor, "residuos.registrar_cambio",
+                    query_registry.sentencia("residuos.registrar_cambio", self.schema).sql,
+                    (max(dias), min(dias), CANAL, carga_cambio(self.schema, "residuos", min(dias), max(dias))),
+                )
+                cambios.append(Cambio(self.schema, "residuos", min(dias), max(dias)))
+            conn.commit()
+        except Exception:
+            self._deshacer(conn)
+            raise
+
+        # Antes de despertar a los emisores: al leer ya no ven la caché anterior
+        despachar_confirmados(cambios)
+
+        for i, p in zip(ids, lote):
+            p.error = errores.get(i)
+            p.id = None if p.error else i
+            p.listo.set()
+
+        logger.debug(f"Buffer de escritura: {len(lote)} filas en un commit")
+
+    @staticmethod
+    def _deshacer(conn) -> None:
+        try:
+            conn.rollback()
+        except Exception:
+            # Conexión rota: el siguiente volcado abre otra
+            conn.close()
+
+    def _ejecutar_tras_volcado(self, conn, insertados: list[_Pendiente]) -> None:
+        # Un fallo aquí no debe deshacer los registros del lote
+        cursor = conn.cursor()
+        cursor.execute("SAVEPOINT tras_volcado")
+        try:
+            self.tras_volcado(self.schema, conn, [
+                {"dia": p.valores[0], "tipo_residuo_id": p.valores[2]} for p in insertados
+            ])
+            cursor.execute("RELEASE SAVEPOINT tras_volcado")
+        except Exception as e:
+            logger.error(f"Error tras volcar el buffer de escritura: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT tras_volcado")
+
+    def _volcar_fila_a_fila(self, conn, tabla: str, ids: list[int], lote: list[_Pendiente]) -> dict:
+        cursor = conn.cursor()
+        errores = {}
+        for i, p in zip(ids, lote):
+            cursor.execute("SAVEPOINT fila")
+            try:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {tabla}
+                    (id, dia, cantidad_kg, tipo_residuo_id, source_line_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    (i, *p.valores),
+                )
+                cursor.execute("RELEASE SAVEPOINT fila")
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT fila")
+                errores[i] = e
+        return errores
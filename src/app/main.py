@@ -1,14 +1,51 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 import psycopg2
 from datetime import datetime
 
 from app.application.waste_controller import router as waste_router
+from app.application.dashboard_en_vivo import dashboard_en_vivo
+from app.application.tareas_programadas import configurar_planificador
 from app.config.settings import settings
+from app.config.admission_config import setup_admission
 from app.config.cors_config import setup_cors
+from app.config.profiling_config import setup_profiling
+from app.config.timeout_config import setup_timeouts
+from app.infrastructure import metrics
+from app.infrastructure.admission import estado_admision
+from app.infrastructure.cambios import escucha_cambios
+from app.infrastructure.planificador import planificador
+from app.infrastructure.single_flight import ratios_coalescencia
+from app.infrastructure.query_instrumentation import estadisticas_consultas
+from database import cerrar_buffers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Escucha de eventos de cambio: invalida las cachés locales y
+    # alimenta los dashboards en vivo
+    dashboard_en_vivo.iniciar(asyncio.get_running_loop())
+    if settings.CAMBIOS_ESCUCHA_ENABLED:
+        escucha_cambios.iniciar()
+
+    # Precálculo de estadísticas e informes nocturnos (solo en el líder)
+    if settings.PLANIFICADOR_ENABLED:
+        configurar_planificador(planificador)
+        planificador.iniciar()
+    try:
+        yield
+    finally:
+        planificador.detener()
+        escucha_cambios.detener()
+        # Confirmar las filas que aún esperan en los buffers de escritura
+        cerrar_buffers()
 
 
 def create_app() -> FastAPI:
     app = FastAPI(
+        lifespan=lifespan,
         title="Waste Management API",
         version="1.0.0",
         description="API para registro de residuos y análisis con Azure OpenAI",
@@ -22,11 +59,26 @@ def create_app() -> FastAPI:
         ],
     )
 
+    # -------------------------------------------------------------
+    # Cancelación por desconexión y statement_timeout -> 504
+    # -------------------------------------------------------------
+    setup_timeouts(app)
+
+    # -------------------------------------------------------------
+    # Control de admisión (dentro de CORS para que los 503 lo lleven)
+    # -------------------------------------------------------------
+    setup_admission(app)
+
     # -------------------------------------------------------------
     # CORS
     # -------------------------------------------------------------
     setup_cors(app)
 
+    # -------------------------------------------------------------
+    # Perfilado bajo demanda
+    # -------------------------------------------------------------
+    setup_profiling(app)
+
     # -------------------------------------------------------------
     # Health Check
     # -------------------------------------------------------------
@@ -63,6 +115,36 @@ def create_app() -> FastAPI:
                 "timestamp": datetime.now().isoformat(),
             }
 
+    # -------------------------------------------------------------
+    # Métricas internas
+    # -------------------------------------------------------------
+    @app.get("/waste-api/metrics", tags=["Health"])
+    async def metricas():
+        """
+        Métricas por consulta y contadores del proceso, incluido el
+        ratio de aciertos de sentencias preparadas y de las cachés locales,
+        la ocupación de los grupos de admisión y la fracción de llamadas
+        coalescidas.
+        """
+        return {
+            "consultas": estadisticas_consultas(),
+            "contadores": metrics.contadores(),
+            "prepared_hit_ratio": metrics.ratio("prepared.aciertos", "prepared.fallos"),
+            "admision": estado_admision(),
+            "single_flight_ratio": ratios_coalescencia(),
+            "resumen_semanal_hit_ratio": metrics.ratio(
+                "resumen_semanal.reutilizados", "resumen_semanal.generados"
+            ),
+            "cache_hit_ratio": {
+                nombre: metrics.ratio(f"cache.{nombre}.aciertos", f"cache.{nombre}.fallos")
+                for nombre in ("tipos", "estadisticas")
+            },
+            "escucha_cambios": escucha_cambios.conectada,
+            "dashboard": dashboard_en_vivo.estado(),
+            "planificador": planificador.estado(),
+            "precalculadas_hit_ratio": metrics.ratio("precalculadas.aciertos", "precalculadas.fallos"),
+        }
+
     # -------------------------------------------------------------
     # Routers del sistema
     # -------------------------------------------------------------
@@ -72,6 +154,14 @@ def create_app() -> FastAPI:
         tags=["Waste"],
     )
 
+    # Misma API con la sede en la ruta (alternativa a la cabecera X-Tenant-Id)
+    app.include_router(
+        waste_router,
+        prefix="/waste-api/sedes/{tenant}",
+        tags=["Waste"],
+        include_in_schema=False,
+    )
+
     return app
 
 
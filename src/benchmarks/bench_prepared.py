@@ -0,0 +1,89 @@
+"""
+Compara la latencia por llamada de `ResiduosRepository.obtener_por_id` y
+`listar_por_rango` con y sin sentencias preparadas (PREPARE/EXECUTE) sobre
+una misma conexión.
+
+Requiere una base de datos accesible (DATABASE_URL / POSTGRES_*) con
+registros en el schema indicado.
+
+Uso (desde src/):
+    python -m benchmarks.bench_prepared [--schema waste] [--llamadas 2000]
+        [--desde 2024-01-01] [--hasta 2024-01-07]
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+import psycopg2
+
+from app.config.settings import settings
+from app.infrastructure import metrics
+from app.infrastructure.residuos_repository import ResiduosRepository
+
+
+class _SesionBench:
+    """Sesión mínima: una sola conexión para escrituras y lecturas."""
+
+    def __init__(self, conn, schema: str):
+        self.schema = schema
+        self.primaria = conn
+        self.uow = None
+
+    def lectura(self):
+        return self.primaria
+
+
+def medir(fn, llamadas: int) -> tuple[float, float]:
+    fn()  # calentamiento (incluye el PREPARE)
+    tiempos = []
+    for _ in range(llamadas):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return statistics.median(tiempos), tiempos[int(len(tiempos) * 0.95) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schema", default="waste")
+    parser.add_argument("--llamadas", type=int, default=2000)
+    parser.add_argument("--desde", type=date.fromisoformat, default=date(2024, 1, 1))
+    parser.add_argument("--hasta", type=date.fromisoformat, default=date(2024, 1, 7))
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(settings.DATABASE_URL)
+    conn.autocommit = True
+    repo = ResiduosRepository(_SesionBench(conn, args.schema))
+
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT min(id) FROM {args.schema}.registros_residuos")
+    registro_id = cursor.fetchone()[0]
+    if registro_id is None:
+        raise SystemExit(f"No hay registros en {args.schema}.registros_residuos")
+
+    casos = {
+        "obtener_por_id": lambda: repo.obtener_por_id(registro_id),
+        "listar_por_rango": lambda: repo.listar_por_rango(args.desde, args.hasta),
+    }
+
+    print(f"Llamadas por caso: {args.llamadas}")
+    for nombre, fn in casos.items():
+        resultados = {}
+        for preparadas in (False, True):
+            settings.PREPARED_STATEMENTS_ENABLED = preparadas
+            resultados[preparadas] = medir(fn, args.llamadas)
+
+        (p50_sin, p95_sin), (p50_con, p95_con) = resultados[False], resultados[True]
+        print(f"\n{nombre}")
+        print(f"  sin preparar: p50 {p50_sin:7.3f} ms   p95 {p95_sin:7.3f} ms")
+        print(f"  preparada:    p50 {p50_con:7.3f} ms   p95 {p95_con:7.3f} ms")
+        print(f"  ahorro p50:   {p50_sin - p50_con:7.3f} ms por llamada")
+
+    print(f"\nRatio de aciertos prepared: {metrics.ratio('prepared.aciertos', 'prepared.fallos')}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Compara el coste de CPU de serializar una respuesta de `/registros`:
+
+- ruta DTO: construir ListarResiduosResponseDto, revalidar con el
+  response_model y serializar con json (lo que hace FastAPI por defecto)
+- ruta rápida: serializar las filas de la BD con FastJSONResponse
+
+Uso (desde src/):
+    python -m benchmarks.bench_registros_json [filas]
+"""
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.application.json_response import FastJSONResponse
+from app.dto.waste_dto import ListarResiduosResponseDto
+
+
+def generar_filas(n: int) -> list[dict]:
+    inicio = date(2024, 1, 1)
+    creado = datetime(2024, 1, 1, 8, 30, 15, 123456)
+    return [
+        {
+            "id": i,
+            "dia": inicio + timedelta(days=i % 365),
+            "cantidad_kg": Decimal(f"{(i % 500) / 10:.2f}"),
+            "tipo_residuo_id": i % 6 + 1,
+            "tipo_residuo": f"Tipo {i % 6 + 1}",
+            "descripcion_tipo_residuo": "Residuo orgánico de cocina",
+            "fecha_creacion": creado + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+
+def ruta_dto(filas: list[dict]) -> bytes:
+    adapter = TypeAdapter(List[ListarResiduosResponseDto])
+    dtos = [ListarResiduosResponseDto(**f) for f in filas]
+    contenido = adapter.dump_python(adapter.validate_python(dtos), mode="json")
+    return json.dumps(
+        contenido, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def ruta_rapida(filas: list[dict]) -> bytes:
+    return FastJSONResponse(filas).body
+
+
+def medir(fn, filas, repeticiones: int = 5) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        fn(filas)
+        mejor = min(mejor, time.process_time() - inicio)
+    return mejor * 1000
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    filas = generar_filas(n)
+
+    assert json.loads(ruta_dto(filas)) == json.loads(ruta_rapida(filas))
+
+    dto_ms = medir(ruta_dto, filas)
+    rapida_ms = medir(ruta_rapida, filas)
+
+    print(f"Filas: {n}")
+    print(f"Ruta DTO + response_model: {dto_ms:8.1f} ms CPU")
+    print(f"Ruta FastJSONResponse:     {rapida_ms:8.1f} ms CPU")
+    print(f"Ahorro:                    {dto_ms - rapida_ms:8.1f} ms ({dto_ms / rapida_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Mide el tiempo de arranque en frío (`import app.main`) en procesos nuevos
+y falla si supera el presupuesto o si se cargan módulos que deben ser
+diferidos (SDK de IA).
+
+Uso (desde src/):
+    python -m benchmarks.bench_startup [--budget-ms 1500] [--runs 7]
+
+Devuelve código 1 si hay regresión, para usarlo en CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+MODULOS_DIFERIDOS = ("openai", "httpx")
+
+SCRIPT = (
+    "import sys, app.main; "
+    f"print(','.join(m for m in {MODULOS_DIFERIDOS!r} if m in sys.modules))"
+)
+
+
+def medir_arranque() -> tuple[float, str]:
+    inicio = time.perf_counter()
+    salida = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.getcwd(),
+    )
+    return (time.perf_counter() - inicio) * 1000, salida.stdout.strip()
+
+
+def importaciones_mas_costosas(n: int = 10) -> list[tuple[int, str]]:
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    costos = []
+    for linea in salida.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(.*)", linea)
+        if m:
+            costos.append((int(m.group(1)), m.group(2).strip()))
+    return sorted(costos, reverse=True)[:n]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 1500)))
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+
+    tiempos = []
+    cargados = ""
+    for _ in range(args.runs):
+        ms, cargados = medir_arranque()
+        tiempos.append(ms)
+
+    mediana = statistics.median(tiempos)
+    print(f"Arranque (mediana de {args.runs}): {mediana:.0f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    print("Importaciones más costosas (acumulado, µs):")
+    for costo, modulo in importaciones_mas_costosas():
+        print(f"  {costo:>9}  {modulo}")
+
+    fallo = False
+    if cargados:
+        print(f"REGRESIÓN: módulos diferidos cargados al arrancar: {cargados}")
+        fallo = True
+    if mediana > args.budget_ms:
+        print("REGRESIÓN: arranque por encima del presupuesto")
+        fallo = True
+
+    return 1 if fallo else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
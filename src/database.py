@@ -1,18 +1,63 @@
+import itertools
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+import re
+import threading
+import time
+from typing import Callable
+
 import psycopg2
+import psycopg2.pool
+from fastapi import HTTPException, Request, Response
+
 from app.config.settings import settings
+from app.infrastructure import metrics
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.cambios import Cambio
+from app.infrastructure.cancelacion import SCOPE_CANCELADOR, statement_timeout_ms
+from app.infrastructure.unit_of_work import UnidadDeTrabajo
+from app.infrastructure.write_buffer import BufferEscritura
+
+logger = logging.getLogger(__name__)
 
-def _init_tables(conn):
+_SCHEMA_VALIDO = re.compile(r"^[a-z_][a-z0-9_]{0,62}$")
+
+
+def _agregar_columnas(cursor, schema: str, tabla: str, columnas: dict[str, str]) -> None:
+    """
+    ALTER TABLE ... ADD COLUMN solo para las columnas que faltan: aunque
+    no haya nada que añadir, el ALTER toma ACCESS EXCLUSIVE sobre la
+    tabla y bloquearía sus lecturas en cada arranque.
+    """
+    cursor.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s
+        """,
+        (schema, tabla),
+    )
+    existentes = {r[0] for r in cursor.fetchall()}
+    faltan = [(c, tipo) for c, tipo in columnas.items() if c not in existentes]
+    if faltan:
+        cursor.execute(
+            f"ALTER TABLE {schema}.{tabla} "
+            + ", ".join(f"ADD COLUMN IF NOT EXISTS {c} {tipo}" for c, tipo in faltan)
+        )
+
+
+def _init_tables(conn, schema: str):
     cursor = conn.cursor()
 
     # Crear schema si no existe
-    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {settings.POSTGRES_SCHEMA}")
-    cursor.execute(f"SET search_path TO {settings.POSTGRES_SCHEMA}")
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
 
     # ============================
     # 1. Tipos de residuos
     # ============================
     cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {settings.POSTGRES_SCHEMA}.tipos_residuos (
+        CREATE TABLE IF NOT EXISTS {schema}.tipos_residuos (
             id SERIAL PRIMARY KEY,
             nombre VARCHAR(50) NOT NULL,
             descripcion TEXT
@@ -23,13 +68,13 @@ def _init_tables(conn):
     # 2. Registros de residuos
     # ============================
     cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {settings.POSTGRES_SCHEMA}.registros_residuos (
+        CREATE TABLE IF NOT EXISTS {schema}.registros_residuos (
             id SERIAL PRIMARY KEY,
             dia DATE NOT NULL,
             cantidad_kg DECIMAL(10,2) NOT NULL,
 
             tipo_residuo_id INT NOT NULL 
-                REFERENCES {settings.POSTGRES_SCHEMA}.tipos_residuos(id)
+                REFERENCES {schema}.tipos_residuos(id)
                 ON DELETE CASCADE,
 
             fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -40,7 +85,7 @@ def _init_tables(conn):
     # 3. Análisis generados por IA
     # ============================
     cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {settings.POSTGRES_SCHEMA}.analisis_ia (
+        CREATE TABLE IF NOT EXISTS {schema}.analisis_ia (
             id SERIAL PRIMARY KEY,
 
             fecha_inicio DATE NOT NULL,
@@ -54,22 +99,723 @@ def _init_tables(conn):
         );
     """)
 
+    # Clave natural para ingesta idempotente (upsert)
+    _agregar_columnas(cursor, schema, "registros_residuos", {"source_line_id": "VARCHAR(100)"})
+    cursor.execute(f"""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_registros_residuos_clave_natural
+        ON {schema}.registros_residuos (dia, tipo_residuo_id, source_line_id)
+        WHERE source_line_id IS NOT NULL;
+    """)
+
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_registros_residuos_dia_tipo
+        ON {schema}.registros_residuos (dia, tipo_residuo_id);
+    """)
+
+    # ============================
+    # 4. Detección incremental de anomalías
+    # ============================
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.residuos_diarios (
+            tipo_residuo_id INT NOT NULL
+                REFERENCES {schema}.tipos_residuos(id)
+                ON DELETE CASCADE,
+            dia DATE NOT NULL,
+            total_kg DECIMAL(12,2) NOT NULL,
+            PRIMARY KEY (tipo_residuo_id, dia)
+        );
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.anomalias_estado (
+            tipo_residuo_id INT PRIMARY KEY
+                REFERENCES {schema}.tipos_residuos(id)
+                ON DELETE CASCADE,
+            n INT NOT NULL DEFAULT 0,
+            media DOUBLE PRECISION NOT NULL DEFAULT 0,
+            varianza DOUBLE PRECISION NOT NULL DEFAULT 0,
+            ultimo_dia DATE
+        );
+    """)
+
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.anomalias_residuos (
+            tipo_residuo_id INT NOT NULL
+                REFERENCES {schema}.tipos_residuos(id)
+                ON DELETE CASCADE,
+            dia DATE NOT NULL,
+            total_kg DECIMAL(12,2) NOT NULL,
+            media_base_kg DOUBLE PRECISION NOT NULL,
+            desviacion_base_kg DOUBLE PRECISION NOT NULL,
+            z_score DOUBLE PRECISION NOT NULL,
+            fecha_deteccion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tipo_residuo_id, dia)
+        );
+    """)
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_anomalias_residuos_dia
+        ON {schema}.anomalias_residuos (dia);
+    """)
+
+    # Contabilidad de coste y latencia del modelo por análisis
+    # (NULL en los análisis anteriores a estas columnas)
+    _agregar_columnas(cursor, schema, "analisis_ia", {
+        "tokens_prompt": "INT",
+        "tokens_completion": "INT",
+        "prompt_ms": "DOUBLE PRECISION",
+        "llm_ms": "DOUBLE PRECISION",
+        "reintentos": "INT",
+        "registros_entrada": "INT",
+    })
+
+    # Paginación keyset de GET /analisis
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_analisis_ia_creacion_id
+        ON {schema}.analisis_ia (fecha_creacion DESC, id DESC);
+    """)
+
+    # ============================
+    # 5. Resúmenes semanales (análisis jerárquico)
+    # ============================
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.resumenes_semanales (
+            fecha_inicio DATE NOT NULL,
+            fecha_fin DATE NOT NULL,
+            huella CHAR(32) NOT NULL,
+            registros INT NOT NULL,
+            resumen TEXT NOT NULL,
+            modelo_usado VARCHAR(100),
+            tokens_prompt INT NOT NULL DEFAULT 0,
+            tokens_completion INT NOT NULL DEFAULT 0,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (fecha_inicio, fecha_fin)
+        );
+    """)
+
+    # ============================
+    # 6. Estadísticas precalculadas (planificador)
+    # ============================
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.estadisticas_precalculadas (
+            fecha_inicio DATE NOT NULL,
+            fecha_fin DATE NOT NULL,
+            datos JSONB NOT NULL,
+            analisis_id INT
+                REFERENCES {schema}.analisis_ia(id)
+                ON DELETE SET NULL,
+            fecha_calculo TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+            PRIMARY KEY (fecha_inicio, fecha_fin)
+        );
+    """)
+
     conn.commit()
 
 
-def get_db():
-    conn = psycopg2.connect(
+# ============================================================
+#  Multi-sede: resolución de tenant y pools por schema
+# ============================================================
+def _parametros_primario() -> dict:
+    return dict(
         host=settings.POSTGRES_HOST,
         port=settings.POSTGRES_PORT,
         database=settings.POSTGRES_DB,
         user=settings.POSTGRES_USER,
-        password=settings.POSTGRES_PASSWORD
+        password=settings.POSTGRES_PASSWORD,
     )
-    conn.autocommit = False
 
-    _init_tables(conn)
+
+class PoolRetiradoError(Exception):
+    """El pool se retiró (ver TENANT_POOLS_MAX) y ya no presta conexiones."""
+
+
+class TenantPool:
+    """
+    Pool acotado de conexiones para el schema de un tenant, contra el
+    primario o contra una réplica (`dsn`).
+
+    Si todas las conexiones están en uso, `obtener` espera hasta
+    DB_POOL_TIMEOUT_S y después lanza CapacidadAgotadaError (503).
+
+    Un pool retirado (ver TENANT_POOLS_MAX) lanza PoolRetiradoError en
+    `obtener` y se cierra en cuanto le devuelven la última conexión
+    prestada. Para pedir conexiones se usa `_prestar`, que en ese caso
+    vuelve a resolver el pool.
+    """
+
+    def __init__(self, schema: str, dsn: str | None = None):
+        self.schema = schema
+        self.dsn = dsn
+        self._disponibles = threading.BoundedSemaphore(settings.DB_POOL_MAX)
+        self._en_uso = 0
+        self._retirado = False
+        self._lock = threading.Lock()
+        if dsn:
+            self._pool = psycopg2.pool.ThreadedConnectionPool(
+                settings.DB_POOL_MIN, settings.DB_POOL_MAX, dsn=dsn
+            )
+        else:
+            self._pool = psycopg2.pool.ThreadedConnectionPool(
+                settings.DB_POOL_MIN, settings.DB_POOL_MAX, **_parametros_primario()
+            )
+
+    def obtener(self):
+        # La reserva se toma bajo el mismo lock que `retirar`: un pool no
+        # se cierra con un préstamo en curso ni presta una vez retirado
+        with self._lock:
+            if self._retirado:
+                raise PoolRetiradoError(f"Pool retirado: {self.schema}")
+            self._en_uso += 1
+        try:
+            if not self._disponibles.acquire(timeout=settings.DB_POOL_TIMEOUT_S):
+                metrics.incrementar("admision.rechazos.base_datos")
+                raise CapacidadAgotadaError("conexiones a la base de datos")
+            try:
+                conn = self._pool.getconn()
+                conn.autocommit = False
+            except Exception:
+                self._disponibles.release()
+                raise
+        except BaseException:
+            self._liberar_reserva()
+            raise
+        return conn
+
+    def devolver(self, conn) -> None:
+        try:
+            if not conn.closed:
+                conn.rollback()
+            self._pool.putconn(conn, close=bool(conn.closed) or self._retirado)
+        finally:
+            self._disponibles.release()
+            self._liberar_reserva()
+
+    def _liberar_reserva(self) -> None:
+        with self._lock:
+            self._en_uso -= 1
+            cerrar = self._retirado and self._en_uso == 0
+        if cerrar:
+            self._pool.closeall()
+
+    def retirar(self) -> None:
+        with self._lock:
+            self._retirado = True
+            cerrar = self._en_uso == 0
+        if cerrar:
+            self._pool.closeall()
+
+
+# Pools por orden de uso (LRU), acotados a TENANT_POOLS_MAX
+_pools: "OrderedDict[str, TenantPool]" = OrderedDict()
+_pools_replica: "OrderedDict[tuple[str, str], TenantPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+# Un lock por schema para el bootstrap, fuera del lock global
+_locks_bootstrap: dict[str, threading.Lock] = {}
+_schemas_inicializados: set[str] = set()
+# Buffers de escritura por schema; se cierran al retirar el pool del tenant
+_buffers: dict[str, BufferEscritura] = {}
+
+
+def _usar_pool(pools: OrderedDict, clave):
+    # Llamar con _pools_lock
+    pool = pools.get(clave)
+    if pool is not None:
+        pools.move_to_end(clave)
+    return pool
+
+
+def _registrar_pool(pools: OrderedDict, clave, pool: TenantPool) -> None:
+    # Llamar con _pools_lock
+    pools[clave] = pool
+    while len(pools) > settings.TENANT_POOLS_MAX:
+        clave_retirada, retirado = pools.popitem(last=False)
+        retirado.retirar()
+        buffer = _buffers.pop(clave_retirada, None) if pools is _pools else None
+        if buffer is not None:
+            buffer.cerrar()
+        logger.info(f"Pool retirado por TENANT_POOLS_MAX: {clave_retirada}")
+
+
+def _prestar(obtener_pool: Callable[[], TenantPool]) -> tuple[TenantPool, object]:
+    """
+    Pide una conexión al pool que devuelve `obtener_pool()`. Si un
+    desalojo concurrente lo retiró entre resolverlo y pedirle la conexión,
+    se resuelve de nuevo (y se recrea si hace falta).
+    """
+    while True:
+        pool = obtener_pool()
+        try:
+            return pool, pool.obtener()
+        except PoolRetiradoError:
+            continue
+
+
+def _schema_provisionado(schema: str) -> bool:
+    """
+    El schema por defecto y los de TENANT_SCHEMAS se crean si hace falta;
+    los derivados de TENANT_SCHEMA_PREFIX solo se atienden si ya existen
+    en la base (provisionados fuera de la aplicación).
+    """
+    if schema == settings.POSTGRES_SCHEMA or schema in settings.TENANT_SCHEMAS.values():
+        return True
+
+    pool, conn = _prestar(lambda: _obtener_pool(settings.POSTGRES_SCHEMA))
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM information_schema.schemata WHERE schema_name = %s", (schema,)
+        )
+        return cursor.fetchone() is not None
+    finally:
+        pool.devolver(conn)
+
+
+def _obtener_pool(schema: str) -> TenantPool:
+    """
+    Devuelve el pool del schema, creándolo y aplicando `_init_tables`
+    la primera vez que el proceso atiende a ese tenant. Un schema no
+    provisionado responde 404.
+    """
+    with _pools_lock:
+        pool = _usar_pool(_pools, schema)
+    if pool is not None:
+        return pool
+
+    if not _schema_provisionado(schema):
+        raise HTTPException(status_code=404, detail=f"Sede desconocida: {schema}")
+
+    with _pools_lock:
+        lock = _locks_bootstrap.setdefault(schema, threading.Lock())
+
+    # El bootstrap de un tenant no bloquea a los demás
+    with lock:
+        with _pools_lock:
+            pool = _usar_pool(_pools, schema)
+        if pool is not None:
+            return pool
+
+        pool = TenantPool(schema)
+        try:
+            if schema not in _schemas_inicializados:
+                conn = pool.obtener()
+                try:
+                    _init_tables(conn, schema)
+                finally:
+                    pool.devolver(conn)
+                _schemas_inicializados.add(schema)
+                logger.info(f"Tenant inicializado: schema={schema}")
+        except Exception:
+            pool.retirar()
+            raise
+
+        with _pools_lock:
+            _registrar_pool(_pools, schema, pool)
+    return pool
+
+
+def schemas_conocidos() -> list[str]:
+    """
+    Schema por defecto, los de TENANT_SCHEMAS y, con TENANT_SCHEMA_PREFIX,
+    todos los schemas provisionados en la base con ese prefijo (no solo
+    los que este proceso ha atendido).
+    """
+    schemas = [settings.POSTGRES_SCHEMA, *settings.TENANT_SCHEMAS.values()]
+
+    prefijo = settings.TENANT_SCHEMA_PREFIX
+    if prefijo and not settings.TENANT_SCHEMAS:
+        pool, conn = _prestar(lambda: _obtener_pool(settings.POSTGRES_SCHEMA))
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT schema_name FROM information_schema.schemata
+                WHERE left(schema_name, length(%s)) = %s
+                ORDER BY schema_name
+                """,
+                (prefijo, prefijo),
+            )
+            schemas += [r[0] for r in cursor.fetchall() if _SCHEMA_VALIDO.match(r[0])]
+        finally:
+            pool.devolver(conn)
+
+    return list(dict.fromkeys(schemas))
+
+
+def _obtener_pool_replica(schema: str, dsn: str) -> TenantPool:
+    clave = (schema, dsn)
+    with _pools_lock:
+        pool = _usar_pool(_pools_replica, clave)
+        if pool is None:
+            pool = TenantPool(schema, dsn)
+            _registrar_pool(_pools_replica, clave, pool)
+    return pool
+
+
+_tras_volcado: list = []
+
+
+class SesionVolcado:
+    """
+    Sesión sobre la conexión dedicada del buffer de escritura durante un
+    volcado. La transacción del volcado hace de unidad de trabajo: lo que
+    se escribe con esta sesión se confirma con el commit del lote.
+    """
+
+    def __init__(self, schema: str, conn):
+        self.schema = schema
+        self.primaria = conn
+        self.uow = UnidadDeTrabajo(conn)
+        self.cambios_pendientes: list[Cambio] = []
+
+    def lectura(self):
+        return self.primaria
+
+    def leyendo_de_primaria(self):
+        return nullcontext()
+
+    @property
+    def lee_sus_escrituras(self) -> bool:
+        return False
+
+    def buffer_escritura(self) -> BufferEscritura | None:
+        return None
+
+    def marcar_escritura(self) -> None:
+        pass
+
+
+def al_volcar_buffer(fn):
+    """
+    Registra `fn(sesion, registros)` para ejecutarse en la transacción de
+    cada volcado del buffer de escritura, con los registros (dia,
+    tipo_residuo_id) insertados en él. Se usa como decorador.
+    """
+    _tras_volcado.append(fn)
+    return fn
+
+
+def _ejecutar_tras_volcado(schema: str, conn, registros: list[dict]) -> None:
+    sesion = SesionVolcado(schema, conn)
+    for fn in _tras_volcado:
+        fn(sesion, registros)
+
+
+def _conectar_buffer():
+    # Conexión propia del buffer, fuera del semáforo de TenantPool
+    conn = psycopg2.connect(**_parametros_primario())
+    conn.cursor().execute("SET statement_timeout = %s", (settings.STATEMENT_TIMEOUT_MS,))
+    conn.commit()
+    return conn
+
+
+def _obtener_buffer(schema: str) -> BufferEscritura:
+    buffer = _buffers.get(schema)
+    if buffer is None:
+        with _pools_lock:
+            buffer = _buffers.get(schema)
+            if buffer is None:
+                buffer = BufferEscritura(
+                    schema,
+                    _conectar_buffer,
+                    max_filas=settings.WRITE_BUFFER_MAX_FILAS,
+                    espera_ms=settings.WRITE_BUFFER_ESPERA_MS,
+                    tras_volcado=_ejecutar_tras_volcado,
+                )
+                _buffers[schema] = buffer
+    return buffer
+
+
+def cerrar_buffers() -> None:
+    """
+    Al apagar el proceso: vuelca lo pendiente en cada buffer de escritura
+    y cierra su hilo y su conexión.
+    """
+    with _pools_lock:
+        buffers = list(_buffers.values())
+        _buffers.clear()
+    for buffer in buffers:
+        buffer.cerrar(espera_s=settings.WRITE_BUFFER_TIMEOUT_S)
+
+
+# ============================================================
+#  Réplicas de lectura
+# ============================================================
+_turno_replica = itertools.count()
+_lag_replicas: dict[str, tuple[float, bool]] = {}
+
+
+def _replica_al_dia(dsn: str, conn) -> bool:
+    """
+    Comprueba (con caché de REPLICA_LAG_CHECK_S) que el retraso de la
+    réplica no supera REPLICA_MAX_LAG_S. Una réplica sin WAL pendiente
+    se considera al día aunque el primario lleve tiempo sin escrituras.
+    """
+    ahora = time.monotonic()
+    cache = _lag_replicas.get(dsn)
+    if cache and ahora - cache[0] < settings.REPLICA_LAG_CHECK_S:
+        return cache[1]
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)
+        lag = float(cursor.fetchone()[0])
+        conn.rollback()
+        al_dia = lag <= settings.REPLICA_MAX_LAG_S
+        if not al_dia:
+            logger.warning(f"Réplica con retraso de {lag:.1f}s, se usa el primario")
+    except Exception as e:
+        logger.warning(f"No se pudo comprobar el retraso de la réplica: {e}")
+        al_dia = False
+
+    _lag_replicas[dsn] = (ahora, al_dia)
+    return al_dia
+
+
+RW_COOKIE = "waste_rw_hasta"
+RW_HEADER = "X-Read-Your-Writes-Until"
+
+
+class SesionBD:
+    """
+    Conexiones de una petición. El primario se obtiene solo cuando hace
+    falta; las lecturas van por turno rotatorio a una réplica al día,
+    salvo que el cliente haya escrito hace menos de
+    REPLICA_READ_YOUR_WRITES_S (cookie o cabecera), en cuyo caso se
+    leen del primario.
+
+    Cada conexión obtenida recibe el statement_timeout de la ruta y se
+    registra en el cancelador de la petición (desconexión del cliente).
+    """
+
+    def __init__(self, schema: str, request: Request, response: Response):
+        self.schema = schema
+        self._response = response
+        self._cancelador = request.scope.get(SCOPE_CANCELADOR)
+        self._statement_timeout_ms = statement_timeout_ms(request.method, request.url.path)
+        self._primaria = None
+        self._pool_primaria: TenantPool | None = None
+        self._lectura = None
+        self._pool_lectura: TenantPool | None = None
+        self._leer_de_primaria = self._escritura_reciente(request)
+        self._forzar_primaria = 0
+        self._sin_replica = False
+        # Unidad de trabajo activa (ver app.infrastructure.unit_of_work)
+        self.uow = None
+        # Cambios escritos y aún sin confirmar (ver BaseRepository._anotar_cambio)
+        self.cambios_pendientes: list[Cambio] = []
+
+    @staticmethod
+    def _escritura_reciente(request: Request) -> bool:
+        valor = request.cookies.get(RW_COOKIE) or request.headers.get(RW_HEADER)
+        try:
+            return valor is not None and float(valor) > time.time()
+        except ValueError:
+            return False
+
+    @property
+    def lee_sus_escrituras(self) -> bool:
+        """Read-your-writes activo: el cliente escribió hace poco."""
+        return self._leer_de_primaria
+
+    @property
+    def cliente_desconectado(self) -> bool:
+        return self._cancelador is not None and self._cancelador.desconectado
+
+    def _preparar(self, conn, pool: TenantPool):
+        try:
+            if self._cancelador is not None:
+                self._cancelador.registrar(conn)
+            # SET de sesión: se reaplica en cada préstamo de la conexión
+            conn.cursor().execute("SET statement_timeout = %s", (self._statement_timeout_ms,))
+        except Exception:
+            if self._cancelador is not None:
+                self._cancelador.liberar(conn)
+            pool.devolver(conn)
+            raise
+        return conn
+
+    @property
+    def primaria(self):
+        if self._primaria is None:
+            pool, conn = _prestar(lambda: _obtener_pool(self.schema))
+            self._primaria, self._pool_primaria = self._preparar(conn, pool), pool
+        return self._primaria
+
+    @contextmanager
+    def leyendo_de_primaria(self):
+        """
+        Las lecturas del bloque van al primario (por ejemplo, al llenar
+        una caché compartida), sin activar read-your-writes.
+        """
+        self._forzar_primaria += 1
+        try:
+            yield
+        finally:
+            self._forzar_primaria -= 1
+
+    def lectura(self):
+        if (
+            self._leer_de_primaria or self._forzar_primaria or self._sin_replica
+            or not settings.POSTGRES_READ_REPLICAS
+        ):
+            return self.primaria
+        if self._lectura is not None:
+            return self._lectura
+
+        replicas = settings.POSTGRES_READ_REPLICAS
+        inicio = next(_turno_replica)
+        for i in range(len(replicas)):
+            dsn = replicas[(inicio + i) % len(replicas)]
+            try:
+                pool, conn = _prestar(lambda: _obtener_pool_replica(self.schema, dsn))
+            except Exception as e:
+                logger.warning(f"Réplica no disponible: {e}")
+                continue
+
+            if _replica_al_dia(dsn, conn):
+                self._lectura, self._pool_lectura = self._preparar(conn, pool), pool
+                return conn
+            pool.devolver(conn)
+
+        # Ninguna réplica utilizable: se lee del primario
+        self._sin_replica = True
+        return self.primaria
+
+    def buffer_escritura(self) -> BufferEscritura | None:
+        """
+        Buffer de group commit del tenant, o None si WRITE_BUFFER_ENABLED
+        está desactivado.
+        """
+        if not settings.WRITE_BUFFER_ENABLED:
+            return None
+        return _obtener_buffer(self.schema)
+
+    def marcar_escritura(self) -> None:
+        """
+        Activa read-your-writes: esta petición y las siguientes del mismo
+        cliente dentro de la ventana leen del primario.
+        """
+        self._leer_de_primaria = True
+        hasta = f"{time.time() + settings.REPLICA_READ_YOUR_WRITES_S:.3f}"
+        self._response.set_cookie(
+            RW_COOKIE, hasta, max_age=int(settings.REPLICA_READ_YOUR_WRITES_S) + 1, httponly=True
+        )
+        self._response.headers[RW_HEADER] = hasta
+
+    def cerrar(self) -> None:
+        if self._lectura is not None:
+            self._liberar(self._lectura)
+            self._pool_lectura.devolver(self._lectura)
+            self._lectura = None
+        if self._primaria is not None:
+            self._liberar(self._primaria)
+            self._pool_primaria.devolver(self._primaria)
+            self._primaria = None
+
+    def _liberar(self, conn) -> None:
+        if self._cancelador is not None:
+            self._cancelador.liberar(conn)
+
+
+class SesionInterna:
+    """
+    Sesión para tareas de fondo del proceso (fuera de una petición):
+    lee y escribe siempre en el primario del tenant, sin cancelador ni
+    read-your-writes.
+    """
+
+    def __init__(self, schema: str):
+        self.schema = schema
+        # Resuelve el tenant ya (404 / bootstrap); el pool se vuelve a
+        # resolver al pedir la conexión por si se retira entretanto
+        self._pool = _obtener_pool(schema)
+        self._primaria = None
+        self.uow = None
+        self.cambios_pendientes: list[Cambio] = []
+
+    @property
+    def primaria(self):
+        if self._primaria is None:
+            self._pool, conn = _prestar(lambda: _obtener_pool(self.schema))
+            try:
+                conn.cursor().execute("SET statement_timeout = %s", (settings.STATEMENT_TIMEOUT_MS,))
+            except Exception:
+                self._pool.devolver(conn)
+                raise
+            self._primaria = conn
+        return self._primaria
+
+    def lectura(self):
+        return self.primaria
+
+    def leyendo_de_primaria(self):
+        return nullcontext()
+
+    @property
+    def lee_sus_escrituras(self) -> bool:
+        return False
+
+    def buffer_escritura(self) -> BufferEscritura | None:
+        return None
+
+    def marcar_escritura(self) -> None:
+        pass
+
+    def cerrar(self) -> None:
+        if self._primaria is not None:
+            self._pool.devolver(self._primaria)
+            self._primaria = None
+
+
+@contextmanager
+def sesion_interna(schema: str):
+    sesion = SesionInterna(schema)
+    try:
+        yield sesion
+    finally:
+        sesion.cerrar()
+
+
+def resolver_schema(tenant: str | None) -> str:
+    """
+    Traduce un identificador de tenant a su schema. Sin tenant se usa
+    POSTGRES_SCHEMA. Con TENANT_SCHEMAS definido solo se aceptan los
+    tenants listados; si no, el schema es TENANT_SCHEMA_PREFIX + tenant,
+    que `_obtener_pool` solo acepta si ya está provisionado.
+    """
+    if not tenant:
+        return settings.POSTGRES_SCHEMA
+
+    tenant = tenant.strip().lower()
+
+    if settings.TENANT_SCHEMAS:
+        schema = settings.TENANT_SCHEMAS.get(tenant)
+    elif settings.TENANT_SCHEMA_PREFIX is not None:
+        schema = f"{settings.TENANT_SCHEMA_PREFIX}{tenant.replace('-', '_')}"
+    else:
+        schema = None
+
+    if not schema or not _SCHEMA_VALIDO.match(schema):
+        raise HTTPException(status_code=404, detail=f"Sede desconocida: {tenant}")
+    return schema
+
+
+def get_schema(request: Request) -> str:
+    tenant = request.path_params.get("tenant") or request.headers.get(settings.TENANT_HEADER)
+    return resolver_schema(tenant)
+
+
+def get_db(request: Request, response: Response):
+    schema = get_schema(request)
+    # Garantiza el bootstrap del tenant antes de cualquier lectura en réplica
+    _obtener_pool(schema)
+    sesion = SesionBD(schema, request, response)
 
     try:
-        yield conn
+        yield sesion
     finally:
-        conn.close()
+        sesion.cerrar()
@@ -0,0 +1,89 @@
+"""Dobles de prueba de psycopg2 que registran las sentencias ejecutadas."""
+
+
+class CursorFalso:
+    """Registra las sentencias en su conexión; `fallar_si` simula errores."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._filas = []
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.conn.sentencias.append((sql, params))
+        if self.conn.fallar_si is not None and self.conn.fallar_si(sql, params):
+            raise RuntimeError(f"fallo simulado: {sql}")
+        if "nextval" in sql:
+            self._filas = [(next(self.conn.secuencia),) for _ in range(params[1])]
+        self.rowcount = len(self._filas)
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def fetchall(self):
+        return self._filas
+
+
+class ConexionFalsa:
+    def __init__(self, fallar_si=None):
+        self.sentencias = []
+        self.fallar_si = fallar_si
+        self.secuencia = iter(range(1, 1_000_000))
+        self.closed = 0
+        self.autocommit = False
+
+    def cursor(self, **kwargs):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.sentencias.append(("COMMIT", None))
+
+    def rollback(self):
+        self.sentencias.append(("ROLLBACK", None))
+
+    def close(self):
+        self.closed = 1
+
+    @property
+    def sql(self) -> list[str]:
+        return [s for s, _ in self.sentencias]
+
+
+class PoolConexionesFalso:
+    """Sustituye a psycopg2.pool.ThreadedConnectionPool."""
+
+    def __init__(self, *args, **kwargs):
+        self.prestadas = 0
+        self.cerrado = False
+
+    def getconn(self):
+        self.prestadas += 1
+        return ConexionFalsa()
+
+    def putconn(self, conn, close=False):
+        self.prestadas -= 1
+
+    def closeall(self):
+        self.cerrado = True
+
+
+class SesionFalsa:
+    """Sesión de una petición con una sola conexión (sin réplicas)."""
+
+    def __init__(self, conn=None, schema: str = "public"):
+        self.schema = schema
+        self.primaria = conn if conn is not None else ConexionFalsa()
+        self.escrituras_marcadas = 0
+        self.lee_sus_escrituras = False
+        self.uow = None
+        self.cambios_pendientes = []
+
+    def lectura(self):
+        return self.primaria
+
+    def buffer_escritura(self):
+        return None
+
+    def marcar_escritura(self):
+        self.escrituras_marcadas += 1
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.config.admission_config import AdmissionMiddleware, grupo_de_ruta
+from app.infrastructure import admission
+from app.infrastructure.admission import CapacidadAgotadaError, GrupoAdmision, LimiteRecurso
+
+
+@pytest.mark.parametrize("metodo, path, grupo", [
+    ("POST", "/waste-api/analisis", "analisis"),
+    ("POST", "/waste-api/sedes/norte/analisis/estadistico", "analisis"),
+    # Leer análisis no llama al modelo
+    ("GET", "/waste-api/analisis", "general"),
+    ("GET", "/waste-api/export/registros", "export"),
+    ("GET", "/waste-api/tipos", "general"),
+    ("GET", "/waste-api/health", None),
+    ("GET", "/waste-api/metrics", None),
+    ("GET", "/waste-api/docs", None),
+])
+def test_grupo_de_ruta(metodo, path, grupo):
+    assert grupo_de_ruta(metodo, path) == grupo
+
+
+def test_grupo_rechaza_con_la_cola_llena():
+    async def escenario():
+        grupo = GrupoAdmision("prueba", max_concurrentes=1, max_cola=1)
+        assert await grupo.entrar(timeout=1)
+
+        en_cola = asyncio.create_task(grupo.entrar(timeout=1))
+        await asyncio.sleep(0)
+        assert grupo.en_cola == 1
+        # La cola está llena: se rechaza sin esperar
+        assert not await grupo.entrar(timeout=1)
+
+        grupo.salir()
+        assert await en_cola
+        assert (grupo.activas, grupo.en_cola) == (1, 0)
+
+    asyncio.run(escenario())
+
+
+def test_grupo_rechaza_si_la_espera_supera_el_timeout():
+    async def escenario():
+        grupo = GrupoAdmision("prueba", max_concurrentes=1, max_cola=5)
+        await grupo.entrar(timeout=1)
+
+        assert not await grupo.entrar(timeout=0.01)
+        assert grupo.en_cola == 0
+
+    asyncio.run(escenario())
+
+
+def _atender(middleware, path: str = "/waste-api/tipos") -> list[dict]:
+    enviados = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(mensaje):
+        enviados.append(mensaje)
+
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": path}, receive, send))
+    return enviados
+
+
+def test_middleware_responde_503_con_retry_after(monkeypatch):
+    lleno = GrupoAdmision("general", max_concurrentes=1, max_cola=0)
+    lleno._semaforo = asyncio.Semaphore(0)
+    monkeypatch.setattr(admission, "_grupos", {"general": lleno})
+    llamadas = []
+
+    async def app(scope, receive, send):
+        llamadas.append(scope["path"])
+
+    enviados = _atender(AdmissionMiddleware(app, timeout_cola=0.01, retry_after=7))
+
+    assert llamadas == []
+    assert enviados[0]["status"] == 503
+    assert (b"retry-after", b"7") in enviados[0]["headers"]
+
+    # Las rutas exentas no pasan por el grupo
+    _atender(AdmissionMiddleware(app, timeout_cola=0.01, retry_after=7), "/waste-api/health")
+    assert llamadas == ["/waste-api/health"]
+
+
+def test_limite_de_recurso_con_espera_acotada():
+    limite = LimiteRecurso("llm", maximo=1, timeout=0.01)
+    resultado = []
+
+    with limite.ocupar():
+        hilo = threading.Thread(target=lambda: resultado.append(_ocupar(limite)))
+        hilo.start()
+        hilo.join(5)
+
+    assert isinstance(resultado[0], CapacidadAgotadaError)
+    assert resultado[0].recurso == "llm"
+    # Liberado el hueco, se vuelve a admitir
+    assert _ocupar(limite) is None
+
+
+def _ocupar(limite: LimiteRecurso):
+    try:
+        with limite.ocupar():
+            return None
+    except CapacidadAgotadaError as e:
+        return e
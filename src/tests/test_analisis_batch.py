@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from app.config.settings import settings
+from app.domain.waste_service import WasteService
+from app.infrastructure.ai_client import UsoLLM
+
+SEMANA_1 = (date(2026, 3, 2), date(2026, 3, 8))
+SEMANA_2 = (date(2026, 3, 9), date(2026, 3, 15))
+SEMANA_3 = (date(2026, 3, 16), date(2026, 3, 22))
+
+
+def _estadistica(idx: int, texto: str = "normal") -> dict:
+    return {
+        "idx": idx,
+        "tipo_residuo": texto,
+        "descripcion_tipo_residuo": "",
+        "cantidad_registros": 3,
+        "total_kg": 10,
+    }
+
+
+class RepoResiduosFalso:
+    schema = "public"
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.consultas = 0
+
+    def estadisticas_multi_rango(self, rangos):
+        self.consultas += 1
+        return self.filas
+
+
+class RepoAnalisisFalso:
+    def __init__(self):
+        self.lotes = []
+
+    def crear_lote(self, filas):
+        self.lotes.append(filas)
+        return [{"id": 100 + i, "fecha_inicio": f[0], "fecha_fin": f[1]} for i, f in enumerate(filas)]
+
+
+@pytest.mark.parametrize("periodo, esperado", [
+    # Semanas de lunes a domingo recortadas al intervalo
+    ("semana", [
+        (date(2026, 3, 4), date(2026, 3, 8)),
+        (date(2026, 3, 9), date(2026, 3, 15)),
+        (date(2026, 3, 16), date(2026, 3, 17)),
+    ]),
+    ("mes", [(date(2026, 3, 4), date(2026, 3, 17))]),
+])
+def test_expandir_periodo(periodo, esperado):
+    assert WasteService._expandir_periodo(date(2026, 3, 4), date(2026, 3, 17), periodo) == esperado
+
+
+def test_meses_naturales():
+    assert WasteService._expandir_periodo(date(2026, 1, 15), date(2026, 3, 1), "mes") == [
+        (date(2026, 1, 15), date(2026, 1, 31)),
+        (date(2026, 2, 1), date(2026, 2, 28)),
+        (date(2026, 3, 1), date(2026, 3, 1)),
+    ]
+
+
+def test_fan_out_acotado_con_estado_por_rango(monkeypatch):
+    monkeypatch.setattr(settings, "ANALISIS_BATCH_CONCURRENCIA", 2)
+    monkeypatch.setattr(settings, "LLM_COSTE_PROMPT_1K_USD", 1.0)
+    monkeypatch.setattr(settings, "LLM_COSTE_COMPLETION_1K_USD", 2.0)
+    filas = [_estadistica(0), _estadistica(1, "falla"), _estadistica(3), _estadistica(4)]
+    residuos, analisis = RepoResiduosFalso(filas), RepoAnalisisFalso()
+    servicio = WasteService(None, residuos, analisis, None)
+
+    lock = threading.Lock()
+    en_curso, maximo = 0, 0
+
+    def llamar(prompt, interactivo=False):
+        nonlocal en_curso, maximo
+        with lock:
+            en_curso += 1
+            maximo = max(maximo, en_curso)
+        time.sleep(0.02)
+        with lock:
+            en_curso -= 1
+        if "falla" in prompt:
+            raise RuntimeError("modelo caído")
+        return "texto", UsoLLM(tokens_prompt=100, tokens_completion=50)
+
+    monkeypatch.setattr(servicio, "_llamar_modelo_lote", llamar)
+    semana_4 = (date(2026, 3, 23), date(2026, 3, 29))
+    semana_5 = (date(2026, 3, 30), date(2026, 4, 5))
+
+    reporte = servicio.generar_analisis_batch(
+        [SEMANA_1, SEMANA_2, SEMANA_3, SEMANA_1],
+        [(semana_4[0], semana_5[1], "semana")],
+    )
+
+    assert maximo == 2
+    assert residuos.consultas == 1
+    # Rangos repetidos se generan una vez
+    assert reporte.total == 5
+    assert [it.estado for it in reporte.items] == ["generado", "error", "sin_datos", "generado", "generado"]
+    assert reporte.items[1].error == "modelo caído"
+    # Un único INSERT con los análisis generados
+    assert len(analisis.lotes) == 1
+    assert [f[:2] for f in analisis.lotes[0]] == [SEMANA_1, semana_4, semana_5]
+    assert [it.analisis_id for it in reporte.items if it.estado == "generado"] == [100, 101, 102]
+    assert (reporte.tokens_prompt, reporte.tokens_completion) == (300, 150)
+    assert reporte.coste_estimado_usd == pytest.approx(0.6)
+
+
+def test_demasiados_rangos(monkeypatch):
+    monkeypatch.setattr(settings, "ANALISIS_BATCH_MAX_RANGOS", 2)
+    servicio = WasteService(None, RepoResiduosFalso([]), RepoAnalisisFalso(), None)
+
+    with pytest.raises(ValueError):
+        servicio.generar_analisis_batch([SEMANA_1, SEMANA_2, SEMANA_3], [])
@@ -0,0 +1,111 @@
+from datetime import date
+
+import pytest
+
+from app.domain.waste_service import WasteService
+from app.dto.waste_dto import AnalisisIARequestDto
+from app.infrastructure.ai_client import UsoLLM
+from falsos import SesionFalsa
+
+SEMANA_1 = (date(2026, 3, 2), date(2026, 3, 8))
+SEMANA_2 = (date(2026, 3, 9), date(2026, 3, 15))
+
+
+class RepoResiduosFalso:
+    schema = "public"
+
+    def __init__(self, huellas):
+        self.sesion = SesionFalsa()
+        self.huellas = huellas
+        self.rangos_leidos = []
+
+    def huellas_semanales(self, fecha_inicio, fecha_fin):
+        return self.huellas
+
+    def listar_por_rangos(self, rangos):
+        self.rangos_leidos.append(rangos)
+        return [
+            {
+                "idx": i,
+                "dia": fi,
+                "cantidad_kg": 5,
+                "tipo_residuo": "orgánico",
+                "descripcion_tipo_residuo": "",
+            }
+            for i, (fi, _) in enumerate(rangos)
+        ]
+
+
+class RepoAnalisisFalso:
+    def __init__(self, cacheados):
+        self.cacheados = cacheados
+        self.guardados = []
+        self.creados = []
+
+    def resumenes_semanales(self, fecha_inicio, fecha_fin):
+        return self.cacheados
+
+    def guardar_resumenes_semanales(self, filas):
+        self.guardados.extend(filas)
+
+    def crear(self, **campos):
+        self.creados.append(campos)
+        return {"id": 1, **campos}
+
+
+def _semana(rango, huella):
+    return {"fecha_inicio": rango[0], "fecha_fin": rango[1], "registros": 3, "huella": huella}
+
+
+def test_solo_se_resumen_las_semanas_con_huella_nueva(monkeypatch):
+    residuos = RepoResiduosFalso([_semana(SEMANA_1, "a" * 32), _semana(SEMANA_2, "b" * 32)])
+    analisis = RepoAnalisisFalso([
+        {**_semana(SEMANA_1, "a" * 32), "resumen": "semana 1 cacheada"},
+        {**_semana(SEMANA_2, "viejo"), "resumen": "semana 2 obsoleta"},
+    ])
+    servicio = WasteService(None, residuos, analisis, None)
+    prompts = []
+
+    def llamar(prompt, interactivo=False):
+        prompts.append(prompt)
+        return f"respuesta {len(prompts)}", UsoLLM(tokens_prompt=10, tokens_completion=5)
+
+    monkeypatch.setattr(servicio, "_llamar_modelo_lote", llamar)
+
+    servicio.generar_analisis(AnalisisIARequestDto(fecha_inicio=SEMANA_1[0], fecha_fin=SEMANA_2[1]), "jerarquico")
+
+    # Solo la semana 2 se vuelve a leer y resumir
+    assert residuos.rangos_leidos == [[SEMANA_2]]
+    assert [f[:3] for f in analisis.guardados] == [(*SEMANA_2, "b" * 32)]
+    # La reducción recibe el resumen cacheado y el nuevo, en orden
+    reduccion = prompts[-1]
+    assert len(prompts) == 2
+    assert reduccion.index("semana 1 cacheada") < reduccion.index("respuesta 1")
+    assert "semana 2 obsoleta" not in reduccion
+    assert analisis.creados[0]["recomendaciones"] == "respuesta 2"
+
+
+def test_sin_cambios_no_hay_resumenes_nuevos(monkeypatch):
+    residuos = RepoResiduosFalso([_semana(SEMANA_1, "a" * 32)])
+    analisis = RepoAnalisisFalso([{**_semana(SEMANA_1, "a" * 32), "resumen": "cacheado"}])
+    servicio = WasteService(None, residuos, analisis, None)
+    llamadas = []
+
+    def llamar(prompt, interactivo=False):
+        llamadas.append(prompt)
+        return "informe", UsoLLM(tokens_prompt=1, tokens_completion=1)
+
+    monkeypatch.setattr(servicio, "_llamar_modelo_lote", llamar)
+
+    servicio.generar_analisis(AnalisisIARequestDto(fecha_inicio=SEMANA_1[0], fecha_fin=SEMANA_1[1]), "jerarquico")
+
+    assert len(llamadas) == 1
+    assert residuos.rangos_leidos == []
+    assert analisis.guardados == []
+
+
+def test_modo_no_soportado():
+    servicio = WasteService(None, RepoResiduosFalso([]), RepoAnalisisFalso([]), None)
+
+    with pytest.raises(ValueError):
+        servicio.generar_analisis(AnalisisIARequestDto(fecha_inicio=SEMANA_1[0], fecha_fin=SEMANA_1[1]), "resumido")
@@ -0,0 +1,37 @@
+import math
+
+import pytest
+
+from app.domain.anomalias import LineaBase
+
+
+def test_primer_valor_fija_la_media_sin_varianza():
+    linea = LineaBase(tipo_residuo_id=1)
+
+    linea.incorporar(10.0, alpha=0.2)
+
+    assert (linea.n, linea.media, linea.varianza) == (1, 10.0, 0.0)
+    # Sin dispersión todavía no hay z-score
+    assert linea.z_score(50.0) is None
+
+
+def test_ewma_de_media_y_varianza():
+    linea = LineaBase(tipo_residuo_id=1)
+    for valor in (10.0, 20.0):
+        linea.incorporar(valor, alpha=0.5)
+
+    # delta = 10: media += 0.5 * 10; varianza = 0.5 * (0 + 0.5 * 100)
+    assert linea.media == pytest.approx(15.0)
+    assert linea.varianza == pytest.approx(25.0)
+    assert linea.z_score(30.0) == pytest.approx(3.0)
+
+
+def test_serie_estable_converge_y_detecta_el_pico():
+    linea = LineaBase(tipo_residuo_id=1)
+    for i in range(200):
+        linea.incorporar(100.0 + (5.0 if i % 2 else -5.0), alpha=0.1)
+
+    assert linea.media == pytest.approx(100.0, abs=1.0)
+    assert math.sqrt(linea.varianza) == pytest.approx(5.0, rel=0.1)
+    assert abs(linea.z_score(101.0)) < 1
+    assert linea.z_score(140.0) > 3
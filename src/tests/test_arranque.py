@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pydantic
+import pytest
+
+from app.config.settings import AzureOpenAISettings, Settings
+from app.infrastructure import ai_client
+
+SRC = Path(__file__).resolve().parent.parent
+VARIABLES_AZURE = ("AZURE_OPENAI_KEY", "AZURE_OPENAI_ENDPOINT")
+
+
+def _importar_en_proceso_nuevo(codigo: str) -> str:
+    # Sin las variables de Azure: el arranque no debe necesitarlas
+    env = {k: v for k, v in os.environ.items() if k not in VARIABLES_AZURE}
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=SRC, env=env, capture_output=True, text=True, check=True
+    )
+    return resultado.stdout.strip()
+
+
+def test_importar_la_app_no_carga_el_sdk_de_openai():
+    salida = _importar_en_proceso_nuevo(
+        "import sys, app.main; print('openai' in sys.modules, 'httpx' in sys.modules)"
+    )
+
+    assert salida == "False False"
+
+
+def test_secciones_se_cargan_al_leer_su_primer_campo(monkeypatch):
+    for variable in VARIABLES_AZURE:
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.setattr(AzureOpenAISettings, "model_config", {**AzureOpenAISettings.model_config, "env_file": None})
+    settings = Settings()
+
+    assert settings.POSTGRES_DB
+    assert AzureOpenAISettings not in settings._secciones
+    with pytest.raises(pydantic.ValidationError):
+        settings.AZURE_OPENAI_KEY
+
+
+def test_cliente_de_ia_compartido_por_el_proceso(monkeypatch):
+    monkeypatch.setattr(ai_client, "_cliente", None)
+
+    assert ai_client.get_ai_client() is ai_client.get_ai_client()
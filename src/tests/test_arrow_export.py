@@ -0,0 +1,53 @@
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet
+import pytest
+
+from app.infrastructure.arrow_export import (
+    esquema_estadisticas_diarias,
+    esquema_registros,
+    escribir_export,
+)
+
+
+def _registro(i: int, tipo: str) -> tuple:
+    return (i, date(2026, 3, i), 1.5 * i, 1, tipo, "Descripción", datetime(2026, 3, i, 8, 30), None)
+
+
+LOTES = [
+    [_registro(1, "Orgánico"), _registro(2, "Orgánico")],
+    [],
+    [_registro(3, "Vidrio")],
+]
+
+
+def test_arrow_ipc_conserva_el_esquema_y_un_batch_por_lote():
+    with escribir_export("arrow", esquema_registros(), LOTES) as archivo:
+        lector = pa.ipc.open_stream(archivo)
+        batches = list(lector)
+
+    # Los lotes vacíos no generan record batch
+    assert [b.num_rows for b in batches] == [2, 1]
+    assert lector.schema.equals(esquema_registros())
+    assert pa.types.is_dictionary(lector.schema.field("tipo_residuo").type)
+    tabla = pa.Table.from_batches(batches)
+    assert tabla.column("tipo_residuo").to_pylist() == ["Orgánico", "Orgánico", "Vidrio"]
+    assert tabla.column("dia").to_pylist()[-1] == date(2026, 3, 3)
+
+
+def test_parquet_de_estadisticas_diarias():
+    fila = (date(2026, 3, 2), 1, "Orgánico", 3, 12.5, 4.1666, 2.0, 6.5)
+
+    with escribir_export("parquet", esquema_estadisticas_diarias(), [[fila]]) as archivo:
+        tabla = pa.parquet.read_table(archivo)
+
+    assert tabla.num_rows == 1
+    assert tabla.column_names == esquema_estadisticas_diarias().names
+    assert tabla.to_pylist()[0]["total_kg"] == 12.5
+
+
+def test_formato_no_soportado():
+    with pytest.raises(ValueError):
+        escribir_export("csv", esquema_registros(), LOTES)
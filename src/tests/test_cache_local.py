@@ -0,0 +1,108 @@
+from contextlib import nullcontext
+from datetime import date
+
+from app.config.settings import settings
+from app.domain import waste_service
+from app.infrastructure.cache_local import CacheLocal
+from app.infrastructure.cambios import Cambio, despachar_confirmados
+from app.infrastructure.residuos_repository import ResiduosRepository
+from falsos import SesionFalsa
+
+DIA = date(2026, 3, 2)
+
+
+def test_obtener_o_calcular_guarda_y_reutiliza():
+    cache = CacheLocal("prueba", ttl_s=60)
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        return "v"
+
+    assert cache.obtener_o_calcular("k", calcular) == "v"
+    assert cache.obtener_o_calcular("k", calcular) == "v"
+    assert llamadas == [1]
+
+
+def test_invalidacion_durante_el_calculo_impide_guardar():
+    cache = CacheLocal("prueba", ttl_s=60)
+
+    def calcular():
+        # Llega un evento de cambio mientras se leen los datos
+        cache.invalidar(lambda clave: True)
+        return "obsoleto"
+
+    assert cache.obtener_o_calcular("k", calcular) == "obsoleto"
+    assert cache.obtener("k") is None
+
+
+def test_guardar_con_generacion_anterior_se_descarta():
+    cache = CacheLocal("prueba", ttl_s=60)
+    generacion = cache.generacion()
+    cache.invalidar(lambda clave: False)
+
+    cache.guardar("k", "v", generacion)
+
+    assert cache.obtener("k") is None
+
+
+def test_invalidar_solo_las_claves_del_predicado():
+    cache = CacheLocal("prueba", ttl_s=60)
+    cache.guardar(("a", 1), 1, cache.generacion())
+    cache.guardar(("b", 1), 2, cache.generacion())
+
+    assert cache.invalidar(lambda clave: clave[0] == "a") == 1
+    assert cache.obtener(("a", 1)) is None
+    assert cache.obtener(("b", 1)) == 2
+
+
+def test_entrada_caducada():
+    cache = CacheLocal("prueba", ttl_s=0)
+    cache.guardar("k", "v", cache.generacion())
+
+    assert cache.obtener("k", "defecto") == "defecto"
+
+
+def test_max_entradas_descarta_la_mas_antigua():
+    cache = CacheLocal("prueba", ttl_s=60, max_entradas=2)
+    for clave in ("a", "b", "c"):
+        cache.guardar(clave, clave, cache.generacion())
+
+    assert cache.obtener("a") is None
+    assert cache.obtener("c") == "c"
+
+
+class _Sesion:
+    def __init__(self, lee_sus_escrituras: bool):
+        self.lee_sus_escrituras = lee_sus_escrituras
+
+    def leyendo_de_primaria(self):
+        return nullcontext()
+
+
+def test_read_your_writes_no_usa_la_cache(monkeypatch):
+    monkeypatch.setattr(waste_service, "escuchando", lambda: True)
+    cache = CacheLocal("prueba", ttl_s=60)
+    cache.guardar("k", "anterior", cache.generacion())
+
+    assert waste_service._cacheado(cache, "k", _Sesion(True), lambda: "actual") == "actual"
+    assert waste_service._cacheado(cache, "k", _Sesion(False), lambda: "actual") == "anterior"
+
+
+def test_commit_local_invalida_sin_esperar_al_listen(monkeypatch):
+    monkeypatch.setattr(waste_service, "escuchando", lambda: True)
+    clave = ("rango", "public", DIA, DIA)
+    waste_service._cache_estadisticas.guardar(clave, "anterior", waste_service._cache_estadisticas.generacion())
+
+    despachar_confirmados([Cambio("public", "residuos", DIA, DIA)])
+
+    assert waste_service._cache_estadisticas.obtener(clave) is None
+
+
+def test_escritura_de_residuos_anota_el_cambio_para_el_commit(monkeypatch):
+    monkeypatch.setattr(settings, "PREPARED_STATEMENTS_ENABLED", False)
+    sesion = SesionFalsa()
+
+    ResiduosRepository(sesion)._registrar_cambio(DIA, DIA)
+
+    assert sesion.cambios_pendientes == [Cambio("public", "residuos", DIA, DIA)]
@@ -0,0 +1,70 @@
+import psycopg2.errors
+import pytest
+
+from app.config.settings import settings
+from app.infrastructure import base_repository
+from app.infrastructure.cancelacion import (
+    CanceladorConsultas,
+    ClienteDesconectadoError,
+    ConsultaCanceladaError,
+    statement_timeout_ms,
+)
+from falsos import ConexionFalsa, SesionFalsa
+
+
+@pytest.fixture(autouse=True)
+def limites(monkeypatch):
+    monkeypatch.setattr(settings, "STATEMENT_TIMEOUT_MS", 30000)
+    monkeypatch.setattr(settings, "STATEMENT_TIMEOUTS_RUTA_MS", {
+        "tipos": 2000,
+        "GET registros": 15000,
+        "POST registros": 120000,
+        "export": 300000,
+    })
+
+
+@pytest.mark.parametrize("metodo, path, esperado", [
+    # Segmento sin método
+    ("GET", "/waste-api/tipos", 2000),
+    ("POST", "/waste-api/tipos", 2000),
+    # Método y segmento
+    ("GET", "/waste-api/registros", 15000),
+    ("POST", "/waste-api/registros/lote", 120000),
+    # Un segmento posterior también cuenta
+    ("GET", "/waste-api/registros/export", 15000),
+    ("GET", "/waste-api/export", 300000),
+    # Sin coincidencia: límite general
+    ("DELETE", "/waste-api/registros", 30000),
+    ("GET", "/waste-api/estadisticas", 30000),
+    ("GET", "/", 30000),
+])
+def test_statement_timeout_por_ruta(metodo, path, esperado):
+    assert statement_timeout_ms(metodo, path) == esperado
+
+
+@pytest.mark.parametrize("desconectado, error", [
+    (False, ConsultaCanceladaError),
+    (True, ClienteDesconectadoError),
+])
+def test_query_canceled_se_traduce_segun_el_motivo(monkeypatch, desconectado, error):
+    def cancelada(*args, **kwargs):
+        raise psycopg2.errors.QueryCanceled("canceling statement due to statement timeout")
+
+    monkeypatch.setattr(base_repository, "ejecutar_instrumentado", cancelada)
+    sesion = SesionFalsa()
+    sesion.cliente_desconectado = desconectado
+
+    with pytest.raises(error):
+        base_repository.BaseRepository(sesion)._ejecutar("prueba.cancelada", "SELECT 1")
+
+
+def test_cancelador_rechaza_conexiones_tras_la_desconexion():
+    cancelador, conn = CanceladorConsultas(), ConexionFalsa()
+    conn.cancel = lambda: conn.sentencias.append(("CANCEL", None))
+    cancelador.registrar(conn)
+
+    cancelador.cancelar()
+
+    assert conn.sql == ["CANCEL"]
+    with pytest.raises(ClienteDesconectadoError):
+        cancelador.registrar(ConexionFalsa())
@@ -0,0 +1,122 @@
+import asyncio
+import json
+from datetime import date
+from decimal import Decimal
+
+from app.application.dashboard_en_vivo import DashboardEnVivo, Suscripcion
+from app.config.settings import settings
+from app.infrastructure.cambios import Cambio
+
+MARZO = ("public", date(2026, 3, 1), date(2026, 3, 31))
+ABRIL = ("public", date(2026, 4, 1), date(2026, 4, 30))
+
+
+def _fila(idx: int, tipo_id: int, total: str, registros: int = 1) -> dict:
+    return {
+        "idx": idx,
+        "tipo_id": tipo_id,
+        "tipo_residuo": f"Tipo {tipo_id}",
+        "descripcion_tipo_residuo": "",
+        "cantidad_registros": registros,
+        "total_kg": Decimal(total),
+        "promedio_kg": Decimal(total),
+        "minimo_kg": Decimal(total),
+        "maximo_kg": Decimal(total),
+    }
+
+
+def _mensajes(suscripcion: Suscripcion) -> list[dict]:
+    mensajes = []
+    while not suscripcion.cola.empty():
+        mensajes.append(json.loads(suscripcion.cola.get_nowait()))
+    return mensajes
+
+
+class _HubFalso(DashboardEnVivo):
+    """Hub con las consultas sustituidas por filas fijas."""
+
+    def __init__(self, iniciales: dict, cambios: list):
+        super().__init__()
+        self.iniciales = iniciales
+        self.cambios = cambios
+        self.consultas = []
+
+    def _consultar_inicial(self, rango):
+        return self._construir_estado(rango, self.iniciales[rango]), 10
+
+    def _consultar_cambios(self, schema, rangos, marca):
+        self.consultas.append((rangos, marca))
+        return 11, [], self.cambios
+
+
+def test_cola_llena_marca_la_suscripcion_como_desbordada(monkeypatch):
+    monkeypatch.setattr(settings, "DASHBOARD_COLA_MAX", 1)
+
+    async def probar():
+        suscripcion = Suscripcion(MARZO)
+        suscripcion.enviar("uno")
+        suscripcion.enviar("dos")
+        return suscripcion
+
+    suscripcion = asyncio.run(probar())
+
+    assert suscripcion.desbordada
+    assert suscripcion.cola.qsize() == 1
+
+
+def test_delta_solo_a_los_rangos_afectados_con_una_consulta(monkeypatch):
+    monkeypatch.setattr(settings, "DASHBOARD_AGRUPAR_MS", 0)
+    hub = _HubFalso(
+        {MARZO: [_fila(0, 1, "10"), _fila(0, 2, "5")], ABRIL: [_fila(0, 1, "3")]},
+        # Marzo: el tipo 1 sube y el tipo 2 se queda sin registros
+        [_fila(0, 1, "12", registros=2)],
+    )
+
+    async def probar():
+        hub.iniciar(asyncio.get_running_loop())
+        marzo = [await hub.suscribir(*MARZO), await hub.suscribir(*MARZO)]
+        abril = await hub.suscribir(*ABRIL)
+        hub._encolar(Cambio("public", "residuos", date(2026, 3, 2), date(2026, 3, 2)))
+        hub._encolar(Cambio("public", "residuos", date(2026, 3, 3), date(2026, 3, 3)))
+        while hub._en_curso:
+            await asyncio.sleep(0.01)
+        return marzo, abril
+
+    marzo, abril = asyncio.run(probar())
+
+    # Dos eventos agrupados, una consulta solo para el rango tocado
+    assert hub.consultas == [([MARZO], 10)]
+    for suscripcion in marzo:
+        snapshot, delta = _mensajes(suscripcion)
+        assert snapshot["tipo"] == "snapshot" and snapshot["total_global_kg"] == 15
+        assert delta["tipo"] == "delta" and delta["total_global_kg"] == 12
+        assert {t["tipo_id"]: t["total_kg"] for t in delta["tipos"]} == {1: 12, 2: 0}
+    assert [m["tipo"] for m in _mensajes(abril)] == ["snapshot"]
+
+
+def test_cancelar_la_ultima_suscripcion_libera_el_rango():
+    hub = _HubFalso({MARZO: [_fila(0, 1, "10")]}, [])
+
+    async def probar():
+        suscripcion = await hub.suscribir(*MARZO)
+        hub.cancelar(suscripcion)
+
+    asyncio.run(probar())
+
+    assert hub.estado() == {"suscriptores": 0, "rangos": 0}
+    assert hub._estado == {} and hub._marcas == {}
+
+
+def test_cambios_de_otras_entidades_no_se_encolan():
+    hub = DashboardEnVivo()
+    llamadas = []
+
+    class _Loop:
+        def call_soon_threadsafe(self, fn, *args):
+            llamadas.append(args)
+
+    hub._loop = _Loop()
+    hub._al_cambiar(Cambio("public", "tipos"))
+    hub._al_cambiar(Cambio("public", "residuos", date(2026, 3, 2), date(2026, 3, 2)))
+
+    assert len(llamadas) == 1
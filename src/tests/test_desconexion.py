@@ -0,0 +1,73 @@
+import asyncio
+
+from app.config.timeout_config import DesconexionMiddleware
+from app.infrastructure.cancelacion import SCOPE_CANCELADOR
+
+
+def _ejecutar(app, tras_enviar: int = 0) -> dict:
+    """
+    Atiende una petición HTTP. El cliente se desconecta después de
+    recibir `tras_enviar` mensajes de la respuesta.
+    """
+    scope = {"type": "http"}
+    cuerpo_leido = False
+    enviados = 0
+    desconectar = asyncio.Event() if tras_enviar else None
+
+    async def receive():
+        nonlocal cuerpo_leido
+        if not cuerpo_leido:
+            cuerpo_leido = True
+            return {"type": "http.request", "body": b""}
+        if desconectar is not None:
+            await desconectar.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(mensaje):
+        nonlocal enviados
+        enviados += 1
+        if enviados == tras_enviar:
+            desconectar.set()
+
+    asyncio.run(DesconexionMiddleware(app)(scope, receive, send))
+    return scope
+
+
+async def _responder(send, more_body: bool = False):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}", "more_body": more_body})
+
+
+def test_desconexion_durante_la_peticion_cancela_sus_consultas():
+    async def app(scope, receive, send):
+        await receive()  # cuerpo
+        assert (await receive())["type"] == "http.disconnect"
+        await asyncio.sleep(0)
+        await _responder(send)
+
+    scope = _ejecutar(app)
+
+    assert scope[SCOPE_CANCELADOR].desconectado
+
+
+def test_desconexion_tras_la_respuesta_completa_no_cancela():
+    async def app(scope, receive, send):
+        await receive()
+        await _responder(send)
+        # Tarea en segundo plano tras responder: el cliente ya cerró
+        await asyncio.sleep(0.05)
+
+    scope = _ejecutar(app, tras_enviar=2)
+
+    assert not scope[SCOPE_CANCELADOR].desconectado
+
+
+def test_desconexion_a_mitad_de_una_respuesta_por_fragmentos_cancela():
+    async def app(scope, receive, send):
+        await receive()
+        await _responder(send, more_body=True)
+        await asyncio.sleep(0.05)
+
+    scope = _ejecutar(app, tras_enviar=2)
+
+    assert scope[SCOPE_CANCELADOR].desconectado
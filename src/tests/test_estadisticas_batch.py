@@ -0,0 +1,90 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.config.settings import settings
+from app.domain.waste_service import MAX_RANGOS_BATCH, WasteService
+from app.infrastructure.residuos_repository import ResiduosRepository
+from falsos import ConexionFalsa, SesionFalsa
+
+ENERO = (date(2026, 1, 1), date(2026, 1, 31))
+FEBRERO = (date(2026, 2, 1), date(2026, 2, 28))
+MARZO = (date(2026, 3, 1), date(2026, 3, 31))
+
+
+def _fila(idx: int, tipo_id: int, total: str) -> dict:
+    return {
+        "idx": idx,
+        "tipo_id": tipo_id,
+        "tipo_residuo": f"Tipo {tipo_id}",
+        "descripcion_tipo_residuo": "",
+        "cantidad_registros": 1,
+        "total_kg": Decimal(total),
+        "promedio_kg": Decimal(total),
+        "minimo_kg": Decimal(total),
+        "maximo_kg": Decimal(total),
+    }
+
+
+class RepoResiduosFalso:
+    schema = "public"
+
+    def __init__(self, filas):
+        self.sesion = SesionFalsa()
+        self.filas = filas
+        self.llamadas = 0
+
+    def estadisticas_multi_rango(self, rangos):
+        self.llamadas += 1
+        return self.filas
+
+
+def _servicio(repo) -> WasteService:
+    return WasteService(None, repo, None, None)
+
+
+def test_un_rango_sin_registros_suma_cero_y_se_compara():
+    repo = RepoResiduosFalso([_fila(0, 1, "100"), _fila(0, 2, "50"), _fila(2, 1, "150")])
+
+    resultado = _servicio(repo).obtener_estadisticas_batch([ENERO, FEBRERO, MARZO])
+
+    assert repo.llamadas == 1
+    assert [r.total_global_kg for r in resultado.rangos] == [150.0, 0.0, 150.0]
+    febrero, marzo = resultado.deltas
+    assert (febrero.rango_base, febrero.rango) == (0, 1)
+    assert febrero.diferencia_total_kg == -150.0
+    assert febrero.variacion_porcentaje == -100.0
+    assert marzo.variacion_porcentaje == 0.0
+    assert {t.tipo_id: t.diferencia_kg for t in marzo.tipos} == {1: 50.0, 2: -50.0}
+
+
+def test_variacion_sin_base_es_nula():
+    repo = RepoResiduosFalso([_fila(1, 1, "10")])
+
+    delta = _servicio(repo).obtener_estadisticas_batch([ENERO, FEBRERO]).deltas[0]
+
+    assert delta.variacion_porcentaje is None
+    assert delta.tipos[0].variacion_porcentaje is None
+
+
+@pytest.mark.parametrize("rangos", [
+    [],
+    [ENERO] * (MAX_RANGOS_BATCH + 1),
+    [(date(2026, 2, 1), date(2026, 1, 1))],
+])
+def test_rangos_invalidos(rangos):
+    with pytest.raises(ValueError):
+        _servicio(RepoResiduosFalso([])).obtener_estadisticas_batch(rangos)
+
+
+def test_una_sola_consulta_acotada_al_intervalo_total(monkeypatch):
+    monkeypatch.setattr(settings, "PREPARED_STATEMENTS_ENABLED", False)
+    conn = ConexionFalsa()
+
+    ResiduosRepository(SesionFalsa(conn)).estadisticas_multi_rango([FEBRERO, ENERO])
+
+    sql, params = conn.sentencias[-1]
+    assert len(conn.sentencias) == 1
+    assert "unnest(%s::int[], %s::date[], %s::date[])" in sql
+    assert params == ([0, 1], [FEBRERO[0], ENERO[0]], [FEBRERO[1], ENERO[1]], ENERO[0], FEBRERO[1])
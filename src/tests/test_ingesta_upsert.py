@@ -0,0 +1,93 @@
+from datetime import date
+
+import psycopg2.errors
+import pytest
+from fastapi.testclient import TestClient
+
+from app.application.waste_controller import get_waste_service
+from app.domain.waste_service import WasteService
+from app.dto.waste_dto import CrearResiduoRequestDto
+from app.infrastructure.residuos_repository import RegistroDuplicadoError, ResiduosRepository
+from app.main import app
+from falsos import SesionFalsa
+
+DIA = date(2026, 3, 2)
+
+
+def _registro(cantidad: float, source_line_id: str | None = "l1") -> dict:
+    return {"dia": DIA, "cantidad_kg": cantidad, "tipo_residuo_id": 1, "source_line_id": source_line_id}
+
+
+def test_upsert_cuenta_insertados_actualizados_y_duplicados(monkeypatch):
+    repo = ResiduosRepository(SesionFalsa())
+    enviados = []
+
+    def ejecutar_valores(nombre, sql, valores, **kwargs):
+        enviados.extend(valores)
+        # Una fila nueva y otra actualizada; la tercera no cambia y no vuelve
+        return [(True,), (False,)]
+
+    monkeypatch.setattr(repo, "_ejecutar_valores", ejecutar_valores)
+
+    resultado = repo.upsert_lote([
+        _registro(1.0, "l1"),
+        _registro(2.0, "l1"),
+        _registro(3.0, "l2"),
+        _registro(4.0, "l3"),
+    ])
+
+    # Dentro del lote prevalece la última aparición de la clave
+    assert enviados[0] == (DIA, 2.0, 1, "l1")
+    assert resultado == {"insertados": 1, "actualizados": 1, "sin_cambios": 1, "duplicados_en_lote": 1}
+
+
+def test_violacion_de_unicidad_en_modo_insertar(monkeypatch):
+    repo = ResiduosRepository(SesionFalsa())
+
+    def duplicado(*args, **kwargs):
+        raise psycopg2.errors.UniqueViolation("clave repetida")
+
+    monkeypatch.setattr(repo, "_ejecutar_consulta", duplicado)
+
+    with pytest.raises(RegistroDuplicadoError):
+        repo.crear(DIA, 1.0, 1, "l1")
+
+
+@pytest.mark.parametrize("modo, clave", [
+    ("reemplazar", "dia,tipo_residuo_id,source_line_id"),
+    ("upsert", "dia,tipo_residuo_id"),
+])
+def test_modo_o_clave_no_soportados(modo, clave):
+    servicio = WasteService(None, None, None, None)
+
+    with pytest.raises(ValueError):
+        servicio.registrar_residuos_lote([CrearResiduoRequestDto(**_registro(1.0))], modo, clave)
+
+
+def test_upsert_exige_source_line_id(monkeypatch):
+    servicio = WasteService(None, None, None, None)
+    monkeypatch.setattr(servicio, "validar_tipo_residuo", lambda tipo_id: None)
+
+    with pytest.raises(ValueError, match="source_line_id"):
+        servicio.registrar_residuos_lote(
+            [CrearResiduoRequestDto(**_registro(1.0, None))], "upsert", "dia,tipo_residuo_id,source_line_id"
+        )
+
+
+class _ServicioDuplicado:
+    def registrar_residuos_lote(self, registros, modo, clave, aislar_errores=False, commit_asincrono=False):
+        raise RegistroDuplicadoError("Registro duplicado: (dia, tipo_residuo_id, source_line_id)")
+
+
+def test_duplicado_responde_409():
+    app.dependency_overrides[get_waste_service] = _ServicioDuplicado
+    try:
+        respuesta = TestClient(app).post(
+            "/waste-api/registros/lote",
+            json=[{"dia": "2026-03-02", "cantidad_kg": 1.0, "tipo_residuo_id": 1, "source_line_id": "l1"}],
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert respuesta.status_code == 409
+    assert "duplicado" in respuesta.json()["detail"]
@@ -0,0 +1,34 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from app.application.json_response import FastJSONResponse
+from app.dto.waste_dto import ListarResiduosResponseDto
+
+FILA = {
+    "id": 1,
+    "dia": date(2026, 3, 2),
+    "cantidad_kg": Decimal("12.50"),
+    "tipo_residuo_id": 3,
+    "tipo_residuo": "Orgánico",
+    "descripcion_tipo_residuo": "Residuo orgánico de cocina",
+    "fecha_creacion": datetime(2026, 3, 2, 8, 30, 15, 123456),
+}
+
+
+def test_filas_de_la_bd_salen_igual_que_por_el_dto():
+    rapido = json.loads(FastJSONResponse([FILA]).body)
+    dto = jsonable_encoder([ListarResiduosResponseDto(**FILA)])
+
+    assert rapido == dto
+    assert rapido[0]["cantidad_kg"] == 12.5
+    assert rapido[0]["dia"] == "2026-03-02"
+    assert rapido[0]["fecha_creacion"] == "2026-03-02T08:30:15.123456"
+
+
+def test_tipo_no_serializable():
+    with pytest.raises(TypeError):
+        FastJSONResponse({"valor": object()})
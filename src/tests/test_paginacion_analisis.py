@@ -0,0 +1,71 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.domain.waste_service import WasteService
+from app.infrastructure.analisis_repository import AnalisisIARepository
+from falsos import ConexionFalsa, SesionFalsa
+
+CREADO = datetime(2026, 3, 2, 8, 30)
+
+
+class RepoAnalisisFalso:
+    def __init__(self, total: int):
+        self.filas = [
+            {
+                "id": total - i,
+                "fecha_inicio": date(2026, 3, 1),
+                "fecha_fin": date(2026, 3, 1),
+                "resumen": f"Análisis {total - i}",
+                "modelo_usado": "gpt-4o-mini",
+                "fecha_creacion": CREADO - timedelta(minutes=i),
+            }
+            for i in range(total)
+        ]
+        self.llamadas = []
+
+    def listar_resumen(self, limite, cursor_fecha=None, cursor_id=None, **filtros):
+        self.llamadas.append((cursor_fecha, cursor_id))
+        filas = self.filas
+        if cursor_id is not None:
+            filas = [f for f in filas if (f["fecha_creacion"], f["id"]) < (cursor_fecha, cursor_id)]
+        return filas[:limite]
+
+
+def _servicio(repo) -> WasteService:
+    return WasteService(None, None, repo, None)
+
+
+def test_recorre_todas_las_paginas_con_el_cursor():
+    repo = RepoAnalisisFalso(total=5)
+    servicio = _servicio(repo)
+
+    vistos, cursor = [], None
+    while True:
+        pagina = servicio.listar_analisis(limite=2, cursor=cursor)
+        vistos += [a.id for a in pagina.items]
+        cursor = pagina.siguiente_cursor
+        if cursor is None:
+            break
+
+    assert vistos == [5, 4, 3, 2, 1]
+    assert repo.llamadas[1] == (CREADO - timedelta(minutes=1), 4)
+
+
+def test_cursor_invalido():
+    with pytest.raises(ValueError):
+        _servicio(RepoAnalisisFalso(total=1)).listar_analisis(cursor="no-es-un-cursor")
+
+
+def test_resumen_no_lee_las_recomendaciones_y_pagina_por_keyset():
+    conn = ConexionFalsa()
+
+    AnalisisIARepository(SesionFalsa(conn)).listar_resumen(
+        limite=21, cursor_fecha=CREADO, cursor_id=9, modelo="gpt-4o-mini"
+    )
+
+    sql, params = conn.sentencias[-1]
+    assert "recomendaciones" not in sql
+    assert "(fecha_creacion, id) < (%s, %s)" in sql
+    assert "ORDER BY fecha_creacion DESC, id DESC LIMIT %s" in sql
+    assert params == [CREADO, 9, "gpt-4o-mini", 21]
@@ -0,0 +1,121 @@
+from datetime import date, datetime, time
+
+import pytest
+
+import database
+from app.application.tareas_programadas import rangos_estandar
+from app.config.settings import settings
+from app.infrastructure import planificador as modulo
+from app.infrastructure.planificador import Planificador, TareaProgramada
+from falsos import ConexionFalsa
+
+HOY = datetime(2026, 3, 4, 2, 30)  # miércoles
+
+
+@pytest.fixture(autouse=True)
+def ventana(monkeypatch):
+    monkeypatch.setattr(settings, "PLANIFICADOR_VENTANA_H", 3.0)
+
+
+@pytest.mark.parametrize("ahora, ultima, esperado", [
+    (datetime(2026, 3, 4, 1, 59), None, False),
+    (datetime(2026, 3, 4, 2, 0), None, True),
+    (datetime(2026, 3, 4, 4, 59), None, True),
+    # Un arranque fuera de la ventana espera al día siguiente
+    (datetime(2026, 3, 4, 5, 0), None, False),
+    # Una vez al día
+    (datetime(2026, 3, 4, 3, 0), date(2026, 3, 4), False),
+    (datetime(2026, 3, 4, 3, 0), date(2026, 3, 3), True),
+])
+def test_tarea_pendiente_una_vez_al_dia_dentro_de_la_ventana(ahora, ultima, esperado):
+    tarea = TareaProgramada("prueba", time(2, 0), lambda: None, ultima_ejecucion=ultima)
+
+    assert tarea.pendiente(ahora) is esperado
+
+
+def test_un_error_no_impide_las_demas_tareas():
+    planificador = Planificador()
+    ejecutadas = []
+
+    def falla():
+        raise RuntimeError("sin conexión")
+
+    planificador.programar("falla", "02:00", falla)
+    planificador.programar("informes", "02:00", lambda: ejecutadas.append("informes"))
+    planificador.programar("tarde", "18:00", lambda: ejecutadas.append("tarde"))
+
+    planificador._ejecutar_pendientes(HOY)
+    planificador._ejecutar_pendientes(HOY)
+
+    assert ejecutadas == ["informes"]
+    assert planificador.estado()["tareas"] == {"falla": "2026-03-04", "informes": "2026-03-04", "tarde": None}
+
+
+class _ConexionLock(ConexionFalsa):
+    """Responde a pg_try_advisory_lock con `concedido`."""
+
+    def __init__(self, concedido: bool):
+        super().__init__()
+        self.concedido = concedido
+
+    def cursor(self, **kwargs):
+        cursor = super().cursor(**kwargs)
+        cursor.fetchone = lambda: (self.concedido,)
+        return cursor
+
+
+@pytest.mark.parametrize("concedido", [True, False])
+def test_solo_es_lider_quien_obtiene_el_advisory_lock(monkeypatch, concedido):
+    conn = _ConexionLock(concedido)
+    monkeypatch.setattr(modulo.psycopg2, "connect", lambda **kwargs: conn)
+    planificador = Planificador()
+
+    assert planificador._es_lider() is concedido
+    assert conn.sql == ["SELECT pg_try_advisory_lock(%s)"]
+
+    if concedido:
+        # Ya líder: solo se comprueba que la sesión del lock sigue viva
+        assert planificador._es_lider()
+        assert conn.sql[-1] == "SELECT 1"
+
+
+def test_soltar_cierra_la_sesion_del_lock(monkeypatch):
+    conn = _ConexionLock(True)
+    monkeypatch.setattr(modulo.psycopg2, "connect", lambda **kwargs: conn)
+    planificador = Planificador()
+    planificador._es_lider()
+
+    planificador._soltar()
+
+    assert conn.closed and not planificador.lider
+
+
+def test_rangos_estandar_sin_repetidos():
+    hoy = date(2026, 3, 4)
+
+    assert rangos_estandar(["ayer", "semana_actual", "ayer", "ultimos_7_dias"], hoy) == [
+        (date(2026, 3, 3), date(2026, 3, 3)),
+        (date(2026, 3, 2), date(2026, 3, 4)),
+        (date(2026, 2, 25), date(2026, 3, 3)),
+    ]
+
+
+class _ConexionSchemas(ConexionFalsa):
+    def cursor(self, **kwargs):
+        cursor = super().cursor(**kwargs)
+        # Incluye uno cuyo nombre no es un identificador válido
+        cursor.fetchall = lambda: [("sede_norte",), ("sede_sur",), ("sede_x;drop",)]
+        return cursor
+
+
+class _PoolFalso:
+    def devolver(self, conn):
+        pass
+
+
+def test_schemas_conocidos_incluye_los_provisionados_en_la_base(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_SCHEMAS", {})
+    monkeypatch.setattr(settings, "TENANT_SCHEMA_PREFIX", "sede_")
+    monkeypatch.setattr(database, "_prestar", lambda obtener_pool: (_PoolFalso(), _ConexionSchemas()))
+
+    assert database.schemas_conocidos() == [settings.POSTGRES_SCHEMA, "sede_norte", "sede_sur"]
@@ -0,0 +1,71 @@
+import logging
+
+import pytest
+
+from app.config.settings import settings
+from app.infrastructure import query_instrumentation
+from app.infrastructure.query_instrumentation import ejecutar_instrumentado, estadisticas_consultas
+from falsos import ConexionFalsa
+
+
+@pytest.fixture(autouse=True)
+def estadisticas_vacias(monkeypatch):
+    monkeypatch.setattr(query_instrumentation, "_estadisticas", {})
+
+
+def test_acumula_llamadas_y_filas_por_nombre(monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 60000)
+    conn = ConexionFalsa()
+
+    for _ in range(2):
+        ejecutar_instrumentado(conn, conn.cursor(), "residuos.listar", "SELECT 1")
+
+    stats = estadisticas_consultas()["residuos.listar"]
+    assert stats["llamadas"] == 2
+    assert stats["lentas"] == 0
+
+
+def test_consulta_lenta_se_registra_con_sus_parametros(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)
+    conn = ConexionFalsa()
+
+    with caplog.at_level(logging.WARNING, logger=query_instrumentation.__name__):
+        ejecutar_instrumentado(conn, conn.cursor(), "residuos.listar", "SELECT %s", (7,))
+
+    assert "Consulta lenta [residuos.listar]" in caplog.text
+    assert "params=(7,)" in caplog.text
+    assert estadisticas_consultas()["residuos.listar"]["lentas"] == 1
+
+
+def test_consulta_fallida_se_propaga_sin_acumular():
+    conn = ConexionFalsa(fallar_si=lambda sql, params: True)
+
+    with pytest.raises(RuntimeError):
+        ejecutar_instrumentado(conn, conn.cursor(), "residuos.insertar", "INSERT INTO t VALUES (1)")
+
+    assert estadisticas_consultas() == {}
+
+
+def test_muestreo_explica_solo_lecturas_dentro_de_un_savepoint(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_EXPLAIN_SAMPLE_RATE", 1.0)
+    conn = ConexionFalsa()
+
+    ejecutar_instrumentado(conn, conn.cursor(), "residuos.insertar", "INSERT INTO t VALUES (1)")
+    ejecutar_instrumentado(conn, conn.cursor(), "residuos.listar", "SELECT 1")
+
+    assert conn.sql == [
+        "INSERT INTO t VALUES (1)",
+        "SELECT 1",
+        "SAVEPOINT explain_muestreo",
+        "EXPLAIN (ANALYZE, BUFFERS) SELECT 1",
+        "RELEASE SAVEPOINT explain_muestreo",
+    ]
+
+
+def test_explain_fallido_no_rompe_la_transaccion(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_EXPLAIN_SAMPLE_RATE", 1.0)
+    conn = ConexionFalsa(fallar_si=lambda sql, params: sql.startswith("EXPLAIN"))
+
+    ejecutar_instrumentado(conn, conn.cursor(), "residuos.listar", "SELECT 1")
+
+    assert conn.sql[-1] == "ROLLBACK TO SAVEPOINT explain_muestreo"
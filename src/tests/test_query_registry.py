@@ -0,0 +1,62 @@
+from collections import defaultdict
+
+import pytest
+
+from app.config.settings import settings
+from app.infrastructure import metrics, query_registry
+from app.infrastructure.query_registry import sentencia
+from app.infrastructure.tipos_residuos_repository import TiposResiduosRepository
+from falsos import ConexionFalsa, SesionFalsa
+
+
+@pytest.fixture(autouse=True)
+def contadores_vacios(monkeypatch):
+    monkeypatch.setattr(metrics, "_contadores", defaultdict(int))
+
+
+def test_sentencia_con_parametros_posicionales():
+    s = sentencia("residuos.listar_por_rango", "sede_a")
+
+    assert "sede_a.registros_residuos" in s.sql
+    assert s.prepare_sql.startswith(f"PREPARE {s.preparada} AS")
+    assert "BETWEEN $1 AND $2" in s.prepare_sql
+    assert s.execute_sql == f"EXECUTE {s.preparada} (%s, %s)"
+    assert s.es_lectura
+    assert len(s.preparada) <= 63
+
+
+def test_sentencia_se_construye_una_vez_por_schema():
+    assert sentencia("tipos.listar", "sede_a") is sentencia("tipos.listar", "sede_a")
+    # Mismo nombre en otro schema: otro prepared statement
+    assert sentencia("tipos.listar", "sede_a").preparada != sentencia("tipos.listar", "sede_b").preparada
+
+
+def test_escrituras_y_ctes():
+    assert not sentencia("residuos.crear", "public").es_lectura
+    assert sentencia("residuos.estadisticas_multi_rango", "public").es_lectura
+
+
+def test_prepare_una_vez_por_conexion(monkeypatch):
+    monkeypatch.setattr(settings, "PREPARED_STATEMENTS_ENABLED", True)
+    conn, otra = ConexionFalsa(), ConexionFalsa()
+    s = sentencia("tipos.obtener_por_id", "public")
+
+    for _ in range(3):
+        TiposResiduosRepository(SesionFalsa(conn)).obtener_por_id(1)
+    TiposResiduosRepository(SesionFalsa(otra)).obtener_por_id(1)
+
+    prepare, execute = " ".join(s.prepare_sql.split()), s.execute_sql
+    assert conn.sql == [prepare, execute, execute, execute]
+    assert otra.sql == [prepare, execute]
+    assert metrics.contadores() == {"prepared.fallos": 2, "prepared.aciertos": 2}
+    assert metrics.ratio("prepared.aciertos", "prepared.fallos") == 0.5
+
+
+def test_sin_sentencias_preparadas_se_ejecuta_el_texto(monkeypatch):
+    monkeypatch.setattr(settings, "PREPARED_STATEMENTS_ENABLED", False)
+    conn = ConexionFalsa()
+
+    TiposResiduosRepository(SesionFalsa(conn)).obtener_por_id(1)
+
+    assert conn.sentencias == [(" ".join(sentencia("tipos.obtener_por_id", "public").sql.split()), (1,))]
+    assert metrics.contadores() == {}
@@ -0,0 +1,125 @@
+import time
+
+import psycopg2
+import pytest
+from starlette.requests import Request
+from starlette.responses import Response
+
+import database
+from app.config.settings import settings
+from database import RW_COOKIE, RW_HEADER, SesionBD
+from falsos import ConexionFalsa
+
+REPLICAS = ["host=replica1", "host=replica2"]
+
+
+class PoolFalso:
+    def __init__(self, nombre: str, disponible: bool = True):
+        self.nombre = nombre
+        self.disponible = disponible
+        self.devueltas = []
+
+    def obtener(self):
+        if not self.disponible:
+            raise psycopg2.OperationalError(f"{self.nombre} no responde")
+        conn = ConexionFalsa()
+        conn.origen = self.nombre
+        return conn
+
+    def devolver(self, conn):
+        self.devueltas.append(conn)
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    pools = {"primario": PoolFalso("primario"), **{dsn: PoolFalso(dsn) for dsn in REPLICAS}}
+    monkeypatch.setattr(settings, "POSTGRES_READ_REPLICAS", REPLICAS)
+    monkeypatch.setattr(database, "_obtener_pool", lambda schema: pools["primario"])
+    monkeypatch.setattr(database, "_obtener_pool_replica", lambda schema, dsn: pools[dsn])
+    monkeypatch.setattr(database, "_replica_al_dia", lambda dsn, conn: True)
+    return pools
+
+
+def _sesion(cookies: dict | None = None, response: Response | None = None) -> SesionBD:
+    cabecera = "; ".join(f"{k}={v}" for k, v in (cookies or {}).items())
+    request = Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/waste-api/registros",
+        "headers": [(b"cookie", cabecera.encode())] if cabecera else [],
+    })
+    return SesionBD("public", request, response or Response())
+
+
+def test_lecturas_por_turno_y_primario_solo_si_hace_falta(pools):
+    origenes = set()
+    for _ in range(2):
+        sesion = _sesion()
+        origenes.add(sesion.lectura().origen)
+        # Una sesión que solo lee no toca el primario
+        assert sesion._primaria is None
+        sesion.cerrar()
+
+    assert origenes == set(REPLICAS)
+
+
+def test_replica_retrasada_o_caida_se_sustituye_por_el_primario(monkeypatch, pools):
+    pools[REPLICAS[0]].disponible = False
+    monkeypatch.setattr(database, "_replica_al_dia", lambda dsn, conn: False)
+
+    sesion = _sesion()
+
+    assert sesion.lectura().origen == "primario"
+    # La réplica retrasada devuelve su conexión al pool
+    assert len(pools[REPLICAS[1]].devueltas) == 1
+
+
+def test_escritura_activa_read_your_writes(pools):
+    response = Response()
+    sesion = _sesion(response=response)
+
+    sesion.marcar_escritura()
+
+    assert sesion.lectura().origen == "primario"
+    hasta = float(response.headers[RW_HEADER])
+    assert hasta > time.time()
+    assert f"{RW_COOKIE}={hasta:.3f}" in response.headers["set-cookie"]
+
+
+def test_cookie_vigente_lee_del_primario_y_caducada_de_la_replica(pools):
+    assert _sesion({RW_COOKIE: f"{time.time() + 60:.3f}"}).lectura().origen == "primario"
+    assert _sesion({RW_COOKIE: f"{time.time() - 60:.3f}"}).lectura().origen in REPLICAS
+    assert _sesion({RW_COOKIE: "basura"}).lectura().origen in REPLICAS
+
+
+class _ConexionConRetraso(ConexionFalsa):
+    def __init__(self, lag: float):
+        super().__init__()
+        self.lag = lag
+        self.consultas = 0
+
+    def cursor(self, **kwargs):
+        conn = self
+
+        class Cursor:
+            def execute(self, sql, params=None):
+                conn.consultas += 1
+
+            def fetchone(self):
+                return (conn.lag,)
+
+        return Cursor()
+
+
+def test_retraso_de_replica_con_cache(monkeypatch):
+    monkeypatch.setattr(database, "_lag_replicas", {})
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_S", 5.0)
+    monkeypatch.setattr(settings, "REPLICA_LAG_CHECK_S", 60.0)
+    conn = _ConexionConRetraso(lag=12.0)
+
+    assert not database._replica_al_dia("host=replica1", conn)
+    conn.lag = 0.0
+    # Dentro de REPLICA_LAG_CHECK_S se reutiliza el resultado anterior
+    assert not database._replica_al_dia("host=replica1", conn)
+    assert conn.consultas == 1
+    assert database._replica_al_dia("host=replica2", conn)
@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.infrastructure.sampling_profiler import MuestreadorPerfil, en_perfil, propagar_perfil
+
+
+def _ocupado(segundos: float = 0.05) -> None:
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        pass
+
+
+def _funciones(perfil: dict) -> set:
+    frames = perfil["shared"]["frames"]
+    return {frames[i]["name"] for p in perfil["profiles"] for pila in p["samples"] for i in pila}
+
+
+def _perfilar(fn) -> dict:
+    muestreador = MuestreadorPerfil(intervalo_ms=1)
+    token = muestreador.iniciar()
+    try:
+        fn()
+    finally:
+        muestreador.detener(token)
+    return muestreador.speedscope("prueba")
+
+
+def test_solo_se_muestrea_el_hilo_de_la_peticion():
+    soltar = threading.Event()
+
+    def otra_peticion():
+        while not soltar.is_set():
+            _ocupado(0.001)
+
+    ajeno = threading.Thread(target=otra_peticion)
+    ajeno.start()
+    try:
+        perfil = _perfilar(en_perfil(_ocupado))
+    finally:
+        soltar.set()
+        ajeno.join(5)
+
+    funciones = _funciones(perfil)
+    assert "_ocupado" in funciones
+    assert "otra_peticion" not in funciones
+    # La pila empieza en el endpoint, no en el runner que lo llama
+    assert "_perfilar" not in funciones
+    assert len(perfil["profiles"]) == 1
+
+
+def test_sin_perfil_en_curso_no_se_registra_nada():
+    muestreador = MuestreadorPerfil(intervalo_ms=1)
+
+    en_perfil(_ocupado)(0.001)
+
+    assert muestreador._raices == {}
+
+
+def test_propagar_perfil_muestrea_los_hilos_hijos():
+    def endpoint():
+        tarea = propagar_perfil(_ocupado)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="hijo") as pool:
+            pool.submit(tarea).result()
+
+    perfil = _perfilar(en_perfil(endpoint))
+
+    assert any(p["name"].startswith("hijo") for p in perfil["profiles"])
+    assert "_ocupado" in _funciones(perfil)
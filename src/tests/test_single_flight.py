@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from app.domain.waste_service import WasteService
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.cancelacion import ClienteDesconectadoError
+from app.infrastructure.single_flight import SingleFlight
+from falsos import SesionFalsa
+
+
+def _en_hilo(fn, resultados: list) -> threading.Thread:
+    def ejecutar():
+        try:
+            resultados.append(fn())
+        except Exception as e:
+            resultados.append(e)
+
+    hilo = threading.Thread(target=ejecutar)
+    hilo.start()
+    return hilo
+
+
+def _lider_lento(vuelos, clave, fn, empezado: threading.Event, soltar: threading.Event):
+    def calcular():
+        empezado.set()
+        soltar.wait(5)
+        return fn()
+
+    return lambda: vuelos.hacer(clave, calcular)
+
+
+def test_seguidores_comparten_el_resultado_del_lider():
+    vuelos = SingleFlight("prueba_resultado")
+    empezado, soltar = threading.Event(), threading.Event()
+    llamadas = []
+    resultados = []
+
+    lider = _en_hilo(_lider_lento(vuelos, "k", lambda: llamadas.append(1) or 42, empezado, soltar), resultados)
+    empezado.wait(5)
+    seguidor = _en_hilo(lambda: vuelos.hacer("k", lambda: llamadas.append(2) or 0), resultados)
+    time.sleep(0.05)
+    soltar.set()
+    lider.join(5)
+    seguidor.join(5)
+
+    assert resultados == [42, 42]
+    assert llamadas == [1]
+
+
+def test_desconexion_del_lider_hace_reintentar_a_los_seguidores():
+    vuelos = SingleFlight("prueba_reintento", reintentar_en=(ClienteDesconectadoError,))
+    empezado, soltar = threading.Event(), threading.Event()
+
+    def desconectado():
+        raise ClienteDesconectadoError("cliente desconectado")
+
+    resultados_lider, resultados_seguidor = [], []
+    lider = _en_hilo(_lider_lento(vuelos, "k", desconectado, empezado, soltar), resultados_lider)
+    empezado.wait(5)
+    seguidor = _en_hilo(lambda: vuelos.hacer("k", lambda: "propio"), resultados_seguidor)
+    time.sleep(0.05)
+    soltar.set()
+    lider.join(5)
+    seguidor.join(5)
+
+    assert isinstance(resultados_lider[0], ClienteDesconectadoError)
+    # El seguidor no hereda la desconexión: repite la computación como líder
+    assert resultados_seguidor == ["propio"]
+
+
+def test_cada_seguidor_recibe_su_propia_excepcion():
+    vuelos = SingleFlight("prueba_excepcion")
+    empezado, soltar = threading.Event(), threading.Event()
+
+    def saturado():
+        raise CapacidadAgotadaError("ranuras del modelo", retry_after=7)
+
+    resultados = []
+    lider = _en_hilo(_lider_lento(vuelos, "k", saturado, empezado, soltar), resultados)
+    empezado.wait(5)
+    seguidores = [_en_hilo(lambda: vuelos.hacer("k", lambda: None), resultados) for _ in range(2)]
+    time.sleep(0.05)
+    soltar.set()
+    for hilo in (lider, *seguidores):
+        hilo.join(5)
+
+    assert len(resultados) == 3
+    assert len({id(e) for e in resultados}) == 3
+    for error in resultados:
+        assert isinstance(error, CapacidadAgotadaError)
+        assert str(error) == "Capacidad agotada: ranuras del modelo"
+        assert error.retry_after == 7
+
+
+def test_espera_del_seguidor_acotada():
+    vuelos = SingleFlight("prueba_espera", espera_max_s=0.05)
+    empezado, soltar = threading.Event(), threading.Event()
+    resultados = []
+
+    lider = _en_hilo(_lider_lento(vuelos, "k", lambda: 1, empezado, soltar), resultados)
+    empezado.wait(5)
+    try:
+        with pytest.raises(CapacidadAgotadaError):
+            vuelos.hacer("k", lambda: 2)
+    finally:
+        soltar.set()
+        lider.join(5)
+
+    assert resultados == [1]
+
+
+class _RepoLento:
+    schema = "public"
+
+    def __init__(self, lee_sus_escrituras: bool):
+        self.sesion = SesionFalsa()
+        self.sesion.lee_sus_escrituras = lee_sus_escrituras
+        self.empezado, self.soltar = threading.Event(), threading.Event()
+        self.llamadas = 0
+
+    def estadisticas_multi_rango(self, rangos):
+        self.llamadas += 1
+        self.empezado.set()
+        self.soltar.wait(5)
+        return []
+
+
+def _batch_concurrente(repo) -> list:
+    rangos = [(date(2026, 3, 1), date(2026, 3, 31))]
+    resultados = []
+    lider = _en_hilo(lambda: WasteService(None, repo, None, None).obtener_estadisticas_batch(rangos), resultados)
+    repo.empezado.wait(5)
+    seguidor = _en_hilo(lambda: WasteService(None, repo, None, None).obtener_estadisticas_batch(rangos), resultados)
+    time.sleep(0.05)
+    repo.soltar.set()
+    lider.join(5)
+    seguidor.join(5)
+    return resultados
+
+
+def test_estadisticas_identicas_comparten_una_consulta():
+    repo = _RepoLento(lee_sus_escrituras=False)
+
+    resultados = _batch_concurrente(repo)
+
+    assert repo.llamadas == 1
+    assert len(resultados) == 2 and resultados[0] is resultados[1]
+
+
+def test_read_your_writes_no_comparte_el_resultado_del_lider():
+    repo = _RepoLento(lee_sus_escrituras=True)
+
+    _batch_concurrente(repo)
+
+    assert repo.llamadas == 2
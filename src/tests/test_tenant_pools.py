@@ -0,0 +1,64 @@
+import psycopg2.pool
+import pytest
+
+import database
+from database import PoolRetiradoError, TenantPool, _prestar
+from falsos import PoolConexionesFalso
+
+
+@pytest.fixture(autouse=True)
+def pool_falso(monkeypatch):
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", PoolConexionesFalso)
+
+
+def test_pool_retirado_se_cierra_al_devolver_la_ultima_conexion():
+    pool = TenantPool("sede_a")
+    conn = pool.obtener()
+
+    pool.retirar()
+    assert not pool._pool.cerrado
+
+    pool.devolver(conn)
+    assert pool._pool.cerrado
+
+
+def test_pool_retirado_no_presta_conexiones():
+    pool = TenantPool("sede_a")
+    pool.retirar()
+
+    with pytest.raises(PoolRetiradoError):
+        pool.obtener()
+    assert pool._en_uso == 0
+
+
+def test_prestar_resuelve_de_nuevo_si_el_pool_se_retira_entretanto():
+    retirado, vigente = TenantPool("sede_a"), TenantPool("sede_a")
+    resueltos = iter([retirado, vigente])
+
+    def obtener_pool():
+        pool = next(resueltos)
+        if pool is retirado:
+            # Desalojo LRU entre resolver el pool y pedir la conexión
+            pool.retirar()
+        return pool
+
+    pool, conn = _prestar(obtener_pool)
+
+    assert pool is vigente
+    assert retirado._pool.cerrado
+    pool.devolver(conn)
+
+
+def test_capacidad_agotada_libera_la_reserva(monkeypatch):
+    monkeypatch.setattr(database.settings, "DB_POOL_MAX", 1)
+    monkeypatch.setattr(database.settings, "DB_POOL_TIMEOUT_S", 0.01)
+    pool = TenantPool("sede_a")
+    conn = pool.obtener()
+
+    with pytest.raises(database.CapacidadAgotadaError):
+        pool.obtener()
+    pool.retirar()
+    pool.devolver(conn)
+
+    assert pool._en_uso == 0
+    assert pool._pool.cerrado
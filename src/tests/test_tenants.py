@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import database
+from app.config.settings import settings
+from database import get_schema, resolver_schema
+
+
+@pytest.fixture(autouse=True)
+def sin_sedes(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_SCHEMAS", {})
+    monkeypatch.setattr(settings, "TENANT_SCHEMA_PREFIX", None)
+
+
+def _peticion(path_params: dict | None = None, headers: dict | None = None) -> Request:
+    return Request({
+        "type": "http",
+        "path_params": path_params or {},
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+    })
+
+
+def test_sin_tenant_se_usa_el_schema_por_defecto():
+    assert resolver_schema(None) == settings.POSTGRES_SCHEMA
+
+
+def test_mapa_explicito_de_sedes(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_SCHEMAS", {"norte": "sede_norte"})
+
+    assert resolver_schema(" Norte ") == "sede_norte"
+    with pytest.raises(HTTPException) as error:
+        resolver_schema("sur")
+    assert error.value.status_code == 404
+
+
+def test_prefijo_de_schema(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_SCHEMA_PREFIX", "sede_")
+
+    assert resolver_schema("las-palmas") == "sede_las_palmas"
+
+
+@pytest.mark.parametrize("tenant", ["x; DROP SCHEMA public", "a" * 80])
+def test_schema_invalido_responde_404(monkeypatch, tenant):
+    monkeypatch.setattr(settings, "TENANT_SCHEMA_PREFIX", "sede_")
+
+    with pytest.raises(HTTPException) as error:
+        resolver_schema(tenant)
+    assert error.value.status_code == 404
+
+
+def test_sin_mapa_ni_prefijo_no_se_aceptan_sedes():
+    with pytest.raises(HTTPException) as error:
+        resolver_schema("norte")
+    assert error.value.status_code == 404
+
+
+def test_la_sede_de_la_ruta_prevalece_sobre_la_cabecera(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_SCHEMA_PREFIX", "sede_")
+    cabecera = {settings.TENANT_HEADER: "sur"}
+
+    assert get_schema(_peticion({"tenant": "norte"}, cabecera)) == "sede_norte"
+    assert get_schema(_peticion(headers=cabecera)) == "sede_sur"
+
+
+def test_schema_no_provisionado_responde_404(monkeypatch):
+    monkeypatch.setattr(database, "_schema_provisionado", lambda schema: False)
+
+    with pytest.raises(HTTPException) as error:
+        database._obtener_pool("sede_inexistente")
+    assert error.value.status_code == 404
+    assert "sede_inexistente" not in database._pools
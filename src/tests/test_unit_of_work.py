@@ -0,0 +1,158 @@
+from datetime import date
+
+import pytest
+
+from app.config.settings import settings
+from app.domain.waste_service import WasteService
+from app.infrastructure import cambios
+from app.infrastructure.cambios import Cambio
+from app.infrastructure.unit_of_work import unidad_de_trabajo
+from falsos import SesionFalsa
+
+DIA = date(2026, 3, 2)
+
+
+def test_unidad_anidada_se_une_a_la_exterior_y_confirma_una_vez():
+    sesion = SesionFalsa()
+
+    with unidad_de_trabajo(sesion) as exterior:
+        with unidad_de_trabajo(sesion) as interior:
+            assert interior is exterior
+            interior.registrar_escritura()
+        # La unidad anidada no confirma por su cuenta
+        assert "COMMIT" not in sesion.primaria.sql
+
+    assert sesion.primaria.sql == ["COMMIT"]
+    assert sesion.uow is None
+    assert sesion.escrituras_marcadas == 1
+
+
+def test_excepcion_deshace_toda_la_unidad():
+    sesion = SesionFalsa()
+
+    with pytest.raises(ValueError):
+        with unidad_de_trabajo(sesion) as uow:
+            uow.registrar_escritura()
+            raise ValueError("fallo")
+
+    assert sesion.primaria.sql == ["ROLLBACK"]
+    assert sesion.uow is None
+    assert sesion.escrituras_marcadas == 0
+
+
+def test_sin_escrituras_no_activa_read_your_writes():
+    sesion = SesionFalsa()
+
+    with unidad_de_trabajo(sesion):
+        pass
+
+    assert sesion.escrituras_marcadas == 0
+
+
+def test_savepoint_fallido_deshace_solo_su_tramo():
+    sesion = SesionFalsa()
+
+    with unidad_de_trabajo(sesion) as uow:
+        with uow.savepoint():
+            pass
+        with pytest.raises(RuntimeError):
+            with uow.savepoint():
+                raise RuntimeError("tramo rechazado")
+
+    assert sesion.primaria.sql == [
+        "SAVEPOINT uow_sp_1",
+        "RELEASE SAVEPOINT uow_sp_1",
+        "SAVEPOINT uow_sp_2",
+        "ROLLBACK TO SAVEPOINT uow_sp_2",
+        "COMMIT",
+    ]
+
+
+def test_commit_asincrono_usa_set_local():
+    sesion = SesionFalsa()
+
+    with unidad_de_trabajo(sesion, commit_sincrono=False):
+        pass
+
+    assert sesion.primaria.sql == ["SET LOCAL synchronous_commit = off", "COMMIT"]
+
+
+def test_commit_asincrono_anidado_se_aplica_a_la_unidad_exterior():
+    sesion = SesionFalsa()
+
+    with unidad_de_trabajo(sesion):
+        with unidad_de_trabajo(sesion, commit_sincrono=False):
+            pass
+
+    assert sesion.primaria.sql == ["SET LOCAL synchronous_commit = off", "COMMIT"]
+
+
+def test_cambios_se_aplican_localmente_solo_al_confirmar(monkeypatch):
+    recibidos = []
+    monkeypatch.setattr(cambios, "_suscriptores_al_confirmar", [recibidos.append])
+    cambio = Cambio("public", "residuos", DIA, DIA)
+
+    sesion = SesionFalsa()
+    with pytest.raises(ValueError):
+        with unidad_de_trabajo(sesion):
+            sesion.cambios_pendientes.append(cambio)
+            raise ValueError("fallo")
+    assert recibidos == [] and sesion.cambios_pendientes == []
+
+    with unidad_de_trabajo(sesion):
+        sesion.cambios_pendientes.append(cambio)
+        assert recibidos == []
+    assert recibidos == [cambio]
+    assert sesion.cambios_pendientes == []
+
+
+class _RepoResiduos:
+    schema = "public"
+
+    def __init__(self):
+        self.sesion = SesionFalsa()
+
+
+def _servicio_con_tramo_fallido(monkeypatch):
+    monkeypatch.setattr(settings, "INGESTA_TRAMO_FILAS", 2)
+    servicio = WasteService(None, _RepoResiduos(), None, None)
+    anomalias = []
+
+    def persistir_tramo(tramo, modo):
+        if any(r["cantidad_kg"] < 0 for r in tramo):
+            raise RuntimeError("tramo rechazado")
+        return {"insertados": len(tramo)}
+
+    monkeypatch.setattr(servicio, "_persistir_tramo", persistir_tramo)
+    monkeypatch.setattr(servicio, "actualizar_anomalias", anomalias.append)
+    registros = [{"dia": DIA, "cantidad_kg": kg, "tipo_residuo_id": 1} for kg in (1, 2, -1, 3, 4)]
+    return servicio, registros, anomalias
+
+
+def test_aislar_errores_confirma_los_tramos_correctos(monkeypatch):
+    servicio, registros, anomalias = _servicio_con_tramo_fallido(monkeypatch)
+
+    respuesta = servicio._persistir_lote(registros, "insertar", aislar_errores=True)
+
+    assert respuesta["registros_creados"] == 3
+    assert respuesta["registros_rechazados"] == 2
+    assert respuesta["tramos_fallidos"][0]["fila_inicio"] == 3
+    # Las anomalías solo ven las filas persistidas
+    assert anomalias == [registros[:2] + registros[4:]]
+    sql = servicio.residuos_repo.sesion.primaria.sql
+    assert "ROLLBACK TO SAVEPOINT uow_sp_2" in sql and sql[-1] == "COMMIT"
+
+
+def test_sin_aislar_errores_se_deshace_toda_la_carga(monkeypatch):
+    servicio, registros, anomalias = _servicio_con_tramo_fallido(monkeypatch)
+
+    with pytest.raises(RuntimeError):
+        servicio._persistir_lote(registros, "insertar")
+
+    assert anomalias == []
+    assert servicio.residuos_repo.sesion.primaria.sql[-1] == "ROLLBACK"
+
+
+def test_commit_asincrono_solo_en_upsert():
+    with pytest.raises(ValueError):
+        WasteService._validar_modo_ingesta("insertar", None, commit_asincrono=True)
@@ -0,0 +1,107 @@
+from datetime import date
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from app.config.settings import settings
+from app.domain.waste_service import WasteService
+from app.infrastructure import ai_client
+from app.infrastructure.ai_client import UsoLLM, completar
+from app.infrastructure.analisis_repository import AnalisisIARepository
+from falsos import ConexionFalsa, SesionFalsa
+
+DIA = date(2026, 3, 2)
+
+
+class _ClienteFalso:
+    """Falla `fallos` veces con un error transitorio y después responde."""
+
+    def __init__(self, fallos: int):
+        self.fallos = fallos
+        self.llamadas = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._crear))
+
+    def _crear(self, **kwargs):
+        self.llamadas += 1
+        if self.llamadas <= self.fallos:
+            raise APIConnectionError(request=httpx.Request("POST", "https://azure.invalid"))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="informe"))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30),
+        )
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_REINTENTOS", 2)
+    monkeypatch.setattr(settings, "LLM_REINTENTO_BASE_S", 0)
+
+    def instalar(fallos: int) -> _ClienteFalso:
+        falso = _ClienteFalso(fallos)
+        monkeypatch.setattr(ai_client, "get_ai_client", lambda: falso)
+        return falso
+
+    return instalar
+
+
+def test_errores_transitorios_se_reintentan_y_se_cuentan(cliente):
+    falso = cliente(fallos=2)
+
+    texto, uso = completar("prompt", temperature=0.3)
+
+    assert texto == "informe"
+    assert falso.llamadas == 3
+    assert (uso.tokens_prompt, uso.tokens_completion, uso.reintentos) == (120, 30, 2)
+    assert uso.llm_ms > 0
+
+
+def test_agotar_los_reintentos_propaga_el_error(cliente):
+    falso = cliente(fallos=3)
+
+    with pytest.raises(APIConnectionError):
+        completar("prompt", temperature=0.3)
+    assert falso.llamadas == 3
+
+
+def test_crear_guarda_la_contabilidad(monkeypatch):
+    monkeypatch.setattr(settings, "PREPARED_STATEMENTS_ENABLED", False)
+    conn = ConexionFalsa()
+    uso = UsoLLM(
+        tokens_prompt=10, tokens_completion=5, prompt_ms=1.23456, llm_ms=800.5, reintentos=1, registros_entrada=42
+    )
+
+    AnalisisIARepository(SesionFalsa(conn)).crear(DIA, DIA, "resumen", "texto", "gpt", uso=uso)
+
+    _, params = conn.sentencias[0]
+    assert params[5:] == (10, 5, 1.235, 800.5, 1, 42)
+
+
+class _RepoMetricas:
+    def metricas_llm(self, fecha_inicio, fecha_fin):
+        return [{
+            "dia": DIA,
+            "modelo": "gpt",
+            "analisis": 2,
+            "llm_ms_p50": 812.345,
+            "llm_ms_p95": 1500.0,
+            "prompt_ms_p50": None,
+            "tokens_prompt": 2000,
+            "tokens_completion": 1000,
+            "tokens_prompt_p50": 1000,
+            "tokens_prompt_p95": 1900,
+            "reintentos": None,
+            "registros_entrada_media": 41.25,
+        }]
+
+
+def test_metricas_llm_con_coste_estimado(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_COSTE_PROMPT_1K_USD", 0.5)
+    monkeypatch.setattr(settings, "LLM_COSTE_COMPLETION_1K_USD", 2.0)
+
+    [metricas] = WasteService(None, None, _RepoMetricas(), None).metricas_llm(DIA, DIA)
+
+    assert metricas.llm_ms_p50 == 812.3
+    assert metricas.prompt_ms_p50 == 0 and metricas.reintentos == 0
+    assert metricas.coste_estimado_usd == pytest.approx(3.0)
@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from app.application.waste_controller import get_waste_service
+from app.config.settings import settings
+from app.infrastructure import write_buffer
+from app.infrastructure.admission import CapacidadAgotadaError
+from app.infrastructure.write_buffer import BufferEscritura, _Pendiente
+from app.main import app
+from falsos import ConexionFalsa
+
+DIA = date(2026, 3, 2)
+
+
+def _buffer(conn, tras_volcado=None) -> BufferEscritura:
+    return BufferEscritura(
+        "public", lambda: conn, max_filas=50, espera_ms=1, tras_volcado=tras_volcado
+    )
+
+
+def _insercion_agrupada_falla(*args, **kwargs):
+    raise RuntimeError("lote rechazado")
+
+
+def test_volcado_asigna_a_cada_fila_el_id_reservado(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", lambda *a, **k: [])
+    conn = ConexionFalsa()
+    buffer = _buffer(conn)
+    lote = [_Pendiente((DIA, 1.5, 1, None)), _Pendiente((DIA, 2.0, 2, None))]
+
+    buffer._volcar(lote)
+
+    assert [p.id for p in lote] == [1, 2]
+    assert all(p.listo.is_set() and p.error is None for p in lote)
+    assert conn.sql[-1] == "COMMIT"
+
+
+def test_lote_rechazado_se_reintenta_fila_a_fila(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", _insercion_agrupada_falla)
+    # Solo la fila con source_line_id "dup" viola la clave natural
+    conn = ConexionFalsa(fallar_si=lambda sql, params: sql.startswith("INSERT") and params[-1] == "dup")
+    buffer = _buffer(conn)
+    lote = [
+        _Pendiente((DIA, 1.0, 1, "a")),
+        _Pendiente((DIA, 1.0, 1, "dup")),
+        _Pendiente((DIA, 1.0, 1, "b")),
+    ]
+
+    buffer._volcar(lote)
+
+    assert [p.id for p in lote] == [1, None, 3]
+    assert lote[0].error is None and lote[2].error is None
+    assert isinstance(lote[1].error, RuntimeError)
+    assert conn.sql.count("ROLLBACK TO SAVEPOINT fila") == 1
+    assert conn.sql[-1] == "COMMIT"
+
+
+def test_tras_volcado_recibe_solo_las_filas_insertadas(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", _insercion_agrupada_falla)
+    conn = ConexionFalsa(fallar_si=lambda sql, params: sql.startswith("INSERT") and params[-1] == "dup")
+    recibidos = []
+    buffer = _buffer(conn, tras_volcado=lambda schema, c, registros: recibidos.append(registros))
+
+    buffer._volcar([_Pendiente((DIA, 1.0, 7, "a")), _Pendiente((DIA, 1.0, 8, "dup"))])
+
+    assert recibidos == [[{"dia": DIA, "tipo_residuo_id": 7}]]
+    assert "RELEASE SAVEPOINT tras_volcado" in conn.sql
+
+
+def test_fallo_tras_volcado_no_deshace_el_lote(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", lambda *a, **k: [])
+    conn = ConexionFalsa()
+
+    def tras_volcado(schema, c, registros):
+        raise RuntimeError("anomalías")
+
+    buffer = _buffer(conn, tras_volcado=tras_volcado)
+    lote = [_Pendiente((DIA, 1.0, 1, None))]
+
+    buffer._volcar(lote)
+
+    # Solo se deshace lo de tras_volcado; el lote se confirma igual
+    assert lote[0].id == 1 and lote[0].error is None
+    assert "ROLLBACK TO SAVEPOINT tras_volcado" in conn.sql
+    assert conn.sql[-1] == "COMMIT"
+
+
+def test_enviar_devuelve_el_id_tras_el_commit(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", lambda *a, **k: [])
+    buffer = _buffer(ConexionFalsa())
+
+    assert buffer.enviar(DIA, 1.0, 1, None, timeout=5) == 1
+
+
+def test_timeout_retira_la_fila_que_no_se_ha_volcado():
+    # Buffer sin hilo de volcado: la fila se queda en la cola
+    buffer = BufferEscritura.__new__(BufferEscritura)
+    buffer._cola = []
+    buffer._cerrado = False
+    buffer._cond = threading.Condition()
+
+    with pytest.raises(CapacidadAgotadaError):
+        buffer.enviar(DIA, 1.0, 1, None, timeout=0.01)
+
+    assert buffer._cola == []
+
+
+def test_cerrar_vuelca_lo_pendiente_y_cierra_la_conexion(monkeypatch):
+    monkeypatch.setattr(write_buffer, "ejecutar_valores_instrumentado", lambda *a, **k: [])
+    conn = ConexionFalsa()
+    buffer = BufferEscritura("public", lambda: conn, max_filas=50, espera_ms=60000)
+    resultados = []
+    emisor = threading.Thread(target=lambda: resultados.append(buffer.enviar(DIA, 1.0, 1, None, timeout=5)))
+    emisor.start()
+
+    # La ventana de agrupación no retrasa el cierre
+    while not buffer._cola and emisor.is_alive():
+        emisor.join(0.01)
+    buffer.cerrar(espera_s=5)
+    emisor.join(5)
+
+    assert resultados == [1]
+    assert not buffer._hilo.is_alive()
+    assert conn.closed
+    with pytest.raises(CapacidadAgotadaError):
+        buffer.enviar(DIA, 1.0, 1, None, timeout=5)
+
+
+class _PoolFalso:
+    def __init__(self):
+        self.retirado = False
+
+    def retirar(self):
+        self.retirado = True
+
+
+def test_retirar_el_pool_del_tenant_cierra_su_buffer(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_POOLS_MAX", 1)
+    monkeypatch.setattr(database, "_pools", OrderedDict())
+    buffer = BufferEscritura("sede_a", ConexionFalsa, max_filas=50, espera_ms=1)
+    monkeypatch.setattr(database, "_buffers", {"sede_a": buffer})
+    pool_a = _PoolFalso()
+
+    database._registrar_pool(database._pools, "sede_a", pool_a)
+    database._registrar_pool(database._pools, "sede_b", _PoolFalso())
+    buffer._hilo.join(5)
+
+    assert pool_a.retirado
+    assert database._buffers == {}
+    assert not buffer._hilo.is_alive()
+
+
+class _ServicioSaturado:
+    def registrar_residuo(self, request):
+        raise CapacidadAgotadaError("buffer de escritura", retry_after=3)
+
+
+def test_registro_no_confirmado_a_tiempo_responde_503():
+    app.dependency_overrides[get_waste_service] = _ServicioSaturado
+    try:
+        respuesta = TestClient(app).post(
+            "/waste-api/registros", json={"dia": "2026-03-02", "cantidad_kg": 1.0, "tipo_residuo_id": 1}
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert respuesta.status_code == 503
+    assert respuesta.headers["Retry-After"] == "3"